@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+缓存预热加载基准：比较ORM逐对象复制与按列投影的流式加载
+"""
+
+import os
+import time
+import random
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from database import (
+    Base, UserDB, StoryDB, StoryChapterDB, ChapterCommentDB,
+    DiscussionDB, DiscussionCommentDB, StoryTreeNodeDB
+)
+from cache_loader import load_tables
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+TABLE_CLASS_MAP = {
+    "users": UserDB,
+    "stories": StoryDB,
+    "story_chapters": StoryChapterDB,
+    "chapter_comments": ChapterCommentDB,
+    "discussions": DiscussionDB,
+    "discussion_comments": DiscussionCommentDB,
+    "story_tree_nodes": StoryTreeNodeDB
+}
+
+
+def populate(session, rows_per_table: int):
+    """生成测试数据"""
+    now = datetime(2026, 1, 1)
+    user_count = max(1, rows_per_table // 10)
+    session.execute(insert(UserDB.__table__), [
+        {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "password_hash": "hash",
+         "role": "user", "registered_at": now, "active_count": 0, "points": 0, "credit": 100.0, "version": 1}
+        for i in range(1, user_count + 1)
+    ])
+    session.execute(insert(StoryDB.__table__), [
+        {"id": i, "title": f"故事{i}", "content": "内容" * 50, "author_id": random.randint(1, user_count),
+         "tags": "标签", "created_at": now, "updated_at": now, "version": 1}
+        for i in range(1, rows_per_table + 1)
+    ])
+    session.execute(insert(StoryChapterDB.__table__), [
+        {"id": i, "story_id": random.randint(1, rows_per_table), "content": "章节" * 100,
+         "author_id": random.randint(1, user_count), "author_name": "作者", "created_at": now + timedelta(seconds=i),
+         "version": 1}
+        for i in range(1, rows_per_table + 1)
+    ])
+    session.execute(insert(ChapterCommentDB.__table__), [
+        {"id": i, "chapter_id": random.randint(1, rows_per_table), "content": "评论",
+         "author_id": random.randint(1, user_count), "author_name": "作者", "created_at": now, "version": 1}
+        for i in range(1, rows_per_table + 1)
+    ])
+    session.execute(insert(DiscussionDB.__table__), [
+        {"id": i, "title": f"讨论{i}", "content": "内容" * 20, "author_id": random.randint(1, user_count),
+         "author_name": "作者", "created_at": now, "version": 1}
+        for i in range(1, rows_per_table + 1)
+    ])
+    session.execute(insert(DiscussionCommentDB.__table__), [
+        {"id": i, "discussion_id": random.randint(1, rows_per_table), "content": "回复",
+         "author_id": random.randint(1, user_count), "author_name": "作者", "created_at": now, "version": 1}
+        for i in range(1, rows_per_table + 1)
+    ])
+    session.execute(insert(StoryTreeNodeDB.__table__), [
+        {"id": i, "title": f"节点{i}", "option_title": f"选项{i}", "content": "节点内容" * 20,
+         "parent_id": random.randint(1, i - 1) if i > 1 else None,
+         "author_id": random.randint(1, user_count), "created_at": now, "version": 1}
+        for i in range(1, rows_per_table + 1)
+    ])
+    session.commit()
+
+
+def load_with_orm(session):
+    """原有方式：ORM查询整对象，再逐字段复制为字典"""
+    tables = {}
+    for table_name, model_class in TABLE_CLASS_MAP.items():
+        column_names = [column.name for column in model_class.__table__.columns]
+        tables[table_name] = {
+            obj.id: {name: getattr(obj, name) for name in column_names}
+            for obj in session.query(model_class).all()
+        }
+    return tables
+
+
+def measure(name, session_maker, loader, repeat: int):
+    best = None
+    total_rows = 0
+    for _ in range(repeat):
+        session = session_maker()
+        try:
+            start = time.perf_counter()
+            tables = loader(session)
+            elapsed = time.perf_counter() - start
+        finally:
+            session.close()
+        total_rows = sum(len(records) for records in tables.values())
+        best = elapsed if best is None else min(best, elapsed)
+    logger.info(f"{name}: {total_rows} 行, 最快 {best * 1000:.1f} ms, {total_rows / best:,.0f} 行/秒")
+    return total_rows / best
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="缓存预热加载基准")
+    parser.add_argument("--rows", type=int, default=20000, help="每张表的行数")
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式重复次数，取最快一次")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_maker = sessionmaker(bind=engine)
+
+        session = session_maker()
+        populate(session, args.rows)
+        session.close()
+
+        orm_rate = measure("ORM逐对象复制", session_maker, load_with_orm, args.repeat)
+        fast_rate = measure("列投影流式加载", session_maker,
+                            lambda session: load_tables(session, TABLE_CLASS_MAP), args.repeat)
+        logger.info(f"加速比: {fast_rate / orm_rate:.2f}x")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
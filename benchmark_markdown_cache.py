@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Markdown渲染基准：500章故事页面在冷缓存、渲染缓存命中和写入时预渲染三种情况下的延迟
+"""
+
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STORY_ID = 900001
+CHAPTER_TEMPLATE = """## 第{index}章
+
+这是第 **{index}** 章的正文，包含一些*强调*、`代码`和[链接](https://example.com/{index})。
+
+- 情节要点一
+- 情节要点二
+- 情节要点三
+
+> 引用的对白：第{index}章的结尾。
+"""
+
+
+def populate(local_cache, chapters: int, comments_per_chapter: int):
+    """直接写入本地缓存，不标记为待同步"""
+    now = datetime(2026, 1, 1)
+    with local_cache.lock:
+        local_cache.data["users"].setdefault(1, {
+            "id": 1, "username": "bench", "email": "bench@example.com", "password_hash": "hash",
+            "role": "user", "registered_at": now, "active_count": 0, "points": 0, "credit": 100.0, "version": 1
+        })
+        local_cache.data["stories"][STORY_ID] = {
+            "id": STORY_ID, "title": "基准故事", "content": CHAPTER_TEMPLATE.format(index=0),
+            "author_id": 1, "tags": "基准,测试", "created_at": now, "updated_at": now, "version": 1
+        }
+        comment_id = STORY_ID * 100
+        for index in range(1, chapters + 1):
+            chapter_id = STORY_ID * 10 + index
+            local_cache.data["story_chapters"][chapter_id] = {
+                "id": chapter_id, "story_id": STORY_ID, "content": CHAPTER_TEMPLATE.format(index=index),
+                "author_id": 1, "author_name": "bench", "created_at": now + timedelta(seconds=index), "version": 1
+            }
+            for offset in range(comments_per_chapter):
+                comment_id += 1
+                local_cache.data["chapter_comments"][comment_id] = {
+                    "id": comment_id, "chapter_id": chapter_id, "content": f"评论 *{index}-{offset}*",
+                    "author_id": 1, "author_name": "bench", "created_at": now, "version": 1
+                }
+
+
+def strip_rendered_html(local_cache):
+    """去掉行中预渲染的HTML，模拟尚未补渲染的旧数据"""
+    with local_cache.lock:
+        for table_name in ("stories", "story_chapters", "chapter_comments"):
+            for item in local_cache.data[table_name].values():
+                item.pop("content_html", None)
+                item.pop("content_html_version", None)
+
+
+def measure(client, name: str, repeat: int, before_each=None) -> float:
+    timings = []
+    for _ in range(repeat):
+        if before_each:
+            before_each()
+        start = time.perf_counter()
+        response = client.get(f"/stories/{STORY_ID}")
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    timings.sort()
+    median = timings[len(timings) // 2]
+    logger.info(f"{name}: 中位数 {median * 1000:.1f} ms, 最快 {timings[0] * 1000:.1f} ms")
+    return median
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Markdown渲染缓存基准")
+    parser.add_argument("--chapters", type=int, default=500, help="章节数")
+    parser.add_argument("--comments", type=int, default=2, help="每章评论数")
+    parser.add_argument("--repeat", type=int, default=10, help="每种情况的请求次数")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+    import main as app_main
+    from local_cache import local_cache
+    from markdown_renderer import markdown_renderer
+
+    populate(local_cache, args.chapters, args.comments)
+    client = TestClient(app_main.app)
+
+    def cold_start():
+        strip_rendered_html(local_cache)
+        markdown_renderer.clear()
+
+    # 冷缓存：行中没有HTML，渲染缓存为空，每次读取都调用Markdown渲染
+    cold = measure(client, "冷缓存", args.repeat, before_each=cold_start)
+    logger.info(f"缓存统计: {markdown_renderer.stats()}")
+
+    # 渲染缓存命中：行中没有HTML，补渲染时命中按内容哈希的缓存
+    markdown_renderer.reset_stats()
+    warm = measure(client, "渲染缓存命中", args.repeat, before_each=lambda: strip_rendered_html(local_cache))
+    logger.info(f"缓存统计: {markdown_renderer.stats()}")
+
+    # 写入时预渲染：行中已有HTML，读取不再经过渲染服务
+    markdown_renderer.reset_stats()
+    stored = measure(client, "预渲染HTML", args.repeat)
+    logger.info(f"缓存统计: {markdown_renderer.stats()}")
+    logger.info(f"加速比: 渲染缓存 {cold / warm:.2f}x, 预渲染 {cold / stored:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+模板基准：开发模式和生产模式下的单次渲染开销，以及无字节码缓存和有字节码缓存时的冷启动编译时间
+"""
+
+import time
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+COMMENT = {"author_name": "bench", "content_html": "<p>评论</p>", "created_at": datetime(2026, 1, 1)}
+
+
+def measure_render(env, name: str, context: dict, repeat: int) -> float:
+    """每次都经过get_template，与TemplateResponse的调用方式一致"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        env.get_template(name).render(context)
+    return (time.perf_counter() - start) / repeat
+
+
+def measure_cold_start(create_env, precompile) -> float:
+    start = time.perf_counter()
+    precompile(create_env())
+    return time.perf_counter() - start
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="模板渲染和编译基准")
+    parser.add_argument("--repeat", type=int, default=20000, help="渲染次数")
+    args = parser.parse_args()
+
+    logging.getLogger("templates_config").setLevel(logging.WARNING)
+    from templates_config import create_template_environment, precompile_templates
+
+    context = {"comment": COMMENT}
+    development = create_template_environment(production=False)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        production = create_template_environment(production=True, bytecode_cache_dir=cache_dir)
+        dev_render = measure_render(development, "comment_item.html", context, args.repeat)
+        prod_render = measure_render(production, "comment_item.html", context, args.repeat)
+        logger.info(f"单次渲染: 开发模式 {dev_render * 1e6:.1f} us, 生产模式 {prod_render * 1e6:.1f} us")
+
+        # 冷启动：新的工作进程第一次加载全部模板
+        from_source = measure_cold_start(lambda: create_template_environment(production=False), precompile_templates)
+        precompile_templates(production)
+        from_bytecode = measure_cold_start(
+            lambda: create_template_environment(production=True, bytecode_cache_dir=cache_dir),
+            precompile_templates
+        )
+        logger.info(f"冷启动编译: 从源码 {from_source * 1000:.1f} ms, 从字节码缓存 {from_bytecode * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+故事树缓存基准：混合读写负载下，按祖先精确失效与每次写入清空全部树两种策略的命中率和平均读取延迟
+"""
+
+import time
+import random
+import logging
+import argparse
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def build_forest(cache, table, trees: int, nodes_per_tree: int, branching: int):
+    """生成多棵故事树，返回所有起始节点ID和全部节点ID"""
+    from markdown_renderer import render_content_html
+
+    roots, all_ids = [], []
+    node_id = 1
+    for _ in range(trees):
+        root_id = node_id
+        for position in range(nodes_per_tree):
+            parent_id = None if position == 0 else root_id + (position - 1) // branching
+            cache.add_item(table, node_id, render_content_html({
+                "id": node_id, "parent_id": parent_id, "title": f"节点{node_id}", "option_title": "选项",
+                "content": f"第{node_id}段内容", "author_id": 1, "created_at": "2026-01-01T00:00:00"
+            }))
+            all_ids.append(node_id)
+            node_id += 1
+        roots.append(root_id)
+    return roots, all_ids
+
+
+def run_workload(requests: int, write_ratio: float, roots, all_ids, wipe_all: bool, seed: int):
+    from enhanced_local_cache import enhanced_local_cache, TREE_TABLE
+    from routers.tree import get_story_tree
+    from tree_cache import tree_cache
+
+    tree_cache.clear()
+    tree_cache.hits = tree_cache.misses = 0
+    rng = random.Random(seed)
+    read_time, reads = 0.0, 0
+    for _ in range(requests):
+        if rng.random() < write_ratio:
+            node_id = rng.choice(all_ids)
+            enhanced_local_cache.update_item(TREE_TABLE, node_id, {"title": f"节点{node_id}-{rng.random():.3f}"})
+            if wipe_all:
+                # 旧策略：任一节点写入都清空所有树
+                tree_cache.clear()
+            continue
+        # 读取集中在少数热门故事树
+        root_id = roots[min(int(rng.paretovariate(1.2)) - 1, len(roots) - 1)]
+        start = time.perf_counter()
+        get_story_tree(root_id)
+        read_time += time.perf_counter() - start
+        reads += 1
+    return tree_cache.stats()["hit_rate"], read_time / max(reads, 1)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="故事树缓存混合读写基准")
+    parser.add_argument("--trees", type=int, default=50, help="故事树数量")
+    parser.add_argument("--nodes", type=int, default=500, help="每棵树的节点数")
+    parser.add_argument("--branching", type=int, default=3, help="每个节点的子节点数")
+    parser.add_argument("--requests", type=int, default=5000, help="请求数")
+    parser.add_argument("--write-ratio", type=float, default=0.05, help="写请求比例")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    logging.getLogger("tree_cache").setLevel(logging.WARNING)
+    from enhanced_local_cache import enhanced_local_cache, TREE_TABLE
+
+    roots, all_ids = build_forest(enhanced_local_cache, TREE_TABLE, args.trees, args.nodes, args.branching)
+    logger.info(f"已生成 {args.trees} 棵树，共 {len(all_ids)} 个节点，写请求比例 {args.write_ratio:.0%}")
+
+    for label, wipe_all in (("每次写入清空全部", True), ("按祖先精确失效", False)):
+        hit_rate, latency = run_workload(args.requests, args.write_ratio, roots, all_ids, wipe_all, args.seed)
+        logger.info(f"{label}: 命中率 {hit_rate:.1%}, 平均读取 {latency * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+故事树搜索基准：导入一棵大树后测量全树和限定子树的子串、前缀查询延迟，以及每次查询遍历的候选数
+"""
+
+import time
+import logging
+import argparse
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="故事树搜索基准")
+    parser.add_argument("--nodes", type=int, default=100000, help="节点数")
+    parser.add_argument("--branching", type=int, default=3, help="每个节点的子节点数")
+    parser.add_argument("--rounds", type=int, default=200, help="每个查询重复的次数")
+    args = parser.parse_args()
+
+    logging.getLogger("tree_transfer").setLevel(logging.WARNING)
+    from enhanced_local_cache import enhanced_local_cache
+    from transfer_tree import generate_lines
+    from tree_search import tree_search
+    from tree_transfer import import_lines
+
+    enhanced_local_cache.data["users"].setdefault(1, {"id": 1, "username": "benchmark", "role": "admin"})
+    result = import_lines(generate_lines(args.nodes, args.branching), batch_size=5000)
+    snapshot = enhanced_local_cache.get_tree_snapshot()
+    root_id = result["root_ids"][0]
+    middle = snapshot.child_ids(snapshot.child_ids(root_id)[1])[0]
+    logger.info(f"已导入 {result['rows']} 个节点，索引: {tree_search.stats()}")
+
+    queries = [("节点4242", None, False), ("选项", None, False), ("节点9", None, True),
+               ("节点", middle, False), ("99", middle, False), ("不存在", None, False)]
+    for query, scope, prefix in queries:
+        tree_search.search(query, scope, prefix)
+        examined = tree_search.examined
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            tree_search.search(query, scope, prefix)
+        latency = (time.perf_counter() - started) / args.rounds
+        per_query = (tree_search.examined - examined) / args.rounds
+        logger.info(f"查询 {query!r} 子树 {scope} 前缀 {prefix}: 平均 {latency * 1000:.3f} ms，遍历 {per_query:.0f} 个候选")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+构建静态文件：生成带指纹的文件名和gzip/Brotli预压缩版本，可选压缩CSS和JS
+"""
+
+import logging
+import argparse
+from static_assets import STATIC_DIRECTORY, build_assets
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="构建带指纹的预压缩静态文件")
+    parser.add_argument("--static-dir", default=STATIC_DIRECTORY, help="静态文件目录")
+    parser.add_argument("--minify", action="store_true", help="压缩CSS和JS")
+    args = parser.parse_args()
+
+    manifest = build_assets(args.static_dir, minify=args.minify)
+    for logical, fingerprinted in sorted(manifest.items()):
+        logger.info(f"{logical} -> {fingerprinted}")
+
+
+if __name__ == "__main__":
+    main()
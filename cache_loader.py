@@ -0,0 +1,77 @@
+import logging
+from typing import Dict, Any, Iterator, Optional
+from sqlalchemy import DateTime, inspect, select
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# 流式读取时每批从游标取回的行数
+LOAD_BATCH_SIZE = 1000
+
+
+def _column_default(column):
+    """库中缺少某列时使用模型上的默认值"""
+    if column.default is not None and column.default.is_scalar:
+        return column.default.arg
+    return None
+
+
+def iter_table_records(connection, model_class, batch_size: int = LOAD_BATCH_SIZE,
+                       iso_datetimes: bool = False) -> Iterator[Dict[str, Any]]:
+    """按模型__table__的列投影，用core select流式读取纯元组并直接构造缓存记录
+
+    iso_datetimes为True时时间列转为ISO字符串，供需要JSON持久化的缓存使用
+    """
+    table = model_class.__table__
+    # 先检查库中已有的列，旧库可能缺少新增的列（例如版本列），缺失列补默认值
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    columns = [column for column in table.columns if column.name in existing]
+    missing = {column.name: _column_default(column) for column in table.columns if column.name not in existing}
+    if missing:
+        logger.warning(f"表 {table.name} 缺少列 {sorted(missing)}，使用默认值加载")
+    keys = [column.name for column in columns]
+    result = connection.execution_options(yield_per=batch_size).execute(select(*columns))
+
+    datetime_keys = [column.name for column in columns if isinstance(column.type, DateTime)] if iso_datetimes else []
+    for row in result:
+        record = dict(zip(keys, row))
+        for key in datetime_keys:
+            if record[key] is not None:
+                record[key] = record[key].isoformat()
+        if missing:
+            record.update(missing)
+        yield record
+
+
+def load_tables(session: Session, table_class_map: Dict[str, Any], batch_size: int = LOAD_BATCH_SIZE,
+                iso_datetimes: bool = False) -> Dict[str, Dict[Any, Dict[str, Any]]]:
+    """加载多张表，返回 {表名: {行ID: 记录}}"""
+    connection = session.connection()
+    tables = {}
+    for table_name, model_class in table_class_map.items():
+        tables[table_name] = {
+            record["id"]: record
+            for record in iter_table_records(connection, model_class, batch_size, iso_datetimes)
+        }
+        logger.debug(f"已加载 {table_name}: {len(tables[table_name])} 行")
+    return tables
+
+
+def merge_into_cache(data: Dict[str, Dict], loaded: Dict[str, Dict], modified: Dict[str, set], deleted: Dict[str, set],
+                     counter_deltas: Optional[Dict[str, Dict]] = None):
+    """用加载结果替换缓存表，保留尚未同步的本地修改、删除和计数增量，需在缓存锁内调用"""
+    for table_name, records in loaded.items():
+        current = data.get(table_name, {})
+        # 库中的计数还不含待同步的增量，重新累加到加载的行上
+        for item_id, deltas in (counter_deltas or {}).get(table_name, {}).items():
+            record = records.get(item_id)
+            if record is None or item_id in modified.get(table_name, ()):
+                continue
+            for column, delta in deltas.items():
+                record[column] = (record.get(column) or 0) + delta
+        for item_id in modified.get(table_name, ()):
+            if item_id in current:
+                records[item_id] = current[item_id]
+        for item_id in deleted.get(table_name, ()):
+            records.pop(item_id, None)
+        data[table_name] = records
@@ -0,0 +1,173 @@
+import logging
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional
+from sqlalchemy import DateTime, bindparam, delete, func, update, insert
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# 同步删除时的表顺序，先删除引用方再删除被引用方，满足外键约束
+DELETE_ORDER = [
+    "chapter_comments",
+    "discussion_comments",
+    "story_chapters",
+    "stories",
+    "discussions",
+    "story_tree_nodes",
+    "users"
+]
+
+# 版本列名，缓存每次修改行时递增
+VERSION_COLUMN = "version"
+
+# 以增量方式同步的计数列，整行写入时不覆盖这些列
+COUNTER_COLUMNS = {
+    "users": ("active_count", "points")
+}
+
+# 已检查过表结构的数据库
+_schema_checked = set()
+
+
+def ensure_schema(session: Session):
+    """每个数据库首次同步前补齐缺失的表和列（例如新增的版本列）"""
+    bind = session.get_bind()
+    key = str(bind.url)
+    if key in _schema_checked:
+        return
+    from database import upgrade_schema
+    upgrade_schema(session.connection())
+    _schema_checked.add(key)
+
+
+def bump_version(item):
+    """递增缓存行的版本，支持字典和对象两种类型"""
+    if isinstance(item, dict):
+        item[VERSION_COLUMN] = (item.get(VERSION_COLUMN) or 0) + 1
+    else:
+        setattr(item, VERSION_COLUMN, (getattr(item, VERSION_COLUMN, None) or 0) + 1)
+    return item
+
+
+def _column_value(column, row: Dict[str, Any]):
+    """取出行中某列的值，补默认值并转换ISO格式的时间字符串"""
+    value = row.get(column.name)
+    if value is None and column.default is not None and column.default.is_scalar:
+        value = column.default.arg
+    elif value is None and column.default is not None and column.default.is_callable:
+        value = column.default.arg(None)
+    if isinstance(value, str) and isinstance(column.type, DateTime):
+        value = datetime.fromisoformat(value)
+    return value
+
+
+def _row_params(table, row: Dict[str, Any], pending_deltas: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    params = {column.name: _column_value(column, row) for column in table.columns}
+    if not params.get(VERSION_COLUMN):
+        params[VERSION_COLUMN] = 1
+    # 新插入的行只写入不含待同步增量的基数，增量随后统一累加
+    for column_name, delta in (pending_deltas or {}).items():
+        params[column_name] = (params.get(column_name) or 0) - delta
+    return params
+
+
+def upsert_rows(session: Session, model_class, rows: Iterable[Dict[str, Any]],
+                counter_deltas: Optional[Dict[Any, Dict[str, int]]] = None) -> int:
+    """按版本保护的批量盲写：行不存在则插入，存在且库中版本更旧才更新
+
+    传入counter_deltas时，计数列只在插入时写入，更新时由flush_counter_deltas累加
+    """
+    table = model_class.__table__
+    params = [
+        _row_params(table, row, counter_deltas.get(row.get("id")) if counter_deltas else None)
+        for row in rows
+    ]
+    if not params:
+        return 0
+
+    version = table.c[VERSION_COLUMN]
+    excluded = set(COUNTER_COLUMNS.get(table.name, ())) if counter_deltas is not None else set()
+    columns = [
+        column for column in table.columns
+        if not column.primary_key and column.name != VERSION_COLUMN and column.name not in excluded
+    ]
+    dialect = session.get_bind().dialect.name
+
+    if dialect == "mysql":
+        stmt = mysql.insert(table)
+        newer = stmt.inserted[VERSION_COLUMN] > version
+        # MySQL按顺序执行赋值，版本列必须放在最后，前面的条件才能看到旧版本
+        assignments = [
+            (column.name, func.IF(newer, stmt.inserted[column.name], column))
+            for column in columns
+        ]
+        assignments.append((VERSION_COLUMN, func.IF(newer, stmt.inserted[VERSION_COLUMN], version)))
+        session.execute(stmt.on_duplicate_key_update(assignments), params)
+    elif dialect in ("sqlite", "postgresql"):
+        dialect_module = sqlite if dialect == "sqlite" else postgresql
+        stmt = dialect_module.insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[column for column in table.primary_key.columns],
+            set_={column.name: stmt.excluded[column.name] for column in columns + [version]},
+            where=stmt.excluded[VERSION_COLUMN] > version
+        )
+        session.execute(stmt, params)
+    else:
+        _upsert_rows_generic(session, table, columns, params)
+
+    return len(params)
+
+
+def _upsert_rows_generic(session: Session, table, columns, params: List[Dict[str, Any]]):
+    """不支持原生upsert的数据库：先按版本条件更新，未命中再插入"""
+    version = table.c[VERSION_COLUMN]
+    for row in params:
+        result = session.execute(
+            update(table)
+            .where(table.c.id == row["id"], version < row[VERSION_COLUMN])
+            .values({column.name: row[column.name] for column in columns + [version]})
+        )
+        if result.rowcount:
+            continue
+        try:
+            with session.begin_nested():
+                session.execute(insert(table).values(row))
+        except IntegrityError:
+            # 行已存在且库中版本不旧于缓存，保留库中数据
+            pass
+
+
+def flush_counter_deltas(session: Session, model_class, counter_deltas: Dict[Any, Dict[str, int]]) -> int:
+    """以一条批量语句累加计数增量：SET col = col + :delta"""
+    table = model_class.__table__
+    counter_columns = COUNTER_COLUMNS.get(table.name, ())
+    params = [
+        dict({"item_id": item_id}, **{f"delta_{name}": deltas.get(name, 0) for name in counter_columns})
+        for item_id, deltas in counter_deltas.items()
+        if any(deltas.values())
+    ]
+    if not params or not counter_columns:
+        return 0
+
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("item_id"))
+        .values({
+            name: func.coalesce(table.c[name], 0) + bindparam(f"delta_{name}")
+            for name in counter_columns
+        })
+    )
+    session.execute(stmt, params)
+    return len(params)
+
+
+def delete_rows(session: Session, model_class, item_ids: Iterable) -> int:
+    """批量删除"""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return 0
+    table = model_class.__table__
+    session.execute(delete(table).where(table.c.id.in_(item_ids)))
+    return len(item_ids)
@@ -0,0 +1,163 @@
+import uuid
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, List, Optional
+from local_cache import local_cache
+from enhanced_local_cache import enhanced_local_cache, TREE_TABLE
+
+logger = logging.getLogger(__name__)
+
+
+def story_tag(story_id) -> str:
+    return f"story:{story_id}"
+
+
+def discussion_tag(discussion_id) -> str:
+    return f"discussion:{discussion_id}"
+
+
+def user_tag(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def tree_node_tag(node_id) -> str:
+    return f"tree_node:{node_id}"
+
+
+def _field(item, name):
+    """缓存行可能是字典或ORM对象"""
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
+
+
+class EntityVersions:
+    """按依赖标签记录的实体版本号，缓存写入时递增，供页面缓存失效和条件请求使用"""
+
+    def __init__(self):
+        # 进程启动标识，重启后旧的版本号不再有效
+        self.epoch = uuid.uuid4().hex[:8]
+        # 全量重载时递增，使所有标签同时失效
+        self.generation = 0
+        self.versions: Dict[str, int] = {}
+        self.modified_at: Dict[str, datetime] = {}
+        self.reloaded_at = self._now()
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _now() -> datetime:
+        # 保留秒以下的精度：HTTP日期只精确到秒，同一秒内的修改要能与If-Modified-Since区分
+        return datetime.now(timezone.utc)
+
+    def bump(self, *tags: str):
+        """递增标签版本并通知监听器"""
+        if not tags:
+            return
+        now = self._now()
+        with self.lock:
+            for tag in tags:
+                self.versions[tag] = self.versions.get(tag, 0) + 1
+                self.modified_at[tag] = now
+        self._notify(tags)
+
+    def bump_all(self):
+        """数据全量重载后所有标签失效"""
+        with self.lock:
+            self.generation += 1
+            self.reloaded_at = self._now()
+        self._notify(None)
+
+    def snapshot(self, tags: Iterable[str]) -> tuple:
+        """返回标签当前版本，渲染前后比较以发现并发写入"""
+        with self.lock:
+            return (self.generation,) + tuple(self.versions.get(tag, 0) for tag in tags)
+
+    def version(self, tag: str) -> tuple:
+        """单个标签的版本，用作模板片段缓存键的一部分"""
+        return self.snapshot((tag,))
+
+    def etag(self, key: str, tags: List[str], variant: str = "") -> str:
+        """由页面键和依赖标签版本计算弱ETag，不需要渲染页面"""
+        source = repr((key, variant, tuple(tags), self.snapshot(tags)))
+        digest = hashlib.blake2b(source.encode("utf-8"), digest_size=8).hexdigest()
+        return f'W/"{self.epoch}-{digest}"'
+
+    def last_modified(self, tags: Iterable[str]) -> datetime:
+        """标签中最近一次修改的时间"""
+        with self.lock:
+            times = [self.modified_at[tag] for tag in tags if tag in self.modified_at]
+            return max(times + [self.reloaded_at])
+
+    def add_listener(self, callback):
+        """注册失效监听器，参数为变更的标签，None表示全部失效"""
+        self.listeners.append(callback)
+
+    def _notify(self, tags: Optional[Iterable[str]]):
+        for callback in self.listeners:
+            try:
+                callback(tags)
+            except Exception as e:
+                logger.error(f"版本监听器执行失败: {e}")
+
+
+def local_cache_tags(table_name: str, item) -> List[str]:
+    """本地缓存中一行变更时受影响的标签"""
+    if table_name == "stories":
+        return [story_tag(_field(item, "id")), "stories"]
+    if table_name == "story_chapters":
+        return [story_tag(_field(item, "story_id"))]
+    if table_name == "chapter_comments":
+        chapter = local_cache.get("story_chapters", _field(item, "chapter_id"))
+        # 找不到章节时无法定位故事，退化为使所有故事页失效
+        return [story_tag(_field(chapter, "story_id"))] if chapter else ["stories"]
+    if table_name == "discussions":
+        return [discussion_tag(_field(item, "id")), "discussions"]
+    if table_name == "discussion_comments":
+        return [discussion_tag(_field(item, "discussion_id")), "discussions"]
+    if table_name == "users":
+        return [user_tag(_field(item, "id")), "users"]
+    return [table_name]
+
+
+def tree_node_tags(node: Dict[str, Any]) -> List[str]:
+    """故事树节点变更时受影响的标签：自身和所有祖先，起始节点还影响起点列表"""
+    ancestor_ids = enhanced_local_cache.get_ancestor_ids(node)
+    tags = [tree_node_tag(node_id) for node_id in ancestor_ids]
+    top = node if len(ancestor_ids) == 1 else enhanced_local_cache.get_item(TREE_TABLE, ancestor_ids[-1])
+    if top is not None and top.get("parent_id") is None:
+        tags.append("tree_roots")
+    return tags
+
+
+def tree_path_tags(node_id) -> List[str]:
+    """探索页依赖的标签：从起始节点到该节点路径上的每个节点"""
+    node = enhanced_local_cache.get_item(TREE_TABLE, node_id)
+    if node is None:
+        return [tree_node_tag(node_id)]
+    return [tree_node_tag(path_node["id"]) for path_node in enhanced_local_cache.get_path_nodes(node)]
+
+
+def _on_local_cache_change(table_name, action, item):
+    if action == "reload":
+        entity_versions.bump_all()
+    elif table_name == "users" and action == "add":
+        # 新注册用户不会出现在任何已渲染的页面上
+        return
+    else:
+        entity_versions.bump(*local_cache_tags(table_name, item))
+
+
+def _on_enhanced_cache_change(data_type, action, item):
+    if action == "reload":
+        entity_versions.bump_all()
+    elif data_type == "story_tree_nodes":
+        entity_versions.bump(*tree_node_tags(item))
+
+
+# 创建全局实体版本实例，并监听两个缓存的写入
+entity_versions = EntityVersions()
+local_cache.add_listener(_on_local_cache_change)
+enhanced_local_cache.add_listener(_on_enhanced_cache_change)
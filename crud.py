@@ -9,6 +9,7 @@ from database import (
     DiscussionCommentDB
 )
 from local_cache import local_cache
+from markdown_renderer import render_content_html, ensure_content_html, rerender_stale
 import datetime
 # 用户相关操作
 
@@ -69,27 +70,15 @@ def get_user_by_id(db: Session, user_id: int):
 
 def update_user_points(db: Session, user_id: int, points: int):
     """更新用户积分"""
-    user = local_cache.get("users", user_id)
-    if user:
-        # 确保points不为None，安全访问
-        if user.get("points") is None:
-            user["points"] = 0
-        user["points"] += points
-        local_cache.update("users", user)
-    return user
+    # 只累加增量，同步时以 points = points + 增量 写入，不重写整行
+    return local_cache.increment("users", user_id, "points", points)
 
 
 
 def update_user_active_count(db: Session, user_id: int):
     """更新用户活跃次数"""
-    user = local_cache.get("users", user_id)
-    if user:
-        # 确保active_count不为None，安全访问
-        if user.get("active_count") is None:
-            user["active_count"] = 0
-        user["active_count"] += 1
-        local_cache.update("users", user)
-    return user
+    # 只累加增量，同步时以 active_count = active_count + 增量 写入，不重写整行
+    return local_cache.increment("users", user_id, "active_count", 1)
 
 
 def get_all_users(db: Session):
@@ -124,6 +113,9 @@ def create_story(db: Session, title: str, content: str, author_id: int, tags: st
         "updated_at": datetime.now()
     }
     
+    # 写入时预渲染HTML，读取时不再调用Markdown渲染
+    render_content_html(new_story)
+    
     # 添加到本地缓存
     local_cache.add("stories", new_story)
     
@@ -189,6 +181,9 @@ def create_chapter(db: Session, story_id: int, content: str, author_id: int, aut
         "created_at": datetime.now()
     }
     
+    # 写入时预渲染HTML，读取时不再调用Markdown渲染
+    render_content_html(new_chapter)
+    
     # 添加到本地缓存
     local_cache.add("story_chapters", new_chapter)
     return new_chapter
@@ -199,10 +194,10 @@ def get_chapters_by_story(db: Session, story_id: int):
     # 从本地缓存获取，直接返回字典列表
     chapters = local_cache.get_all("story_chapters")
     
-    # 筛选出指定故事的章节并按创建时间排序
+    # 筛选出指定故事的章节并按创建时间排序，同一时间按ID排序以便游标分页
     return sorted(
         [chapter for chapter in chapters if chapter["story_id"] == story_id],
-        key=lambda x: x["created_at"]
+        key=lambda x: (x["created_at"], x["id"])
     )
 
 
@@ -248,6 +243,9 @@ def create_chapter_comment(db: Session, chapter_id: int, content: str, author_id
         "created_at": datetime.now()
     }
     
+    # 写入时预渲染HTML，读取时不再调用Markdown渲染
+    render_content_html(new_comment)
+    
     # 添加到本地缓存
     local_cache.add("chapter_comments", new_comment)
     
@@ -259,13 +257,25 @@ def get_comments_by_chapter(db: Session, chapter_id: int):
     # 从本地缓存获取，直接返回字典列表
     comments = local_cache.get_all("chapter_comments")
     
-    # 筛选出指定章节的评论并按创建时间排序
+    # 筛选出指定章节的评论并按创建时间排序，同一时间按ID排序以便游标分页
     return sorted(
         [comment for comment in comments if comment["chapter_id"] == chapter_id],
-        key=lambda x: x["created_at"]
+        key=lambda x: (x["created_at"], x["id"])
     )
 
 
+def group_comments_by_chapter(db: Session, chapter_ids):
+    """一次扫描获取多个章节的评论，按章节分组并按创建时间排序"""
+    chapter_ids = set(chapter_ids)
+    grouped = {}
+    for comment in local_cache.get_all("chapter_comments"):
+        if comment["chapter_id"] in chapter_ids:
+            grouped.setdefault(comment["chapter_id"], []).append(comment)
+    for comments in grouped.values():
+        comments.sort(key=lambda x: (x["created_at"], x["id"]))
+    return grouped
+
+
 def delete_chapter_comment(db: Session, comment_id: int):
     """删除章节评论"""
     # 从本地缓存删除
@@ -291,6 +301,9 @@ def create_discussion(db: Session, title: str, content: str, author_id: int, aut
         "created_at": datetime.now()
     }
     
+    # 写入时预渲染HTML，读取时不再调用Markdown渲染
+    render_content_html(new_discussion)
+    
     # 添加到本地缓存
     local_cache.add("discussions", new_discussion)
     
@@ -348,6 +361,9 @@ def create_discussion_comment(db: Session, discussion_id: int, content: str, aut
         "created_at": datetime.now()
     }
     
+    # 写入时预渲染HTML，读取时不再调用Markdown渲染
+    render_content_html(new_comment)
+    
     # 添加到本地缓存
     local_cache.add("discussion_comments", new_comment)
     
@@ -366,11 +382,50 @@ def get_comments_by_discussion(db: Session, discussion_id: int):
     )
 
 
+def group_comments_by_discussion(db: Session, discussion_ids):
+    """一次扫描获取多个讨论的评论，按讨论分组并按创建时间排序"""
+    discussion_ids = set(discussion_ids)
+    grouped = {}
+    for comment in local_cache.get_all("discussion_comments"):
+        if comment["discussion_id"] in discussion_ids:
+            grouped.setdefault(comment["discussion_id"], []).append(comment)
+    for comments in grouped.values():
+        comments.sort(key=lambda x: (x["created_at"], x["id"]))
+    return grouped
+
+
 def delete_discussion_comment(db: Session, comment_id: int):
     """删除讨论评论"""
     # 从本地缓存删除
     return local_cache.delete("discussion_comments", comment_id)
 
+# 预渲染HTML相关操作
+
+# 保存预渲染HTML的表
+RENDERED_TABLES = (
+    "stories",
+    "story_chapters",
+    "chapter_comments",
+    "discussions",
+    "discussion_comments"
+)
+
+
+def get_content_html(table_name: str, item: dict):
+    """获取行的预渲染HTML，旧行在首次读取时补渲染并写回缓存，补渲染不使页面缓存失效"""
+    return ensure_content_html(item, lambda rendered: local_cache.save_rendered(table_name, rendered))
+
+
+def rerender_all_content(db: Session):
+    """渲染器版本变更后批量重新渲染所有过期的行"""
+    total = 0
+    for table_name in RENDERED_TABLES:
+        total += rerender_stale(
+            local_cache.get_all(table_name),
+            lambda rendered: local_cache.update(table_name, rendered)
+        )
+    return total
+
 # 统计信息相关操作
 
 
@@ -2,8 +2,9 @@ import os
 from dotenv import load_dotenv
 from sqlalchemy import (
     create_engine, Column, Integer, String, 
-    DateTime, Text, Float, ForeignKey
+    DateTime, Text, Float, ForeignKey, BigInteger, inspect, text
 )
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -102,6 +103,7 @@ class UserDB(Base):
     active_count = Column(Integer, default=0, nullable=False)
     points = Column(Integer, default=0, nullable=False)
     credit = Column(Float, default=100.0, nullable=False)
+    version = Column(Integer, default=1, nullable=False)  # 行版本，缓存每次修改时递增
     # 关系
     stories = relationship("StoryDB", back_populates="author")
     chapters = relationship("StoryChapterDB", back_populates="author")
@@ -117,10 +119,13 @@ class StoryDB(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     content = Column(Text, nullable=False)
+    content_html = Column(Text, nullable=True)  # 写入时预渲染的HTML
+    content_html_version = Column(Integer, nullable=True)  # 渲染HTML时的渲染器版本
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     tags = Column(String(200), default="")
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now)
+    version = Column(Integer, default=1, nullable=False)
     # 关系
     author = relationship("UserDB", back_populates="stories")
     chapters = relationship("StoryChapterDB", back_populates="story")
@@ -132,9 +137,12 @@ class StoryChapterDB(Base):
     id = Column(Integer, primary_key=True, index=True)
     story_id = Column(Integer, ForeignKey("stories.id"), nullable=False)
     content = Column(Text, nullable=False)
+    content_html = Column(Text, nullable=True)
+    content_html_version = Column(Integer, nullable=True)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     author_name = Column(String(50), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
+    version = Column(Integer, default=1, nullable=False)
     # 关系
     story = relationship("StoryDB", back_populates="chapters")
     author = relationship("UserDB", back_populates="chapters")
@@ -147,9 +155,12 @@ class ChapterCommentDB(Base):
     id = Column(Integer, primary_key=True, index=True)
     chapter_id = Column(Integer, ForeignKey("story_chapters.id"), nullable=False)
     content = Column(Text, nullable=False)
+    content_html = Column(Text, nullable=True)
+    content_html_version = Column(Integer, nullable=True)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     author_name = Column(String(50), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
+    version = Column(Integer, default=1, nullable=False)
     # 关系
     chapter = relationship("StoryChapterDB", back_populates="comments")
     author = relationship("UserDB", back_populates="chapter_comments")
@@ -161,9 +172,12 @@ class DiscussionDB(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
     content = Column(Text, nullable=False)
+    content_html = Column(Text, nullable=True)
+    content_html_version = Column(Integer, nullable=True)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     author_name = Column(String(50), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
+    version = Column(Integer, default=1, nullable=False)
     # 关系
     author = relationship("UserDB", back_populates="discussions")
     comments = relationship("DiscussionCommentDB", back_populates="discussion")
@@ -175,9 +189,12 @@ class DiscussionCommentDB(Base):
     id = Column(Integer, primary_key=True, index=True)
     discussion_id = Column(Integer, ForeignKey("discussions.id"), nullable=False)
     content = Column(Text, nullable=False)
+    content_html = Column(Text, nullable=True)
+    content_html_version = Column(Integer, nullable=True)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     author_name = Column(String(50), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
+    version = Column(Integer, default=1, nullable=False)
     # 关系
     discussion = relationship("DiscussionDB", back_populates="comments")
     author = relationship("UserDB", back_populates="discussion_comments")
@@ -192,11 +209,25 @@ class StoryTreeNodeDB(Base):
     title = Column(String(200), nullable=False)
     option_title = Column(String(200), nullable=False)
     content = Column(Text, nullable=False)
+    content_html = Column(Text, nullable=True)
+    content_html_version = Column(Integer, nullable=True)
     parent_id = Column(Integer, nullable=True)  # 根节点的parent_id为None
+    path = Column(Text, nullable=True)  # 从起始节点到本节点的ID路径，如"1/4/9"
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
+    version = Column(Integer, default=1, nullable=False)
     # 关系
     author = relationship("UserDB", back_populates="story_tree_nodes")
+
+
+# 同步水位模型：每次同步提交时递增，用于判断只读副本是否已追上主库
+
+
+class SyncWatermarkDB(Base):
+    __tablename__ = "sync_watermarks"
+    id = Column(Integer, primary_key=True)
+    watermark = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
 # 数据库操作函数
 
 
@@ -209,11 +240,13 @@ class MockSession:
 
 # 获取数据库会话
 def get_db():
-    """获取数据库会话，数据库不可用时返回模拟会话"""
+    """获取只读数据库会话（优先使用已追上同步水位的副本），数据库不可用时返回模拟会话"""
+    from database_connection import db_manager
+    
     # 检查数据库状态
-    if check_db_status() and SessionLocal:
+    db = db_manager.get_read_session() if db_manager.is_connection_available() else None
+    if db is not None:
         # 数据库可用，返回真实会话
-        db = SessionLocal()
         try:
             yield db
         finally:
@@ -228,6 +261,7 @@ def get_db():
 def init_db():
     """初始化数据库，创建所有表"""
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
     print("数据库初始化完成")
 
 
@@ -327,3 +361,27 @@ def migrate_data_from_memory(data_store):
         return False
     finally:
         db.close()
+
+
+
+def upgrade_schema(bind):
+    """补齐已有数据库中缺失的表和列，新增列需可为空或带默认值"""
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            upgrade_schema(connection)
+        return
+    
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_ddl = f"{column.name} {column.type.compile(dialect=bind.dialect)}"
+            if column.default is not None and column.default.is_scalar:
+                column_ddl += f" DEFAULT {column.default.arg!r}"
+                if not column.nullable:
+                    column_ddl += " NOT NULL"
+            bind.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+            print(f"已为表 {table.name} 添加列 {column.name}")
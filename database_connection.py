@@ -1,7 +1,9 @@
 import os
 import time
 import logging
-from typing import Optional, Callable, Any
+import threading
+from datetime import datetime
+from typing import Optional, Callable, Any, List
 from contextlib import contextmanager
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
@@ -22,11 +24,21 @@ MYSQL_USER = os.getenv("MYSQL_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE")
 
+# 可选：直接指定主库URL，以及逗号分隔的只读副本URL
+DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_REPLICA_URLS = os.getenv("DATABASE_REPLICA_URLS", "")
+
 # 连接重试配置
 MAX_RETRY_ATTEMPTS = 3
 RETRY_DELAY_SECONDS = 2
 CONNECTION_TIMEOUT = 10
 
+# 落后副本两次水位检查之间的最小间隔（秒）
+REPLICA_LAG_CHECK_INTERVAL = 1.0
+
+# 同步水位记录的固定主键
+SYNC_WATERMARK_ID = 1
+
 # 数据库状态
 class DatabaseStatus:
     def __init__(self):
@@ -56,37 +68,63 @@ class DatabaseStatus:
 db_status = DatabaseStatus()
 
 class DatabaseConnectionManager:
-    def __init__(self):
+    def __init__(self, database_url: Optional[str] = None, replica_urls: Optional[List[str]] = None):
         self.engine: Optional[Engine] = None
         self.session_maker: Optional[sessionmaker] = None
+        self.database_url = database_url or DATABASE_URL
+        if replica_urls is None:
+            replica_urls = [url.strip() for url in DATABASE_REPLICA_URLS.split(",") if url.strip()]
+        self.replica_urls = replica_urls
+        
+        # 只读副本
+        self.replica_engines: List[Engine] = []
+        self.replica_session_makers: List[sessionmaker] = []
+        self.replica_watermarks: List[int] = []
+        self.replica_last_check: List[float] = []
+        self._next_replica = 0
+        
+        # 本进程已知的最新同步水位，读副本时不得落后于它
+        self.last_sync_watermark = 0
+        self.watermark_lock = threading.Lock()
+        
         self._initialize_connection()
         
     def _build_database_url(self) -> str:
         """构建数据库连接URL"""
+        if self.database_url:
+            return self.database_url
         return f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}?charset=utf8mb4"
         
+    def _build_engine_kwargs(self, database_url: str) -> dict:
+        """根据数据库类型构建引擎配置"""
+        if database_url.startswith("sqlite"):
+            # SQLite用于本地开发和测试
+            return {
+                'echo': False,
+                'connect_args': {'check_same_thread': False}
+            }
+        
+        return {
+            'echo': False,  # 关闭SQL日志
+            'pool_pre_ping': True,  # 连接前检查
+            'pool_recycle': 3600,  # 连接回收时间
+            'pool_size': 5,  # 连接池大小
+            'max_overflow': 10,  # 最大溢出连接
+            'connect_args': {
+                'charset': 'utf8mb4',
+                'connect_timeout': CONNECTION_TIMEOUT,
+                'read_timeout': 30,
+                'write_timeout': 30,
+                'ssl_ca': None,
+            }
+        }
+        
     def _initialize_connection(self):
         """初始化数据库连接"""
         try:
             database_url = self._build_database_url()
             
-            # 创建引擎配置
-            engine_kwargs = {
-                'echo': False,  # 关闭SQL日志
-                'pool_pre_ping': True,  # 连接前检查
-                'pool_recycle': 3600,  # 连接回收时间
-                'pool_size': 5,  # 连接池大小
-                'max_overflow': 10,  # 最大溢出连接
-                'connect_args': {
-                    'charset': 'utf8mb4',
-                    'connect_timeout': CONNECTION_TIMEOUT,
-                    'read_timeout': 30,
-                    'write_timeout': 30,
-                    'ssl_ca': None,
-                }
-            }
-            
-            self.engine = create_engine(database_url, **engine_kwargs)
+            self.engine = create_engine(database_url, **self._build_engine_kwargs(database_url))
             self.session_maker = sessionmaker(bind=self.engine)
             
             # 测试连接
@@ -99,6 +137,124 @@ class DatabaseConnectionManager:
             db_status.mark_connection_error()
             raise
             
+        self._initialize_replicas()
+        
+    def _initialize_replicas(self):
+        """初始化只读副本，单个副本失败不影响主库"""
+        for engine in self.replica_engines:
+            engine.dispose()
+        self.replica_engines = []
+        self.replica_session_makers = []
+        
+        for replica_url in self.replica_urls:
+            try:
+                replica_engine = create_engine(replica_url, **self._build_engine_kwargs(replica_url))
+                self.replica_engines.append(replica_engine)
+                self.replica_session_makers.append(sessionmaker(bind=replica_engine))
+            except Exception as e:
+                logger.error(f"只读副本初始化失败: {str(e)}")
+                
+        self.replica_watermarks = [0] * len(self.replica_engines)
+        self.replica_last_check = [0.0] * len(self.replica_engines)
+        
+        if self.replica_engines:
+            logger.info(f"已配置 {len(self.replica_engines)} 个只读副本")
+            # 从主库取得当前水位，保证预热不会读到比上次同步更旧的数据
+            self.refresh_sync_watermark()
+            
+    def _read_watermark(self, engine: Engine) -> int:
+        """读取指定库中的同步水位"""
+        try:
+            with engine.connect() as conn:
+                value = conn.execute(
+                    text("SELECT watermark FROM sync_watermarks WHERE id = :id"),
+                    {"id": SYNC_WATERMARK_ID}
+                ).scalar()
+                return int(value or 0)
+        except (OperationalError, DatabaseError) as e:
+            logger.debug(f"读取同步水位失败: {str(e)}")
+            return 0
+            
+    def refresh_sync_watermark(self) -> int:
+        """从主库刷新本进程已知的同步水位"""
+        if not self.engine:
+            return self.last_sync_watermark
+        self._advance_sync_watermark(self._read_watermark(self.engine))
+        return self.last_sync_watermark
+        
+    def _advance_sync_watermark(self, watermark: int):
+        """水位只能前进"""
+        with self.watermark_lock:
+            if watermark > self.last_sync_watermark:
+                self.last_sync_watermark = watermark
+                
+    def commit_sync(self, session: Session) -> int:
+        """在同步事务中写入新的水位并提交，返回提交的水位"""
+        from database import SyncWatermarkDB
+        
+        with self.watermark_lock:
+            watermark = max(self.last_sync_watermark + 1, int(time.time() * 1000))
+            
+        # 水位表由同步前的ensure_schema创建，这里不再逐次检查
+        updated = session.query(SyncWatermarkDB).filter(
+            SyncWatermarkDB.id == SYNC_WATERMARK_ID
+        ).update({
+            SyncWatermarkDB.watermark: watermark,
+            SyncWatermarkDB.updated_at: datetime.now()
+        })
+        if not updated:
+            session.add(SyncWatermarkDB(
+                id=SYNC_WATERMARK_ID,
+                watermark=watermark,
+                updated_at=datetime.now()
+            ))
+        session.commit()
+        
+        self._advance_sync_watermark(watermark)
+        return watermark
+        
+    def _replica_is_current(self, index: int) -> bool:
+        """检查副本是否已追上本进程已知的最新同步水位"""
+        required = self.last_sync_watermark
+        if self.replica_watermarks[index] >= required:
+            return True
+            
+        # 落后的副本限制检查频率，期间直接回退到主库
+        now = time.time()
+        if now - self.replica_last_check[index] < REPLICA_LAG_CHECK_INTERVAL:
+            return False
+        self.replica_last_check[index] = now
+        
+        self.replica_watermarks[index] = self._read_watermark(self.replica_engines[index])
+        return self.replica_watermarks[index] >= required
+        
+    def get_read_session(self) -> Optional[Session]:
+        """获取只读会话：轮询已追上同步水位的副本，全部落后或未配置时使用主库"""
+        replica_count = len(self.replica_session_makers)
+        for offset in range(replica_count):
+            index = (self._next_replica + offset) % replica_count
+            try:
+                if self._replica_is_current(index):
+                    self._next_replica = (index + 1) % replica_count
+                    return self.replica_session_makers[index]()
+            except Exception as e:
+                logger.warning(f"只读副本 {index} 不可用: {str(e)}")
+                
+        if replica_count:
+            logger.debug("只读副本落后于同步水位，读取主库")
+        return self.get_session()
+        
+    def replica_status(self) -> List[dict]:
+        """只读副本的水位状态"""
+        return [
+            {
+                "index": index,
+                "watermark": self.replica_watermarks[index],
+                "current": self.replica_watermarks[index] >= self.last_sync_watermark
+            }
+            for index in range(len(self.replica_engines))
+        ]
+            
     def _test_connection(self) -> bool:
         """测试数据库连接"""
         try:
@@ -168,12 +324,20 @@ class DatabaseConnectionManager:
             return None
             
     def execute_with_retry(self, func: Callable, *args, **kwargs) -> Any:
-        """执行带重试的数据库操作"""
+        """执行带重试的数据库操作（主库）"""
+        return self._execute_with_retry(self.get_session, func, *args, **kwargs)
+        
+    def execute_read_with_retry(self, func: Callable, *args, **kwargs) -> Any:
+        """执行带重试的只读数据库操作（优先只读副本）"""
+        return self._execute_with_retry(self.get_read_session, func, *args, **kwargs)
+        
+    def _execute_with_retry(self, session_factory: Callable, func: Callable, *args, **kwargs) -> Any:
+        """使用指定的会话工厂执行带重试的数据库操作"""
         last_exception = None
         
         for attempt in range(MAX_RETRY_ATTEMPTS):
             try:
-                session = self.get_session()
+                session = session_factory()
                 if session is None:
                     raise Exception("无法获取数据库会话")
                     
@@ -200,9 +364,9 @@ class DatabaseConnectionManager:
 db_manager = DatabaseConnectionManager()
 
 @contextmanager
-def get_db_session():
-    """获取数据库会话的上下文管理器"""
-    session = db_manager.get_session()
+def get_db_session(read_only: bool = False):
+    """获取数据库会话的上下文管理器，read_only为True时优先使用只读副本"""
+    session = db_manager.get_read_session() if read_only else db_manager.get_session()
     try:
         yield session
         session.commit()
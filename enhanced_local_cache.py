@@ -1,12 +1,43 @@
+import os
+import bisect
 import logging
 import threading
+from types import MappingProxyType
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 from database_connection import db_manager, get_db_session
 from temp_storage import temp_storage
+from query_stats import query_stats
+from markdown_renderer import markdown_renderer
+from cache_loader import load_tables, merge_into_cache
+from cache_sync import DELETE_ORDER, bump_version, delete_rows, ensure_schema, upsert_rows
+from tree_snapshot import PersistentMap, TreeSnapshot, TreeSnapshotNode, freeze_node
 
 logger = logging.getLogger(__name__)
 
+# 故事树节点表，缓存维护其父子索引
+TREE_TABLE = "story_tree_nodes"
+
+# 故事树节点向上查找祖先时的最大深度，防止环形数据导致死循环
+MAX_ANCESTOR_DEPTH = 10000
+
+# 一次写入变化的节点数不超过此值时在写入时立即发布新快照，更多时（如深链上的统计更新、批量导入）合并到下次读取时发布
+TREE_SNAPSHOT_EAGER_NODES = int(os.getenv("TREE_SNAPSHOT_EAGER_NODES", "256"))
+
+
+def _later(first, second):
+    """两个ISO时间字符串中较晚的一个，忽略空值"""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return max(first, second)
+
+# 不写入临时存储JSON文件的凭据列
+TEMP_STORAGE_EXCLUDED_COLUMNS = {
+    "users": ("password_hash",)
+}
+
 class EnhancedLocalCache:
     """增强的本地缓存，支持数据库重连和临时存储"""
     
@@ -44,8 +75,20 @@ class EnhancedLocalCache:
             "story_tree_nodes": set()
         }
         
+        # 故事树父节点ID到按ID排序的子节点ID列表，起始节点在None下
+        self.tree_children: Dict[Optional[int], List[int]] = {}
+        # 故事树节点的子树统计：子孙数、子树深度、结局（叶子）数、最近活动时间和子树中的最小、最大节点ID，随写入沿祖先路径增量维护
+        self.tree_stats: Dict[int, Dict[str, Any]] = {}
+        # 故事树的当前不可变快照，写入在锁内复制变化的路径后整体替换，读取方不加锁
+        self.tree_snapshot = TreeSnapshot()
+        # 本次写入中节点字段、子节点列表或统计有变化的节点ID，发布快照时只复制这些节点
+        self.tree_dirty: set = set()
+        self.tree_snapshot_stale = False
+        
         # IP限流缓存
         self.ip_register_times = {}
+        # 数据变更监听器
+        self.listeners = []
         self.lock = threading.RLock()
         self.last_sync_time = datetime.now()
         
@@ -101,7 +144,9 @@ class EnhancedLocalCache:
         """从数据库加载数据，失败时使用临时存储"""
         try:
             # 首先尝试从数据库加载
-            if self._load_from_db_direct():
+            with query_stats.track_operation("warmup"):
+                loaded = self._load_from_db_direct()
+            if loaded:
                 logger.info("从数据库加载数据成功")
                 return True
                 
@@ -115,99 +160,26 @@ class EnhancedLocalCache:
     def _load_from_db_direct(self) -> bool:
         """直接从数据库加载数据"""
         try:
+            # 只加载有对应模型的表
+            table_class_map = {
+                data_type: self._get_class_by_table(data_type)
+                for data_type in self.data.keys()
+                if self._get_class_by_table(data_type) is not None
+            }
+            
             def load_data(session):
-                from database import (
-                    UserDB, StoryDB, StoryChapterDB, 
-                    ChapterCommentDB, DiscussionDB, DiscussionCommentDB
-                )
-                
-                # 加载所有数据
-                with self.lock:
-                    # 加载用户
-                    users = session.query(UserDB).all()
-                    for user in users:
-                        self.data["users"][user.id] = {
-                            "id": user.id,
-                            "username": user.username,
-                            "email": user.email,
-                            "created_at": user.created_at.isoformat() if user.created_at else None,
-                            "last_login": user.last_login.isoformat() if user.last_login else None
-                        }
-                    
-                    # 加载故事
-                    stories = session.query(StoryDB).all()
-                    for story in stories:
-                        self.data["stories"][story.id] = {
-                            "id": story.id,
-                            "title": story.title,
-                            "author_id": story.author_id,
-                            "content": story.content,
-                            "created_at": story.created_at.isoformat() if story.created_at else None,
-                            "updated_at": story.updated_at.isoformat() if story.updated_at else None
-                        }
-                    
-                    # 加载故事章节
-                    chapters = session.query(StoryChapterDB).all()
-                    for chapter in chapters:
-                        self.data["story_chapters"][chapter.id] = {
-                            "id": chapter.id,
-                            "story_id": chapter.story_id,
-                            "chapter_number": chapter.chapter_number,
-                            "title": chapter.title,
-                            "content": chapter.content,
-                            "created_at": chapter.created_at.isoformat() if chapter.created_at else None
-                        }
-                    
-                    # 加载章节评论
-                    comments = session.query(ChapterCommentDB).all()
-                    for comment in comments:
-                        self.data["chapter_comments"][comment.id] = {
-                            "id": comment.id,
-                            "chapter_id": comment.chapter_id,
-                            "user_id": comment.user_id,
-                            "content": comment.content,
-                            "created_at": comment.created_at.isoformat() if comment.created_at else None
-                        }
-                    
-                    # 加载讨论
-                    discussions = session.query(DiscussionDB).all()
-                    for discussion in discussions:
-                        self.data["discussions"][discussion.id] = {
-                            "id": discussion.id,
-                            "title": discussion.title,
-                            "user_id": discussion.user_id,
-                            "content": discussion.content,
-                            "created_at": discussion.created_at.isoformat() if discussion.created_at else None
-                        }
-                    
-                    # 加载讨论评论
-                    discussion_comments = session.query(DiscussionCommentDB).all()
-                    for comment in discussion_comments:
-                        self.data["discussion_comments"][comment.id] = {
-                            "id": comment.id,
-                            "discussion_id": comment.discussion_id,
-                            "user_id": comment.user_id,
-                            "content": comment.content,
-                            "created_at": comment.created_at.isoformat() if comment.created_at else None
-                        }
-                    
-                    # 加载故事树节点
-                    story_tree_nodes = session.query(StoryTreeNodeDB).all()
-                    for node in story_tree_nodes:
-                        self.data["story_tree_nodes"][node.id] = {
-                            "id": node.id,
-                            "title": node.title,
-                            "option_title": node.option_title,
-                            "content": node.content,
-                            "parent_id": node.parent_id,
-                            "author_id": node.author_id,
-                            "created_at": node.created_at.isoformat() if node.created_at else None
-                        }
-                
-                return True
+                # 按模型列投影流式读取，时间列保持ISO字符串以便写入临时存储
+                return load_tables(session, table_class_map, iso_datetimes=True)
+            
+            # 预热只读数据，优先使用已追上同步水位的只读副本
+            loaded = db_manager.execute_read_with_retry(load_data)
             
-            # 使用数据库管理器执行操作
-            return db_manager.execute_with_retry(load_data)
+            with self.lock:
+                merge_into_cache(self.data, loaded, self.modified, self.deleted)
+                self._rebuild_tree_index()
+            for data_type in loaded:
+                self._notify(data_type, "reload", None)
+            return True
             
         except Exception as e:
             logger.error(f"数据库加载失败: {str(e)}")
@@ -225,9 +197,12 @@ class EnhancedLocalCache:
                             # 清理临时存储的元数据
                             clean_item = {k: v for k, v in item.items() if not k.startswith('_temp_')}
                             self.data[data_type][item_id] = clean_item
+                self._rebuild_tree_index()
                             
-                logger.info("从临时存储恢复数据成功")
-                return True
+            for data_type in self.data.keys():
+                self._notify(data_type, "reload", None)
+            logger.info("从临时存储恢复数据成功")
+            return True
                 
         except Exception as e:
             logger.error(f"从临时存储恢复数据失败: {str(e)}")
@@ -237,7 +212,9 @@ class EnhancedLocalCache:
         """同步数据到数据库，失败时保存到临时存储"""
         try:
             # 首先尝试同步到数据库
-            if self._sync_to_db_direct():
+            with query_stats.track_operation("sync"):
+                synced = self._sync_to_db_direct()
+            if synced:
                 logger.info("同步到数据库成功")
                 return True
                 
@@ -249,10 +226,19 @@ class EnhancedLocalCache:
         return self._sync_to_temp_storage()
         
     def _sync_to_db_direct(self) -> bool:
-        """直接同步到数据库"""
+        """直接同步到数据库：批量删除后按版本保护批量盲写"""
         try:
             def sync_data(session):
                 with self.lock:
+                    ensure_schema(session)
+                    
+                    # 处理删除操作，按外键依赖顺序
+                    for table_name in DELETE_ORDER:
+                        model_class = self._get_class_by_table(table_name)
+                        if model_class and self.deleted.get(table_name):
+                            delete_rows(session, model_class, self.deleted[table_name])
+                            
+                    # 处理修改操作
                     for table_name, modified_ids in self.modified.items():
                         if not modified_ids:
                             continue
@@ -262,25 +248,19 @@ class EnhancedLocalCache:
                         if not model_class:
                             continue
                             
-                        for item_id in modified_ids:
-                            if item_id in self.data[table_name]:
-                                item_data = self.data[table_name][item_id]
-                                # 这里应该实现具体的数据库同步逻辑
-                                # 根据 item_data 更新或插入数据库记录
-                                
-                    # 处理删除操作
-                    for table_name, deleted_ids in self.deleted.items():
-                        if not deleted_ids:
-                            continue
-                            
-                        model_class = self._get_class_by_table(table_name)
-                        if not model_class:
-                            continue
-                            
-                        for item_id in deleted_ids:
-                            # 这里应该实现具体的数据库删除逻辑
-                            pass
-                            
+                        rows = [
+                            self.data[table_name][item_id]
+                            for item_id in modified_ids
+                            if item_id in self.data[table_name]
+                        ]
+                        upsert_rows(session, model_class, rows)
+                        
+                    # 提交并推进同步水位，成功后清空标记
+                    db_manager.commit_sync(session)
+                    for table_name in self.modified.keys():
+                        self.modified[table_name].clear()
+                        self.deleted[table_name].clear()
+                        
                     return True
             
             return db_manager.execute_with_retry(sync_data)
@@ -296,7 +276,11 @@ class EnhancedLocalCache:
                 for table_name, modified_ids in self.modified.items():
                     for item_id in modified_ids:
                         if item_id in self.data[table_name]:
-                            item_data = self.data[table_name][item_id].copy()
+                            item_data = {
+                                key: value
+                                for key, value in self.data[table_name][item_id].items()
+                                if key not in TEMP_STORAGE_EXCLUDED_COLUMNS.get(table_name, ())
+                            }
                             temp_storage.add_item(table_name, item_id, item_data)
                             
                 # 处理删除操作
@@ -311,6 +295,391 @@ class EnhancedLocalCache:
             logger.error(f"同步到临时存储失败: {str(e)}")
             return False
             
+    def add_listener(self, callback):
+        """注册数据变更监听器，操作为add、update、delete或reload"""
+        self.listeners.append(callback)
+        
+    def _notify(self, data_type: str, action: str, item: Optional[Dict[str, Any]]):
+        """通知监听器，调用方不能持有self.lock"""
+        for callback in self.listeners:
+            try:
+                callback(data_type, action, item)
+            except Exception as e:
+                logger.error(f"缓存监听器执行失败: {str(e)}")
+            
+    def _index_tree_node(self, item_id, parent_id):
+        """把节点加入父节点的子节点列表，需在锁内调用"""
+        bisect.insort(self.tree_children.setdefault(parent_id, []), item_id)
+        self.tree_dirty.add(parent_id)
+        
+    def _unindex_tree_node(self, item_id, parent_id):
+        """从父节点的子节点列表移除节点，需在锁内调用"""
+        siblings = self.tree_children.get(parent_id)
+        if not siblings:
+            return
+        position = bisect.bisect_left(siblings, item_id)
+        if position < len(siblings) and siblings[position] == item_id:
+            del siblings[position]
+            self.tree_dirty.add(parent_id)
+        if not siblings:
+            del self.tree_children[parent_id]
+            
+    def _rebuild_tree_index(self):
+        """全量加载后重建故事树子节点索引，需在锁内调用"""
+        index: Dict[Optional[int], List[int]] = {}
+        for item_id, node in self.data[TREE_TABLE].items():
+            index.setdefault(node.get("parent_id"), []).append(item_id)
+        for siblings in index.values():
+            siblings.sort()
+        self.tree_children = index
+        # 补齐旧数据缺失的物化路径，随下次同步写回数据库
+        nodes = self.data[TREE_TABLE]
+        for parent_id, siblings in index.items():
+            if parent_id is None or parent_id not in nodes:
+                for item_id in siblings:
+                    self._refresh_subtree_paths(item_id)
+        self._rebuild_tree_stats()
+        
+    def _snapshot_node(self, item_id, previous: Optional[TreeSnapshotNode]) -> Optional[TreeSnapshotNode]:
+        """由缓存中的当前状态生成节点的不可变记录，需在锁内调用"""
+        node = self.data[TREE_TABLE].get(item_id)
+        if node is None:
+            return None
+        children = self.tree_children.get(item_id, ())
+        stats = self.tree_stats.get(item_id) or self._leaf_tree_stats(node)
+        # 只有子节点或统计变化时沿用上个版本的节点字段，行版本未变说明字段未变
+        if previous is not None and previous.item.get("version") == node.get("version"):
+            return TreeSnapshotNode(previous.item, tuple(children), MappingProxyType(dict(stats)))
+        return freeze_node(node, children, stats)
+        
+    def _tree_written(self):
+        """写入结束时调用：变化不多时立即发布快照，否则留给下次读取，需在锁内调用"""
+        if not self.tree_snapshot_stale and len(self.tree_dirty) <= TREE_SNAPSHOT_EAGER_NODES:
+            self._publish_tree_snapshot()
+            
+    def get_tree_snapshot(self) -> TreeSnapshot:
+        """当前故事树的不可变快照，没有待发布的变化时不加锁"""
+        if self.tree_dirty or self.tree_snapshot_stale:
+            with self.lock:
+                self._publish_tree_snapshot()
+        return self.tree_snapshot
+        
+    def _publish_tree_snapshot(self):
+        """把积累的变化发布为新的快照，只复制变化节点到根的路径，其余节点与旧快照共享，需在锁内调用"""
+        current = self.tree_snapshot
+        nodes = current.nodes
+        if self.tree_snapshot_stale:
+            nodes = PersistentMap.from_items(
+                (item_id, self._snapshot_node(item_id, None)) for item_id in self.data[TREE_TABLE]
+            )
+        elif len(self.tree_dirty) > len(nodes) // 4:
+            # 大部分节点都有变化时一次性构建比逐个复制路径更快，未变化的节点记录照样复用
+            nodes = PersistentMap.from_items(
+                (item_id, self._snapshot_node(item_id, nodes.get(item_id)) if item_id in self.tree_dirty
+                 else nodes.get(item_id) or self._snapshot_node(item_id, None))
+                for item_id in self.data[TREE_TABLE]
+            )
+        elif self.tree_dirty:
+            for item_id in self.tree_dirty:
+                if item_id is None:
+                    continue
+                record = self._snapshot_node(item_id, nodes.get(item_id))
+                nodes = nodes.set(item_id, record) if record is not None else nodes.remove(item_id)
+        else:
+            return
+        if self.tree_snapshot_stale or None in self.tree_dirty:
+            roots = tuple(self.tree_children.get(None, ()))
+        else:
+            roots = current.roots
+        self.tree_dirty = set()
+        self.tree_snapshot_stale = False
+        # 单个引用赋值是原子的，读取方要么看到旧快照要么看到完整的新快照
+        self.tree_snapshot = TreeSnapshot(nodes, roots, current.version + 1)
+        
+    @staticmethod
+    def _leaf_tree_stats(node: Dict[str, Any]) -> Dict[str, Any]:
+        return {"descendant_count": 0, "max_depth": 0, "leaf_count": 1, "latest_at": node.get("created_at"),
+                "min_id": node["id"], "max_id": node["id"]}
+        
+    def _rebuild_tree_stats(self):
+        """全量计算所有节点的子树统计，子节点先于父节点计算，需在锁内调用"""
+        nodes = self.data[TREE_TABLE]
+        stats = {item_id: self._leaf_tree_stats(node) for item_id, node in nodes.items()}
+        order = [
+            item_id
+            for parent_id, siblings in self.tree_children.items()
+            if parent_id is None or parent_id not in nodes
+            for item_id in siblings
+        ]
+        visited = set(order)
+        for item_id in order:
+            for child_id in self.tree_children.get(item_id, ()):
+                if child_id not in visited:
+                    visited.add(child_id)
+                    order.append(child_id)
+        for item_id in reversed(order):
+            children = [stats[child_id] for child_id in self.tree_children.get(item_id, ()) if child_id in stats]
+            if not children:
+                continue
+            current = stats[item_id]
+            current["leaf_count"] = 0
+            for child in children:
+                current["descendant_count"] += child["descendant_count"] + 1
+                current["max_depth"] = max(current["max_depth"], child["max_depth"] + 1)
+                current["leaf_count"] += child["leaf_count"]
+                current["latest_at"] = _later(current["latest_at"], child["latest_at"])
+                current["min_id"] = min(current["min_id"], child["min_id"])
+                current["max_id"] = max(current["max_id"], child["max_id"])
+        self.tree_stats = stats
+        self.tree_snapshot_stale = True
+        
+    def _ancestor_chain(self, item_id) -> List[int]:
+        """节点及其所有祖先的ID，节点不存在时为空，需在锁内调用"""
+        node = self.data[TREE_TABLE].get(item_id) if item_id is not None else None
+        return self.get_ancestor_ids(node) if node is not None else []
+        
+    def _recompute_tree_stats(self, item_id) -> bool:
+        """由子节点的统计重新计算节点的子树深度、最近活动时间和ID范围，返回是否有变化，需在锁内调用"""
+        stats = self.tree_stats[item_id]
+        max_depth = 0
+        latest_at = self.data[TREE_TABLE][item_id].get("created_at")
+        min_id = max_id = item_id
+        for child_id in self.tree_children.get(item_id, ()):
+            child = self.tree_stats.get(child_id)
+            if child is not None:
+                max_depth = max(max_depth, child["max_depth"] + 1)
+                latest_at = _later(latest_at, child["latest_at"])
+                min_id = min(min_id, child["min_id"])
+                max_id = max(max_id, child["max_id"])
+        changed = (max_depth, latest_at, min_id, max_id) != (
+            stats["max_depth"], stats["latest_at"], stats["min_id"], stats["max_id"])
+        stats["max_depth"] = max_depth
+        stats["latest_at"] = latest_at
+        stats["min_id"] = min_id
+        stats["max_id"] = max_id
+        return changed
+        
+    def _attach_tree_stats(self, item_id, parent_id):
+        """把子树的统计累加到父节点及其所有祖先，子树根节点需已加入子节点索引，需在锁内调用"""
+        subtree = self.tree_stats[item_id]
+        # 父节点原来是叶子时，加入子树后它本身不再算作结局
+        leaf_delta = subtree["leaf_count"] - (1 if len(self.tree_children.get(parent_id, ())) == 1 else 0)
+        max_depth = subtree["max_depth"] + 1
+        latest_at = subtree["latest_at"]
+        for ancestor_id in self._ancestor_chain(parent_id):
+            stats = self.tree_stats.get(ancestor_id)
+            if stats is None:
+                break
+            stats["descendant_count"] += subtree["descendant_count"] + 1
+            stats["leaf_count"] += leaf_delta
+            stats["max_depth"] = max(stats["max_depth"], max_depth)
+            stats["latest_at"] = _later(stats["latest_at"], latest_at)
+            stats["min_id"] = min(stats["min_id"], subtree["min_id"])
+            stats["max_id"] = max(stats["max_id"], subtree["max_id"])
+            self.tree_dirty.add(ancestor_id)
+            max_depth = stats["max_depth"] + 1
+            latest_at = stats["latest_at"]
+            
+    def _detach_tree_stats(self, subtree: Dict[str, Any], parent_id):
+        """从原父节点及其所有祖先减去子树的统计，子树根节点需已移出子节点索引，需在锁内调用"""
+        # 父节点失去最后一个子节点后本身成为结局
+        leaf_delta = (0 if self.tree_children.get(parent_id) else 1) - subtree["leaf_count"]
+        dirty = True
+        for ancestor_id in self._ancestor_chain(parent_id):
+            stats = self.tree_stats.get(ancestor_id)
+            if stats is None:
+                break
+            stats["descendant_count"] -= subtree["descendant_count"] + 1
+            stats["leaf_count"] += leaf_delta
+            self.tree_dirty.add(ancestor_id)
+            # 深度、最近活动时间和ID范围需要重新比较子节点，某一层不再变化时更上层也不会变化
+            if dirty:
+                dirty = self._recompute_tree_stats(ancestor_id)
+        
+    def _node_path(self, parent_id: Optional[int], item_id) -> str:
+        """由父节点路径得到节点的物化路径，需在锁内调用"""
+        parent = self.data[TREE_TABLE].get(parent_id) if parent_id is not None else None
+        if parent is None or not parent.get("path"):
+            return str(item_id)
+        return f"{parent['path']}/{item_id}"
+        
+    def _refresh_subtree_paths(self, root_id) -> int:
+        """重新计算节点及其所有子孙的物化路径，返回有变化的节点数，需在锁内调用"""
+        nodes = self.data[TREE_TABLE]
+        changed = 0
+        visited = set()
+        pending = [root_id]
+        while pending:
+            item_id = pending.pop()
+            node = nodes.get(item_id)
+            # 跳过环形数据中已经访问过的节点
+            if node is None or item_id in visited:
+                continue
+            visited.add(item_id)
+            path = self._node_path(node.get("parent_id"), item_id)
+            if node.get("path") != path:
+                node["path"] = path
+                bump_version(node)
+                self.modified[TREE_TABLE].add(item_id)
+                self.tree_dirty.add(item_id)
+                changed += 1
+            pending.extend(self.tree_children.get(item_id, ()))
+        return changed
+        
+    def get_child_ids(self, parent_id: Optional[int]) -> List[int]:
+        """按创建顺序返回子节点ID，parent_id为None时返回起始节点"""
+        with self.lock:
+            return list(self.tree_children.get(parent_id, ()))
+            
+    def count_children(self, parent_id: Optional[int]) -> int:
+        """子节点数量，不需要复制列表"""
+        with self.lock:
+            return len(self.tree_children.get(parent_id, ()))
+            
+    def get_children(self, parent_id: Optional[int]) -> List[Dict[str, Any]]:
+        """按创建顺序返回子节点，parent_id为None时返回起始节点"""
+        with self.lock:
+            nodes = self.data[TREE_TABLE]
+            return [nodes[child_id] for child_id in self.tree_children.get(parent_id, ()) if child_id in nodes]
+            
+    def get_ancestor_ids(self, node: Dict[str, Any]) -> List[int]:
+        """节点自身及其所有祖先的ID，从节点开始直到起始节点"""
+        with self.lock:
+            nodes = self.data[TREE_TABLE]
+            ids = []
+            current = node
+            for _ in range(MAX_ANCESTOR_DEPTH):
+                ids.append(current["id"])
+                parent_id = current.get("parent_id")
+                if parent_id is None:
+                    break
+                current = nodes.get(parent_id)
+                if current is None:
+                    break
+            return ids
+            
+    def get_subtree_ids(self, root_id) -> List[int]:
+        """节点及其所有子孙的ID，先序遍历，不使用递归"""
+        with self.lock:
+            if root_id not in self.data[TREE_TABLE]:
+                return []
+            ids = []
+            visited = set()
+            pending = [root_id]
+            while pending:
+                item_id = pending.pop()
+                if item_id in visited:
+                    continue
+                visited.add(item_id)
+                ids.append(item_id)
+                # 逆序入栈，出栈时按子节点顺序访问
+                pending.extend(reversed(self.tree_children.get(item_id, ())))
+            return ids
+            
+    def get_subtree_items(self, root_id) -> List[Dict[str, Any]]:
+        """一次加锁读取节点及其所有子孙，先序排列"""
+        with self.lock:
+            nodes = self.data[TREE_TABLE]
+            return [nodes[item_id] for item_id in self.get_subtree_ids(root_id)]
+            
+    def get_subtree_children(self, root_id) -> Dict[int, List[int]]:
+        """一次加锁读取子树中每个节点的有序子节点ID，节点不存在时返回空字典"""
+        with self.lock:
+            return {
+                item_id: list(self.tree_children.get(item_id, ()))
+                for item_id in self.get_subtree_ids(root_id)
+            }
+            
+    def add_tree_nodes(self, items: List[Dict[str, Any]]):
+        """一次加锁批量添加新节点，items须按父节点在前的顺序排列，父节点要么在本批中要么已在缓存中"""
+        if not items:
+            return
+        with self.lock:
+            nodes = self.data[TREE_TABLE]
+            batch_ids = {item["id"] for item in items}
+            tops = []
+            for item in items:
+                item_id = item["id"]
+                parent_id = item.get("parent_id")
+                bump_version(item)
+                item["path"] = self._node_path(parent_id, item_id)
+                nodes[item_id] = item
+                self.modified[TREE_TABLE].add(item_id)
+                self.tree_stats[item_id] = self._leaf_tree_stats(item)
+                self.tree_dirty.add(item_id)
+                if parent_id in batch_ids:
+                    self._index_tree_node(item_id, parent_id)
+                else:
+                    tops.append(item)
+            # 先在批内自底向上汇总统计，再把每个批内子树整体累加到已有的祖先上，而不是每个节点都走一遍祖先路径
+            for item in reversed(items):
+                parent_id = item.get("parent_id")
+                if parent_id not in batch_ids:
+                    continue
+                child = self.tree_stats[item["id"]]
+                parent = self.tree_stats[parent_id]
+                if parent["descendant_count"] == 0:
+                    parent["leaf_count"] = 0
+                parent["descendant_count"] += child["descendant_count"] + 1
+                parent["max_depth"] = max(parent["max_depth"], child["max_depth"] + 1)
+                parent["leaf_count"] += child["leaf_count"]
+                parent["latest_at"] = _later(parent["latest_at"], child["latest_at"])
+                parent["min_id"] = min(parent["min_id"], child["min_id"])
+                parent["max_id"] = max(parent["max_id"], child["max_id"])
+            for item in tops:
+                self._index_tree_node(item["id"], item.get("parent_id"))
+                self._attach_tree_stats(item["id"], item.get("parent_id"))
+            self._tree_written()
+        # 批内其余节点都是这些节点的子孙，此前不可能被缓存，只需按批内子树的根通知祖先失效
+        for item in tops:
+            self._notify(TREE_TABLE, "add", item)
+
+    def delete_subtree(self, root_id) -> List[Dict[str, Any]]:
+        """在一次加锁内删除节点及其所有子孙并批量记录删除，返回被删除的节点"""
+        with self.lock:
+            nodes = self.data[TREE_TABLE]
+            root = nodes.get(root_id)
+            if root is None:
+                return []
+            removed = []
+            for item_id in self.get_subtree_ids(root_id):
+                item = nodes.pop(item_id)
+                markdown_renderer.invalidate(item.get("content"))
+                self.tree_children.pop(item_id, None)
+                removed.append(item)
+            self._unindex_tree_node(root_id, root.get("parent_id"))
+            subtree = self.tree_stats.get(root_id)
+            for item in removed:
+                self.tree_stats.pop(item["id"], None)
+            if subtree is not None:
+                self._detach_tree_stats(subtree, root.get("parent_id"))
+            removed_ids = {item["id"] for item in removed}
+            self.deleted[TREE_TABLE].update(removed_ids)
+            self.modified[TREE_TABLE].difference_update(removed_ids)
+            self.tree_dirty.update(removed_ids)
+            self._tree_written()
+        # 子孙节点的父节点已删除，监听器只会沿根节点向上查找祖先
+        for item in removed:
+            self._notify(TREE_TABLE, "delete", item)
+        return removed
+        
+    def get_tree_stats(self, item_id) -> Optional[Dict[str, Any]]:
+        """节点的子树统计副本"""
+        with self.lock:
+            stats = self.tree_stats.get(item_id)
+            return dict(stats) if stats is not None else None
+            
+    def get_path_nodes(self, node: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """从起始节点到该节点路径上的所有节点，按物化路径读取"""
+        with self.lock:
+            nodes = self.data[TREE_TABLE]
+            path = node.get("path")
+            if path:
+                ids = [int(item_id) for item_id in path.split("/")]
+            else:
+                ids = list(reversed(self.get_ancestor_ids(node)))
+            return [nodes[item_id] for item_id in ids if item_id in nodes]
+            
     def get_item(self, data_type: str, item_id: str) -> Optional[Dict[str, Any]]:
         """获取项目，优先从内存缓存获取"""
         with self.lock:
@@ -319,27 +688,80 @@ class EnhancedLocalCache:
     def add_item(self, data_type: str, item_id: str, item_data: Dict[str, Any]):
         """添加项目到缓存"""
         with self.lock:
+            bump_version(item_data)
+            if data_type == TREE_TABLE:
+                previous = self.data[data_type].get(item_id)
+                if previous is not None:
+                    self._unindex_tree_node(item_id, previous.get("parent_id"))
+                self._index_tree_node(item_id, item_data.get("parent_id"))
+                item_data["path"] = self._node_path(item_data.get("parent_id"), item_id)
             self.data[data_type][item_id] = item_data
             self.modified[data_type].add(item_id)
+            if data_type == TREE_TABLE:
+                if previous is not None:
+                    # 替换已有节点时它可能已有子节点，直接全量重算
+                    self._rebuild_tree_stats()
+                else:
+                    self.tree_stats[item_id] = self._leaf_tree_stats(item_data)
+                    self._attach_tree_stats(item_id, item_data.get("parent_id"))
+                self.tree_dirty.add(item_id)
+                self._tree_written()
+        self._notify(data_type, "add", item_data)
             
     def update_item(self, data_type: str, item_id: str, updates: Dict[str, Any]) -> bool:
         """更新缓存中的项目"""
+        moved_from = None
         with self.lock:
             if item_id in self.data[data_type]:
-                self.data[data_type][item_id].update(updates)
+                item = self.data[data_type][item_id]
+                if "content" in updates and updates["content"] != item.get("content"):
+                    markdown_renderer.invalidate(item.get("content"))
+                if data_type == TREE_TABLE and "parent_id" in updates and updates["parent_id"] != item.get("parent_id"):
+                    # 节点移动到新的父节点，原位置的祖先也需要收到通知
+                    moved_from = dict(item)
+                    self._unindex_tree_node(item_id, item.get("parent_id"))
+                    subtree = self.tree_stats.get(item_id)
+                    if subtree is not None:
+                        self._detach_tree_stats(subtree, item.get("parent_id"))
+                    self._index_tree_node(item_id, updates["parent_id"])
+                    if subtree is not None:
+                        self._attach_tree_stats(item_id, updates["parent_id"])
+                item.update(updates)
+                bump_version(self.data[data_type][item_id])
                 self.modified[data_type].add(item_id)
-                return True
-            return False
+                if moved_from is not None:
+                    # 移动后节点及其子孙的物化路径都要更新
+                    self._refresh_subtree_paths(item_id)
+                if data_type == TREE_TABLE:
+                    self.tree_dirty.add(item_id)
+                    self._tree_written()
+            else:
+                return False
+        if moved_from is not None:
+            self._notify(data_type, "update", moved_from)
+        self._notify(data_type, "update", item)
+        return True
             
     def delete_item(self, data_type: str, item_id: str) -> bool:
         """从缓存删除项目"""
         with self.lock:
             if item_id in self.data[data_type]:
-                del self.data[data_type][item_id]
+                item = self.data[data_type].pop(item_id)
+                if data_type == TREE_TABLE:
+                    self._unindex_tree_node(item_id, item.get("parent_id"))
+                    # 只删除单个节点时子节点成为孤立节点，不再计入原祖先的统计
+                    subtree = self.tree_stats.pop(item_id, None)
+                    if subtree is not None:
+                        self._detach_tree_stats(subtree, item.get("parent_id"))
+                    self.tree_dirty.add(item_id)
+                    self._tree_written()
+                markdown_renderer.invalidate(item.get("content"))
                 self.deleted[data_type].add(item_id)
                 self.modified[data_type].discard(item_id)
-                return True
-            return False
+            else:
+                return False
+        self._notify(data_type, "delete", item)
+        return True
             
     def is_db_available(self) -> bool:
         """检查数据库是否可用"""
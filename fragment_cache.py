@@ -0,0 +1,109 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+# 模板片段缓存的容量上限（字节），按片段HTML大小计算
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+class FragmentCache:
+    """模板片段的有界LRU缓存，键中包含实体版本，数据修改后旧片段自然淘汰"""
+
+    def __init__(self, max_bytes: int = FRAGMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[tuple, Markup]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(html: str) -> int:
+        return len(html.encode("utf-8"))
+
+    def get_or_render(self, key: tuple, render: Callable[[], str]) -> Markup:
+        """命中时返回缓存的片段，否则渲染并缓存"""
+        with self.lock:
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        # 在锁外渲染片段
+        html = Markup(render())
+        self._store(key, html)
+        return html
+
+    def _store(self, key: tuple, html: Markup):
+        size = self._entry_size(html)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= self._entry_size(previous)
+            self.entries[key] = html
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= self._entry_size(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        """清空片段缓存"""
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+        logger.info("模板片段缓存已清空")
+
+    def stats(self) -> Dict[str, Any]:
+        """导出命中率和容量统计"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class FragmentCacheExtension(Extension):
+    """模板标签 {% cache 键, ... %}...{% endcache %}，键一般包含 entity_version(标签)"""
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=fragment_cache)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # 键以模板名开头，不同模板的同名片段互不冲突
+        key = [nodes.Const(parser.name), parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_cache_support", [nodes.Tuple(key, "load")]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, key: tuple, caller) -> Markup:
+        return self.environment.fragment_cache.get_or_render(key, caller)
+
+
+# 创建全局片段缓存实例
+fragment_cache = FragmentCache()
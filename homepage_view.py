@@ -0,0 +1,137 @@
+import os
+import bisect
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+from local_cache import local_cache
+from markdown_renderer import render_markdown
+
+logger = logging.getLogger(__name__)
+
+# 首页最多展示的故事卡片数
+HOMEPAGE_STORY_LIMIT = int(os.getenv("HOMEPAGE_STORY_LIMIT", "30"))
+
+
+def generate_story_excerpt(content):
+    """生成故事摘要"""
+    # 分割为段落
+    paragraphs = content.split('\n\n')
+    if not paragraphs:
+        return ''
+
+    # 取第一段
+    first_paragraph = paragraphs[0]
+
+    # 按行分割
+    lines = first_paragraph.split('\n')
+
+    # 如果超过5行，只取前5行
+    if len(lines) > 5:
+        excerpt = '\n'.join(lines[:5]) + '...'
+    else:
+        excerpt = first_paragraph + '...'
+
+    # 转换为HTML
+    return render_markdown(excerpt)
+
+
+def parse_tags(tags) -> List[str]:
+    """把逗号分隔的标签字符串解析为列表"""
+    if isinstance(tags, str):
+        return [tag.strip() for tag in tags.split(',') if tag.strip()]
+    return list(tags) if tags else []
+
+
+class HomepageView:
+    """物化的首页视图：按创建时间倒序的故事卡片，随故事增删改增量更新"""
+
+    def __init__(self, cache=local_cache, limit: int = HOMEPAGE_STORY_LIMIT):
+        self.cache = cache
+        self.limit = limit
+        # 故事ID -> 卡片
+        self.cards: Dict[Any, Dict[str, Any]] = {}
+        # 按 (创建时间, ID) 升序排列的排序键
+        self.order: List[tuple] = []
+        self.lock = threading.Lock()
+        cache.add_listener(self._on_cache_change)
+        self.rebuild()
+
+    @staticmethod
+    def _sort_key(card: Dict[str, Any]) -> tuple:
+        return (card["created_at"], card["id"])
+
+    def _author_name(self, author_id) -> str:
+        author = self.cache.get("users", author_id)
+        return author["username"] if author else "未知作者"
+
+    def _build_card(self, story: Dict[str, Any]) -> Dict[str, Any]:
+        """根据故事行构造卡片，不修改缓存中的行"""
+        return {
+            "id": story["id"],
+            "title": story["title"],
+            "author_id": story["author_id"],
+            "author_name": self._author_name(story["author_id"]),
+            "tags": parse_tags(story.get("tags")),
+            "content_html": generate_story_excerpt(story.get("content") or ""),
+            "created_at": story["created_at"]
+        }
+
+    def rebuild(self):
+        """从缓存全量重建视图"""
+        cards = {story["id"]: self._build_card(story) for story in self.cache.get_all("stories")}
+        order = sorted(self._sort_key(card) for card in cards.values())
+        with self.lock:
+            self.cards = cards
+            self.order = order
+        logger.info(f"首页视图已重建，共 {len(cards)} 个故事")
+
+    def _remove_locked(self, story_id):
+        card = self.cards.pop(story_id, None)
+        if card is None:
+            return
+        key = self._sort_key(card)
+        index = bisect.bisect_left(self.order, key)
+        if index < len(self.order) and self.order[index] == key:
+            del self.order[index]
+
+    def upsert_story(self, story: Dict[str, Any]):
+        """新增或修改故事时更新对应卡片"""
+        card = self._build_card(story)
+        with self.lock:
+            self._remove_locked(story["id"])
+            self.cards[story["id"]] = card
+            bisect.insort(self.order, self._sort_key(card))
+
+    def remove_story(self, story_id):
+        """删除故事时移除对应卡片"""
+        with self.lock:
+            self._remove_locked(story_id)
+
+    def refresh_author(self, author_id, username: Optional[str]):
+        """作者改名或删除时更新其卡片上的作者名"""
+        with self.lock:
+            for card in self.cards.values():
+                if card["author_id"] == author_id:
+                    card["author_name"] = username or "未知作者"
+
+    def _on_cache_change(self, table_name, action, item):
+        if action == "reload" and table_name in ("stories", "users"):
+            self.rebuild()
+        elif table_name == "stories":
+            if action == "delete":
+                self.remove_story(item["id"])
+            else:
+                self.upsert_story(item)
+        elif table_name == "users" and action in ("update", "delete"):
+            self.refresh_author(item["id"], item.get("username") if action == "update" else None)
+
+    def page(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """返回最新的一页故事卡片"""
+        limit = self.limit if limit is None else limit
+        with self.lock:
+            keys = self.order[-limit:] if limit > 0 else []
+            return [self.cards[story_id] for _, story_id in reversed(keys)]
+
+
+# 创建全局首页视图实例
+homepage_view = HomepageView()
@@ -2,8 +2,20 @@ import os
 import json
 import threading
 from datetime import datetime, timedelta
-from database import SessionLocal
 from sqlalchemy.orm import Session
+from query_stats import query_stats
+from database_connection import db_manager
+from markdown_renderer import markdown_renderer
+from cache_loader import load_tables, merge_into_cache
+from cache_sync import (
+    COUNTER_COLUMNS,
+    DELETE_ORDER,
+    bump_version,
+    delete_rows,
+    ensure_schema,
+    flush_counter_deltas,
+    upsert_rows
+)
 
 # 本地缓存类
 class LocalCache:
@@ -32,6 +44,10 @@ class LocalCache:
             "discussions": set(),
             "discussion_comments": set()
         }
+        # 计数列的待同步增量 {表名: {行ID: {列名: 增量}}}
+        self.counter_deltas = {table_name: {} for table_name in COUNTER_COLUMNS}
+        # 数据变更监听器，回调参数为 (表名, 操作, 行)
+        self.listeners = []
         # IP限流缓存
         self.ip_register_times = {}
         self.lock = threading.Lock()
@@ -82,95 +98,35 @@ class LocalCache:
     
     def load_from_db(self, db: Session):
         """从数据库加载初始数据到本地缓存"""
-        from database import (
-            UserDB,
-            StoryDB,
-            StoryChapterDB,
-            ChapterCommentDB,
-            DiscussionDB,
-            DiscussionCommentDB
-        )
+        table_class_map = {
+            table_name: self._get_class_by_table(table_name)
+            for table_name in self.data.keys()
+        }
+        
+        # 在锁外按列投影流式读取，再一次性替换缓存表
+        with query_stats.track_operation("warmup"):
+            loaded = load_tables(db, table_class_map)
         
-        # 加载所有数据
         with self.lock:
-            # 加载用户
-            users = db.query(UserDB).all()
-            for user in users:
-                self.data["users"][user.id] = {
-                    "id": user.id,
-                    "username": user.username,
-                    "email": user.email,
-                    "password_hash": user.password_hash,
-                    "role": user.role,
-                    "registered_at": user.registered_at,
-                    "active_count": user.active_count,
-                    "points": user.points,
-                    "credit": user.credit
-                }
-            
-            # 加载故事
-            stories = db.query(StoryDB).all()
-            for story in stories:
-                self.data["stories"][story.id] = {
-                    "id": story.id,
-                    "title": story.title,
-                    "content": story.content,
-                    "author_id": story.author_id,
-                    "tags": story.tags,
-                    "created_at": story.created_at,
-                    "updated_at": story.updated_at
-                }
-            
-            # 加载章节
-            chapters = db.query(StoryChapterDB).all()
-            for chapter in chapters:
-                self.data["story_chapters"][chapter.id] = {
-                    "id": chapter.id,
-                    "story_id": chapter.story_id,
-                    "content": chapter.content,
-                    "author_id": chapter.author_id,
-                    "author_name": chapter.author_name,
-                    "created_at": chapter.created_at
-                }
-            
-            # 加载章节评论
-            chapter_comments = db.query(ChapterCommentDB).all()
-            for comment in chapter_comments:
-                self.data["chapter_comments"][comment.id] = {
-                    "id": comment.id,
-                    "chapter_id": comment.chapter_id,
-                    "content": comment.content,
-                    "author_id": comment.author_id,
-                    "author_name": comment.author_name,
-                    "created_at": comment.created_at
-                }
-            
-            # 加载讨论
-            discussions = db.query(DiscussionDB).all()
-            for discussion in discussions:
-                self.data["discussions"][discussion.id] = {
-                    "id": discussion.id,
-                    "title": discussion.title,
-                    "content": discussion.content,
-                    "author_id": discussion.author_id,
-                    "author_name": discussion.author_name,
-                    "created_at": discussion.created_at
-                }
-            
-            # 加载讨论评论
-            discussion_comments = db.query(DiscussionCommentDB).all()
-            for comment in discussion_comments:
-                self.data["discussion_comments"][comment.id] = {
-                    "id": comment.id,
-                    "discussion_id": comment.discussion_id,
-                    "content": comment.content,
-                    "author_id": comment.author_id,
-                    "author_name": comment.author_name,
-                    "created_at": comment.created_at
-                }
-            
+            merge_into_cache(self.data, loaded, self.modified, self.deleted, self.counter_deltas)
             self.last_sync_time = datetime.now()
             print("数据已从数据库加载到本地缓存")
+        
+        # 监听器可能回读缓存，必须在释放锁之后通知
+        for table_name in loaded:
+            self._notify(table_name, "reload", None)
+    
+    def add_listener(self, callback):
+        """注册数据变更监听器，操作为add、update、delete或reload"""
+        self.listeners.append(callback)
+    
+    def _notify(self, table_name, action, item):
+        """通知监听器，调用方不能持有self.lock"""
+        for callback in self.listeners:
+            try:
+                callback(table_name, action, item)
+            except Exception as e:
+                print(f"缓存监听器执行失败: {e}")
     
     def get(self, table_name, item_id):
         """从本地缓存获取数据"""
@@ -191,13 +147,16 @@ class LocalCache:
             else:
                 item_id = getattr(item, "id", None)
             if item_id:
+                bump_version(item)
                 self.data[table_name][item_id] = item
                 self.modified[table_name].add(item_id)
                 # 如果之前标记为删除，取消删除标记
                 if item_id in self.deleted[table_name]:
                     self.deleted[table_name].remove(item_id)
-                return item
-            return None
+            else:
+                return None
+        self._notify(table_name, "add", item)
+        return item
     
     def update(self, table_name, item):
         """更新本地缓存中的数据"""
@@ -208,85 +167,93 @@ class LocalCache:
             else:
                 item_id = getattr(item, "id", None)
             if item_id and item_id in self.data[table_name]:
+                bump_version(item)
                 self.data[table_name][item_id] = item
                 self.modified[table_name].add(item_id)
                 # 如果之前标记为删除，取消删除标记
                 if item_id in self.deleted[table_name]:
                     self.deleted[table_name].remove(item_id)
-                return item
-            return None
+            else:
+                return None
+        self._notify(table_name, "update", item)
+        return item
+    
+    def save_rendered(self, table_name, item):
+        """保存补渲染的HTML：记录修改以便同步，但不通知监听器
+
+        HTML由行中未变的内容渲染而来，页面输出不变，不应让依赖该行的页面缓存失效（例如正在流式渲染的页面）。
+        """
+        with self.lock:
+            item_id = item.get("id") if isinstance(item, dict) else getattr(item, "id", None)
+            if item_id is None or item_id not in self.data[table_name]:
+                return None
+            bump_version(item)
+            self.data[table_name][item_id] = item
+            self.modified[table_name].add(item_id)
+        return item
+    
+    def increment(self, table_name, item_id, column, delta=1):
+        """累加计数列：只记录增量，不把整行标记为已修改"""
+        with self.lock:
+            item = self.data.get(table_name, {}).get(item_id)
+            if item is None:
+                return None
+            item[column] = (item.get(column) or 0) + delta
+            deltas = self.counter_deltas[table_name].setdefault(item_id, {})
+            deltas[column] = deltas.get(column, 0) + delta
+            return item
     
     def delete(self, table_name, item_id):
         """从本地缓存删除数据"""
         with self.lock:
             if item_id in self.data[table_name]:
-                del self.data[table_name][item_id]
+                item = self.data[table_name].pop(item_id)
+                if isinstance(item, dict):
+                    markdown_renderer.invalidate(item.get("content"))
                 self.deleted[table_name].add(item_id)
+                self.counter_deltas.get(table_name, {}).pop(item_id, None)
                 # 如果之前标记为修改，取消修改标记
                 if item_id in self.modified[table_name]:
                     self.modified[table_name].remove(item_id)
-                return True
-            return False
-    
-    def sync_to_db(self):
-        """将本地修改同步到数据库"""
-        db = SessionLocal()
-        try:
-            with self.lock:
-                # 同步每个表的数据
-                for table_name in self.data.keys():
-                    self._sync_table(db, table_name)
-                
-                # 提交事务，这是关键！
-                db.commit()
-                
-                self.last_sync_time = datetime.now()
-                print(f"数据已同步到数据库，时间: {self.last_sync_time}")
-                return True
-        except Exception as e:
-            db.rollback()
-            print(f"数据同步失败: {e}")
-            return False
-        finally:
-            db.close()
+            else:
+                return False
+        self._notify(table_name, "delete", item)
+        return True
     
     def sync_to_db(self):
         """将本地修改同步到数据库"""
-        # 检查数据库是否可用
-        from database import is_db_available
-        if not is_db_available():
+        # 通过连接管理器写入主库，与commit_sync写入水位的是同一个数据库
+        db = db_manager.get_session()
+        if db is None:
             print("数据库不可用，跳过同步操作")
             return False
         
-        from database import SessionLocal
-        if not SessionLocal:
-            print("数据库引擎未初始化，跳过同步操作")
-            return False
-        
-        db = SessionLocal()
         try:
-            with self.lock:
-                # 同步删除操作，按照正确的顺序处理外键约束
-                # 1. 先删除所有评论
-                for table_name in ["chapter_comments", "discussion_comments"]:
-                    self._sync_deletes(db, table_name)
-                
-                # 2. 再删除所有章节
-                self._sync_deletes(db, "story_chapters")
+            with query_stats.track_operation("sync"), self.lock:
+                ensure_schema(db)
                 
-                # 3. 最后删除所有主表数据
-                for table_name in ["stories", "discussions"]:
-                    self._sync_deletes(db, table_name)
-                
-                # 4. 删除用户数据
-                self._sync_deletes(db, "users")
+                # 同步删除操作，按照正确的顺序处理外键约束
+                for table_name in DELETE_ORDER:
+                    if table_name in self.deleted:
+                        self._sync_deletes(db, table_name)
                 
                 # 同步修改操作
                 for table_name in self.data.keys():
                     self._sync_modifies(db, table_name)
                 
-                # 提交事务，这是关键！
-                db.commit()
+                # 计数增量每张表一条批量语句
+                for table_name, deltas in self.counter_deltas.items():
+                    flush_counter_deltas(db, self._get_class_by_table(table_name), deltas)
+                
+                # 提交事务并推进同步水位，只读副本追上该水位前读取会回退到主库
+                db_manager.commit_sync(db)
+                
+                # 提交成功后才清空标记，失败时下次同步重试
+                for table_name in self.data.keys():
+                    self.modified[table_name].clear()
+                    self.deleted[table_name].clear()
+                for deltas in self.counter_deltas.values():
+                    deltas.clear()
                 
                 self.last_sync_time = datetime.now()
                 print(f"数据已同步到数据库，时间: {self.last_sync_time}")
@@ -304,46 +271,21 @@ class LocalCache:
         if not model_class:
             return
         
-        # 处理删除的数据
-        for item_id in self.deleted[table_name]:
-            try:
-                # 从数据库删除
-                db.query(model_class).filter(model_class.id == item_id).delete()
-            except Exception as e:
-                print(f"删除 {table_name} {item_id} 失败: {e}")
-        # 清空删除标记
-        self.deleted[table_name].clear()
+        # 批量删除
+        delete_rows(db, model_class, self.deleted[table_name])
     
     def _sync_modifies(self, db: Session, table_name):
-        """同步修改操作"""
+        """同步修改操作：按版本保护的批量盲写，无需逐行查询是否存在"""
         model_class = self._get_class_by_table(table_name)
         if not model_class:
             return
         
-        # 处理修改的数据
-        for item_id in self.modified[table_name]:
-            try:
-                item = self.data[table_name].get(item_id)
-                if item:
-                    # 检查数据库中是否存在
-                    db_item = db.query(model_class).filter(model_class.id == item_id).first()
-                    if db_item:
-                        # 更新现有数据
-                        for column in model_class.__table__.columns:
-                            if column.name != "id":
-                                setattr(db_item, column.name, item.get(column.name))
-                        db.merge(db_item)
-                    else:
-                        # 添加新数据
-                        # 创建模型实例
-                        new_item = model_class()
-                        for column in model_class.__table__.columns:
-                            setattr(new_item, column.name, item.get(column.name))
-                        db.add(new_item)
-            except Exception as e:
-                print(f"同步 {table_name} {item_id} 失败: {e}")
-        # 清空修改标记
-        self.modified[table_name].clear()
+        rows = [
+            self.data[table_name][item_id]
+            for item_id in self.modified[table_name]
+            if item_id in self.data[table_name]
+        ]
+        upsert_rows(db, model_class, rows, self.counter_deltas.get(table_name))
 
 # 创建全局缓存实例
 local_cache = LocalCache()
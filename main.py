@@ -1,88 +1,28 @@
 from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from static_assets import PrecompressedStaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from database import init_db, get_db
-from crud import get_all_stories, get_all_discussions, get_user_by_id
+from crud import get_all_stories, get_all_discussions
 from models import get_current_user
 from sqlalchemy.orm import Session
 from templates_config import templates
-import markdown
 import threading
-import time
 import atexit
 import logging
 from enhanced_local_cache import enhanced_local_cache
+from local_cache import local_cache
 from database_connection import db_manager, get_db_session
+from query_stats import track_request_queries
+from homepage_view import homepage_view
+from sync_service import sync_to_db_periodically, sync_on_shutdown
+from page_cache import PageCacheMiddleware
 from datetime import datetime, timedelta
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_story_excerpt(content):
-    """生成故事摘要"""
-    # 分割为段落
-    paragraphs = content.split('\n\n')
-    if not paragraphs:
-        return ''
-    
-    # 取第一段
-    first_paragraph = paragraphs[0]
-    
-    # 按行分割
-    lines = first_paragraph.split('\n')
-    
-    # 如果超过5行，只取前5行
-    if len(lines) > 5:
-        excerpt = '\n'.join(lines[:5]) + '...'
-    else:
-        excerpt = first_paragraph + '...'
-    
-    # 转换为HTML
-    return markdown.markdown(excerpt)
-
-# 定时同步函数 - 增强版本
-def sync_to_db_periodically():
-    """每分钟同步一次数据到数据库，支持重连和回退"""
-    retry_count = 0
-    max_retries = 3
-    
-    while True:
-        try:
-            logger.info("开始定期数据同步...")
-            
-            # 尝试同步到数据库
-            if enhanced_local_cache.sync_to_db_with_fallback():
-                logger.info("定期数据同步成功")
-                retry_count = 0  # 重置重试计数
-            else:
-                logger.warning("定期数据同步失败，使用临时存储")
-                
-        except Exception as e:
-            logger.error(f"定期数据同步异常: {str(e)}")
-            retry_count += 1
-            
-            if retry_count >= max_retries:
-                logger.error("达到最大重试次数，暂停同步一段时间")
-                time.sleep(300)  # 暂停5分钟
-                retry_count = 0
-                
-        time.sleep(60)  # 每分钟同步一次
-
-# 服务器关闭时的同步函数 - 增强版本
-def sync_on_shutdown():
-    """服务器关闭时同步数据到数据库，支持重连和回退"""
-    logger.info("正在同步数据到数据库...")
-    try:
-        if enhanced_local_cache.sync_to_db_with_fallback():
-            logger.info("数据同步完成")
-        else:
-            logger.warning("数据同步失败，数据已保存到临时存储")
-    except Exception as e:
-        logger.error(f"关闭时数据同步异常: {str(e)}")
-        logger.warning("数据可能未完全同步，请检查临时存储")
-
 # 初始化增强本地缓存
 def init_enhanced_local_cache():
     """初始化增强本地缓存，支持数据库重连和临时存储回退"""
@@ -98,6 +38,18 @@ def init_enhanced_local_cache():
         logger.error(f"增强本地缓存初始化异常: {str(e)}")
         logger.warning("将使用空缓存启动，数据库连接恢复后会自动同步数据")
 
+# 初始化本地缓存（crud和首页视图使用的缓存）
+def init_local_cache():
+    """从数据库预热本地缓存，优先使用已追上同步水位的只读副本"""
+    if not db_manager.is_connection_available():
+        logger.warning("数据库不可用，本地缓存将使用空缓存启动")
+        return
+    try:
+        db_manager.execute_read_with_retry(local_cache.load_from_db)
+        logger.info("本地缓存预热成功")
+    except Exception as e:
+        logger.error(f"本地缓存预热失败: {str(e)}")
+
 # 导入路由
 from routers import stories, comments, discussions, auth, admin, health, tree
 # 创建FastAPI应用
@@ -110,14 +62,21 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# SQL语句统计：将请求内执行的语句归属到匹配的路由
+app.middleware("http")(track_request_queries)
+# 匿名用户的整页缓存，命中时不再进入路由和语句统计
+app.add_middleware(PageCacheMiddleware)
 # 配置静态文件
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 # 初始化数据库 - 注释掉自动调用，避免消耗查询次数
 # init_db()
 
 # 初始化增强本地缓存
 init_enhanced_local_cache()
 
+# 预热本地缓存，首页视图随之重建
+init_local_cache()
+
 # 启动增强的定时同步线程
 logger.info("启动增强的定时同步线程...")
 sync_thread = threading.Thread(target=sync_to_db_periodically, daemon=True, name="EnhancedSyncThread")
@@ -143,13 +102,8 @@ async def read_root(request: Request, db: Session = Depends(get_db)):
         if not enhanced_local_cache.is_db_available():
             logger.warning("数据库连接不可用，使用本地缓存数据")
             
-        # 从增强本地缓存获取数据
-        stories_data = enhanced_local_cache.data.get("stories", {})
-        discussions_data = enhanced_local_cache.data.get("discussions", {})
-        
-        # 转换数据格式
-        stories = list(stories_data.values())
-        discussions = list(discussions_data.values())
+        # 从物化的首页视图获取最新一页故事卡片，摘要、作者名和标签已预先计算
+        stories = homepage_view.page()
         
         # 尝试获取当前用户信息
         current_user = None
@@ -159,15 +113,9 @@ async def read_root(request: Request, db: Session = Depends(get_db)):
             logger.warning(f"获取用户信息失败: {str(e)}")
             # 继续处理，即使用户信息获取失败
             
-        # 生成故事摘要
-        for story in stories:
-            if 'content' in story:
-                story['excerpt'] = generate_story_excerpt(story['content'])
-                
         return templates.TemplateResponse("index.html", {
             "request": request,
             "stories": stories,
-            "discussions": discussions,
             "current_user": current_user
         })
         
@@ -184,33 +132,6 @@ async def read_root(request: Request, db: Session = Depends(get_db)):
         </body>
         </html>
         """, status_code=503)
-    
-    # 为故事添加渲染内容
-    story_with_authors = []
-    for story in stories:
-        # 从本地缓存获取作者
-        author = get_user_by_id(db, story["author_id"])
-        # 创建一个新的字典，添加作者名称
-        story_dict = story.copy()
-        story_dict["author_name"] = author["username"] if author else "未知作者"
-        # 渲染故事摘要为HTML用于显示
-        story_dict["content_html"] = generate_story_excerpt(story["content"])
-        # 处理标签
-        if isinstance(story["tags"], str):
-            story_dict["tags"] = [tag.strip() for tag in story["tags"].split(',') if tag.strip()]
-        elif not story["tags"]:
-            story_dict["tags"] = []
-        story_with_authors.append(story_dict)
-    
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "stories": story_with_authors,
-            "discussions": discussions,
-            "current_user": current_user
-        }
-    )
 @app.get("/about", response_class=HTMLResponse)
 async def read_about(request: Request, db: Session = Depends(get_db)):
     current_user = await get_current_user(request, db)
@@ -0,0 +1,166 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Iterable, Optional
+import markdown
+
+logger = logging.getLogger(__name__)
+
+# 渲染缓存的容量上限（字节），按缓存的HTML大小计算
+MARKDOWN_CACHE_MAX_BYTES = int(os.getenv("MARKDOWN_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# 渲染时启用的Markdown扩展
+MARKDOWN_EXTENSIONS = []
+
+# 渲染器版本，修改扩展或渲染选项时递增，已保存的HTML会被重新渲染
+RENDERER_VERSION = 1
+
+
+def content_hash(content: str) -> str:
+    """计算内容哈希，作为渲染缓存的键"""
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class MarkdownRenderer:
+    """共享的Markdown渲染服务，按内容哈希做有界LRU缓存"""
+
+    def __init__(self, max_bytes: int = MARKDOWN_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(content: str) -> str:
+        # 键中包含渲染器版本，版本变更后不会取到旧扩展渲染的HTML
+        return f"{RENDERER_VERSION}:{content_hash(content)}"
+
+    @staticmethod
+    def _entry_size(html: str) -> int:
+        return len(html.encode("utf-8"))
+
+    def render(self, content: Optional[str]) -> str:
+        """渲染Markdown，相同内容只渲染一次"""
+        if not content:
+            return ""
+        key = self._cache_key(content)
+        with self.lock:
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        # 在锁外渲染，避免长文本阻塞其他请求
+        html = markdown.markdown(content, extensions=MARKDOWN_EXTENSIONS)
+        self._store(key, html)
+        return html
+
+    def _store(self, key: str, html: str):
+        size = self._entry_size(html)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= self._entry_size(previous)
+            self.entries[key] = html
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= self._entry_size(evicted)
+                self.evictions += 1
+
+    def invalidate(self, content: Optional[str]) -> bool:
+        """移除某段内容的渲染结果"""
+        if not content:
+            return False
+        with self.lock:
+            html = self.entries.pop(self._cache_key(content), None)
+            if html is None:
+                return False
+            self.current_bytes -= self._entry_size(html)
+            return True
+
+    def clear(self):
+        """清空渲染缓存"""
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+        logger.info("Markdown渲染缓存已清空")
+
+    def stats(self) -> Dict[str, Any]:
+        """导出命中率和容量统计"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def reset_stats(self):
+        """清零命中统计"""
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+# 创建全局渲染服务实例
+markdown_renderer = MarkdownRenderer()
+
+
+def render_markdown(content: Optional[str]) -> str:
+    """使用全局渲染缓存渲染Markdown"""
+    return markdown_renderer.render(content)
+
+
+def render_markdown_uncached(content: Optional[str]) -> str:
+    """不经过渲染缓存直接渲染，用于请求参数等不可信的一次性内容，避免挤出缓存中的正文"""
+    if not content:
+        return ""
+    return markdown.markdown(content, extensions=MARKDOWN_EXTENSIONS)
+
+
+def render_content_html(item: Dict[str, Any]) -> Dict[str, Any]:
+    """写入时预渲染：把content的HTML和渲染器版本保存到行中"""
+    item["content_html"] = markdown_renderer.render(item.get("content"))
+    item["content_html_version"] = RENDERER_VERSION
+    return item
+
+
+def is_rendered(item: Dict[str, Any]) -> bool:
+    """行中是否已有当前渲染器版本的HTML"""
+    return item.get("content_html") is not None and item.get("content_html_version") == RENDERER_VERSION
+
+
+def ensure_content_html(item: Dict[str, Any], on_backfill: Optional[Callable[[Dict[str, Any]], Any]] = None) -> str:
+    """返回行的预渲染HTML，旧行缺少HTML或版本过期时补渲染，并通过on_backfill写回"""
+    if not is_rendered(item):
+        render_content_html(item)
+        if on_backfill:
+            on_backfill(item)
+    return item["content_html"]
+
+
+def rerender_stale(items: Iterable[Dict[str, Any]], on_backfill: Optional[Callable[[Dict[str, Any]], Any]] = None) -> int:
+    """批量重新渲染版本过期的行，返回重新渲染的行数"""
+    count = 0
+    for item in items:
+        if not is_rendered(item):
+            render_content_html(item)
+            if on_backfill:
+                on_backfill(item)
+            count += 1
+    return count
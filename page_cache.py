@@ -0,0 +1,394 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode
+from starlette.requests import Request
+from starlette.routing import Match
+from models import get_current_user_id
+from cache_versions import entity_versions, story_tag, discussion_tag, tree_node_tag, tree_path_tags, user_tag
+
+logger = logging.getLogger(__name__)
+
+# 整页缓存的容量上限（字节），按响应体大小计算
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# 缓存页面保持新鲜的秒数，依赖标签失效时会提前移除
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "60"))
+
+# 过期后仍可直接返回旧页面、同时在后台重新渲染的秒数
+PAGE_CACHE_STALE_TTL = float(os.getenv("PAGE_CACHE_STALE_TTL", "300"))
+
+# 匿名页面允许浏览器和反向代理直接复用的秒数，默认每次都用ETag重新验证
+PAGE_PUBLIC_MAX_AGE = int(os.getenv("PAGE_PUBLIC_MAX_AGE", "0"))
+
+# 匿名页面的缓存策略，登录用户的页面只允许浏览器私有缓存且每次重新验证
+PUBLIC_CACHE_CONTROL = f"public, max-age={PAGE_PUBLIC_MAX_AGE}, must-revalidate"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def _id(value):
+    """路径参数规范化为与缓存行一致的整数ID"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+# 对匿名用户整页缓存的页面：路由模板 -> 依赖标签
+CACHED_PAGES: Dict[str, Callable[[Dict[str, Any]], List[str]]] = {
+    "/": lambda params: ["stories", "users"],
+    "/stories/{story_id}": lambda params: [story_tag(_id(params["story_id"])), "users", "discussions"],
+    "/discussions": lambda params: ["discussions"],
+    "/discussions/{discussion_id}": lambda params: [discussion_tag(_id(params["discussion_id"]))],
+    "/tree": lambda params: ["tree_roots"],
+    "/tree/node/{node_id}": lambda params: [tree_node_tag(_id(params["node_id"]))],
+    "/api/stories/{story_id}/chapters": lambda params: [story_tag(_id(params["story_id"]))],
+    # 展开接口的坐标来自整棵树的布局
+    "/api/tree/{root_id}/nodes/{node_id}": lambda params: [tree_node_tag(_id(params["root_id"])),
+                                                           tree_node_tag(_id(params["node_id"]))],
+    # 探索页显示从起始节点开始的整条路径
+    "/tree/explore/{node_id}": lambda params: tree_path_tags(_id(params["node_id"])),
+}
+
+# 带ETag和Last-Modified的页面，不适合整页缓存但可以回答条件请求的页面也加在这里
+VALIDATED_PAGES: Dict[str, Callable[[Dict[str, Any]], List[str]]] = dict(CACHED_PAGES)
+
+
+def match_route(scope) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """按应用的路由表匹配请求，返回路由模板和路径参数"""
+    app = scope.get("app")
+    router = getattr(app, "router", None)
+    for route in getattr(router, "routes", []):
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", None), child_scope.get("path_params", {})
+    return None
+
+
+def page_cache_key(scope) -> str:
+    """缓存键：路径加排序后的查询参数"""
+    query = scope.get("query_string", b"").decode("latin-1")
+    if not query:
+        return scope["path"]
+    return scope["path"] + "?" + urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+
+
+@dataclass
+class CachedPage:
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    tags: List[str]
+    stored_at: float
+
+
+class PageCache:
+    """匿名用户的整页响应缓存：依赖标签精确失效、过期后先返回旧页面再后台刷新、并发未命中只渲染一次"""
+
+    def __init__(self, max_bytes: int = PAGE_CACHE_MAX_BYTES, ttl: float = PAGE_CACHE_TTL,
+                 stale_ttl: float = PAGE_CACHE_STALE_TTL, versions=entity_versions):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.versions = versions
+        self.entries: "OrderedDict[str, CachedPage]" = OrderedDict()
+        # 依赖标签 -> 缓存键
+        self.tag_index: Dict[str, Set[str]] = {}
+        self.current_bytes = 0
+        # 正在渲染的缓存键 -> 渲染结果
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.background: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.revalidations = 0
+        self.invalidations = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+        versions.add_listener(self.invalidate_tags)
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        with self.lock:
+            page = self.entries.get(key)
+            if page is not None:
+                self.entries.move_to_end(key)
+            return page
+
+    def store(self, key: str, page: CachedPage):
+        if len(page.body) > self.max_bytes:
+            return
+        with self.lock:
+            self._remove_locked(key)
+            self.entries[key] = page
+            self.current_bytes += len(page.body)
+            for tag in page.tags:
+                self.tag_index.setdefault(tag, set()).add(key)
+            while self.current_bytes > self.max_bytes:
+                self._remove_locked(next(iter(self.entries)))
+
+    def _remove_locked(self, key: str):
+        page = self.entries.pop(key, None)
+        if page is None:
+            return
+        self.current_bytes -= len(page.body)
+        for tag in page.tags:
+            keys = self.tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_index[tag]
+
+    def invalidate_tags(self, tags):
+        """移除依赖这些标签的页面，None表示全部移除"""
+        if tags is None:
+            self.clear()
+            return
+        with self.lock:
+            for tag in tags:
+                for key in list(self.tag_index.get(tag, ())):
+                    self._remove_locked(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        """清空整页缓存"""
+        with self.lock:
+            self.entries.clear()
+            self.tag_index.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """导出命中率和容量统计"""
+        with self.lock:
+            lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "revalidations": self.revalidations,
+                "invalidations": self.invalidations,
+                "not_modified": self.not_modified,
+                "hit_rate": round((self.hits + self.stale_hits + self.coalesced) / lookups, 4) if lookups else 0.0
+            }
+
+    def reset_stats(self):
+        """清零命中统计"""
+        with self.lock:
+            self.hits = 0
+            self.stale_hits = 0
+            self.misses = 0
+            self.coalesced = 0
+            self.revalidations = 0
+            self.invalidations = 0
+            self.not_modified = 0
+
+    async def serve(self, app, scope, receive, send, key: str, tags: List[str]):
+        """从缓存返回页面，未命中时渲染并缓存"""
+        page = self.get(key)
+        if page is not None:
+            age = time.monotonic() - page.stored_at
+            if age <= self.ttl:
+                self.hits += 1
+                await send_page(page, send, b"hit")
+                return
+            if age <= self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._revalidate_in_background(app, scope, key, tags)
+                await send_page(page, send, b"stale")
+                return
+
+        future = self.inflight.get(key)
+        if future is not None:
+            # 同一页面正在渲染，等待其结果而不是重复渲染
+            self.coalesced += 1
+            page = await asyncio.shield(future)
+            if page is not None:
+                await send_page(page, send, b"hit")
+            else:
+                await app(scope, receive, send)
+            return
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        page = None
+        try:
+            page = await self._render(app, scope, receive, send, key, tags)
+        finally:
+            self.inflight.pop(key, None)
+            future.set_result(page)
+
+    def _revalidate_in_background(self, app, scope, key: str, tags: List[str]):
+        if key in self.inflight:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        task = asyncio.ensure_future(self._revalidate(app, scope, key, tags, future))
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def _revalidate(self, app, scope, key: str, tags: List[str], future: asyncio.Future):
+        page = None
+        try:
+            self.revalidations += 1
+            page = await self._render(app, anonymous_scope(scope), _background_receive(), None, key, tags)
+        except Exception as e:
+            logger.error(f"页面后台刷新失败 {key}: {str(e)}")
+        finally:
+            self.inflight.pop(key, None)
+            future.set_result(page)
+
+    async def _render(self, app, scope, receive, send, key: str, tags: List[str]) -> Optional[CachedPage]:
+        """渲染页面并同时转发给客户端，渲染期间依赖未变化时才写入缓存"""
+        versions = self.versions.snapshot(tags)
+        start = {}
+        chunks = []
+
+        async def tee(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            if send is not None:
+                await send(message)
+
+        await app(scope, receive, tee)
+
+        headers = [(name, value) for name, value in start.get("headers", [])
+                   if name.lower() not in (b"content-length", b"transfer-encoding")]
+        if start.get("status") != 200 or any(name.lower() == b"set-cookie" for name, _ in headers):
+            return None
+        if self.versions.snapshot(tags) != versions:
+            # 渲染期间数据已被修改，页面可能包含旧数据
+            return None
+        page = CachedPage(start["status"], headers, b"".join(chunks), list(tags), time.monotonic())
+        self.store(key, page)
+        return page
+
+
+def anonymous_scope(scope) -> Dict[str, Any]:
+    """后台刷新使用的请求副本，去掉Cookie和条件请求头"""
+    dropped = (b"cookie", b"if-none-match", b"if-modified-since")
+    copied = dict(scope)
+    copied["headers"] = [(name, value) for name, value in scope.get("headers", []) if name.lower() not in dropped]
+    return copied
+
+
+def _background_receive():
+    """后台刷新没有请求体，之后的receive一直挂起直到响应结束"""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    return receive
+
+
+async def send_page(page: CachedPage, send, status: bytes):
+    headers = page.headers + [
+        (b"content-length", str(len(page.body)).encode("latin-1")),
+        (b"x-page-cache", status)
+    ]
+    await send({"type": "http.response.start", "status": page.status, "headers": headers})
+    await send({"type": "http.response.body", "body": page.body})
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match使用弱比较"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return any(candidate.removeprefix("W/") == etag.removeprefix("W/") for candidate in candidates)
+
+
+def is_not_modified(headers, etag: str, last_modified) -> bool:
+    """条件请求判断，有If-None-Match时只比较ETag
+
+    If-Modified-Since只精确到秒，客户端可能在修改的同一秒内取得过页面，因此只有版本时间严格早于该时间才返回304。
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified < parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _with_headers(send, headers: List[Tuple[bytes, bytes]]):
+    """只给200响应加上验证头"""
+    async def wrapped(message):
+        if message["type"] == "http.response.start" and message["status"] == 200:
+            message = dict(message, headers=list(message.get("headers", [])) + headers)
+        await send(message)
+
+    return wrapped
+
+
+class PageCacheMiddleware:
+    """ASGI中间件：内容页先按依赖版本回答条件请求，匿名用户的GET请求再经过整页缓存，登录用户的页面各不相同，直接渲染"""
+
+    def __init__(self, app, cache: Optional[PageCache] = None):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        matched = match_route(scope)
+        tags_for = VALIDATED_PAGES.get(matched[0]) if matched else None
+        if tags_for is None:
+            await self.app(scope, receive, send)
+            return
+
+        cache = self.cache or page_cache
+        request = Request(scope)
+        user_id = get_current_user_id(request)
+        key = page_cache_key(scope)
+        tags = tags_for(matched[1])
+        if user_id is not None:
+            # 登录用户的页面头部显示用户信息
+            tags = tags + [user_tag(user_id)]
+
+        # 在渲染之前由依赖版本计算验证头
+        etag = cache.versions.etag(key, tags, "" if user_id is None else str(user_id))
+        last_modified = cache.versions.last_modified(tags)
+        headers = [
+            (b"etag", etag.encode("latin-1")),
+            (b"last-modified", format_datetime(last_modified, usegmt=True).encode("latin-1")),
+            (b"cache-control", (PUBLIC_CACHE_CONTROL if user_id is None else PRIVATE_CACHE_CONTROL).encode("latin-1")),
+            (b"vary", b"Cookie")
+        ]
+        if is_not_modified(request.headers, etag, last_modified):
+            cache.not_modified += 1
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        send = _with_headers(send, headers)
+        if user_id is None and matched[0] in CACHED_PAGES:
+            await cache.serve(self.app, scope, receive, send, key, tags)
+        else:
+            await self.app(scope, receive, send)
+
+
+# 创建全局整页缓存实例
+page_cache = PageCache()
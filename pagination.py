@@ -0,0 +1,50 @@
+import json
+import base64
+import bisect
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def sort_key(item: Dict[str, Any]) -> tuple:
+    """章节和评论按 (创建时间, ID) 排序，游标基于同一排序键"""
+    return (item["created_at"], item["id"])
+
+
+def encode_cursor(item: Dict[str, Any]) -> str:
+    """把一行的排序键编码为不透明的游标字符串"""
+    created_at = item["created_at"]
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, item["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """解析游标，格式或类型错误时抛出ValueError
+
+    排序键是不带时区的时间和整数ID，类型不同的游标在比较时会抛出TypeError，这里提前拒绝。
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+        created_at = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+    if created_at.tzinfo is not None or not isinstance(item_id, int) or isinstance(item_id, bool):
+        raise ValueError(f"无效的游标: {cursor}")
+    return (created_at, item_id)
+
+
+def page_start(items: List[Dict[str, Any]], after: Optional[str]) -> int:
+    """游标之后第一行在已排序列表中的位置"""
+    if not after:
+        return 0
+    return bisect.bisect_right([sort_key(item) for item in items], decode_cursor(after))
+
+
+def paginate(items: List[Dict[str, Any]], after: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """从已按sort_key排序的列表中取游标之后的一页，返回本页和下一页游标"""
+    start = page_start(items, after)
+    page = items[start:start + limit]
+    next_cursor = encode_cursor(page[-1]) if page and start + limit < len(items) else None
+    return page, next_cursor
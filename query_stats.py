@@ -0,0 +1,311 @@
+import os
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# 单次操作（一次请求、一次同步、一次预热）允许执行的SQL语句数量
+QUERY_BUDGET_PER_OPERATION = int(os.getenv("QUERY_BUDGET_PER_OPERATION", "100"))
+
+# 延迟直方图的桶上界（毫秒），最后一个桶收集所有更慢的语句
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# 不属于任何操作的语句归入该名称
+UNTRACKED_OPERATION = "untracked"
+
+# 语句规范化用的正则
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+)"
+_IN_LIST = re.compile(r"\bIN\s*\(\s*" + _PLACEHOLDER + r"(?:\s*,\s*" + _PLACEHOLDER + r")*\s*\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(r"\bVALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+_current_operation: ContextVar = ContextVar("current_operation", default=None)
+
+
+def normalize_statement(statement: str) -> str:
+    """规范化SQL语句，去掉字面量和参数个数差异，便于按语句聚合"""
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    normalized = _STRING_LITERAL.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _IN_LIST.sub("IN (...)", normalized)
+    normalized = _VALUES_LIST.sub(r"VALUES \1, ...", normalized)
+    return normalized
+
+
+class StatementStats:
+    """单条规范化语句的统计"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed: float, rows: int):
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.rows += rows
+        elapsed_ms = elapsed * 1000
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.histogram[index] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def merge(self, other: "StatementStats"):
+        self.count += other.count
+        self.total_time += other.total_time
+        self.max_time = max(self.max_time, other.max_time)
+        self.rows += other.rows
+        for index, value in enumerate(other.histogram):
+            self.histogram[index] += value
+
+    def to_dict(self, statement: str) -> Dict[str, Any]:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "statement": statement,
+            "count": self.count,
+            "rows": self.rows,
+            "total_ms": round(self.total_time * 1000, 3),
+            "avg_ms": round(self.total_time * 1000 / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_time * 1000, 3),
+            "histogram": dict(zip(labels, self.histogram))
+        }
+
+
+class OperationContext:
+    """一次正在进行的操作，收集该次操作内执行的语句"""
+
+    def __init__(self, name: str, budget: int):
+        self.name = name
+        self.budget = budget
+        self.statement_count = 0
+        self.statements: Dict[str, StatementStats] = {}
+        self.lock = threading.Lock()
+
+    def record(self, statement: str, elapsed: float, rows: int):
+        with self.lock:
+            self.statement_count += 1
+            stats = self.statements.get(statement)
+            if stats is None:
+                stats = self.statements[statement] = StatementStats()
+            stats.record(elapsed, rows)
+            return stats
+
+
+class OperationStats:
+    """某类操作的累计统计"""
+
+    def __init__(self):
+        self.runs = 0
+        self.total_statements = 0
+        self.max_statements_per_run = 0
+        self.budget_exceeded_runs = 0
+        self.statements: Dict[str, StatementStats] = {}
+
+
+class QueryStats:
+    """SQL语句统计，按操作归属记录次数、延迟直方图和行数"""
+
+    def __init__(self, budget: int = QUERY_BUDGET_PER_OPERATION):
+        self.budget = budget
+        self.operations: Dict[str, OperationStats] = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def track_operation(self, name: str, budget: Optional[int] = None):
+        """将块内执行的语句归属到指定操作，嵌套时沿用外层操作"""
+        current = _current_operation.get()
+        if current is not None:
+            yield current
+            return
+
+        operation = OperationContext(name, budget if budget is not None else self.budget)
+        token = _current_operation.set(operation)
+        try:
+            yield operation
+        finally:
+            _current_operation.reset(token)
+            self._finish_operation(operation)
+
+    def record_statement(self, statement: str, elapsed: float, rows: int) -> StatementStats:
+        """记录一条已执行的语句，返回对应的统计对象以便之后累加读取的行数"""
+        normalized = normalize_statement(statement)
+        operation = _current_operation.get()
+        if operation is not None:
+            return operation.record(normalized, elapsed, rows)
+
+        # 操作之外的语句直接计入汇总
+        with self.lock:
+            operation_stats = self._get_operation_stats(UNTRACKED_OPERATION)
+            operation_stats.total_statements += 1
+            stats = operation_stats.statements.get(normalized)
+            if stats is None:
+                stats = operation_stats.statements[normalized] = StatementStats()
+            stats.record(elapsed, rows)
+            return stats
+
+    def _get_operation_stats(self, name: str) -> OperationStats:
+        operation_stats = self.operations.get(name)
+        if operation_stats is None:
+            operation_stats = self.operations[name] = OperationStats()
+        return operation_stats
+
+    def _finish_operation(self, operation: OperationContext):
+        """操作结束时合并统计并检查预算"""
+        exceeded = operation.budget > 0 and operation.statement_count > operation.budget
+        if exceeded:
+            logger.warning(
+                f"操作 {operation.name} 执行了 {operation.statement_count} 条SQL语句，"
+                f"超出预算 {operation.budget}"
+            )
+
+        with self.lock:
+            operation_stats = self._get_operation_stats(operation.name)
+            operation_stats.runs += 1
+            operation_stats.total_statements += operation.statement_count
+            operation_stats.max_statements_per_run = max(
+                operation_stats.max_statements_per_run, operation.statement_count
+            )
+            if exceeded:
+                operation_stats.budget_exceeded_runs += 1
+            for statement, stats in operation.statements.items():
+                merged = operation_stats.statements.get(statement)
+                if merged is None:
+                    merged = operation_stats.statements[statement] = StatementStats()
+                merged.merge(stats)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出当前统计"""
+        with self.lock:
+            operations = {}
+            for name, operation_stats in self.operations.items():
+                statements = sorted(
+                    operation_stats.statements.items(),
+                    key=lambda item: item[1].total_time,
+                    reverse=True
+                )
+                operations[name] = {
+                    "runs": operation_stats.runs,
+                    "total_statements": operation_stats.total_statements,
+                    "max_statements_per_run": operation_stats.max_statements_per_run,
+                    "budget_exceeded_runs": operation_stats.budget_exceeded_runs,
+                    "statements": [stats.to_dict(statement) for statement, stats in statements]
+                }
+            return {
+                "budget_per_operation": self.budget,
+                "operations": operations
+            }
+
+    def reset(self):
+        """清空统计"""
+        with self.lock:
+            self.operations.clear()
+
+
+# 创建全局语句统计实例
+query_stats = QueryStats()
+
+
+async def track_request_queries(request, call_next):
+    """HTTP中间件：将请求内执行的语句归属到匹配的路由
+
+    call_next在响应头就绪时返回，流式响应的正文（模板边渲染边发送）之后才生成，
+    因此操作在响应体发送完后才结束，渲染期间执行的语句也归属到该路由。
+    """
+    if _current_operation.get() is not None:
+        return await call_next(request)
+
+    operation = OperationContext(f"{request.method} (unmatched)", query_stats.budget)
+    token = _current_operation.set(operation)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        query_stats._finish_operation(operation)
+        raise
+    finally:
+        _current_operation.reset(token)
+    route = request.scope.get("route")
+    if route is not None:
+        operation.name = f"{request.method} {route.path}"
+
+    body = response.body_iterator
+
+    async def body_then_finish():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            query_stats._finish_operation(operation)
+
+    response.body_iterator = body_then_finish()
+    return response
+
+
+class _RowCountingCursor:
+    """包装DBAPI游标，统计查询语句实际取回的行数（SELECT的rowcount通常为-1）"""
+
+    def __init__(self, cursor, stats: StatementStats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    if cursor.description is not None and context is not None:
+        # 查询语句的行数在结果被读取时累加
+        stats = query_stats.record_statement(statement, elapsed, 0)
+        context.cursor = _RowCountingCursor(cursor, stats)
+        return
+    rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+    query_stats.record_statement(statement, elapsed, rows)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # 执行失败的语句不会触发after_cursor_execute，弹出对应的开始时间
+    connection = exception_context.connection
+    if connection is not None:
+        start_times = connection.info.get("query_start_time")
+        if start_times:
+            start_times.pop()
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Request, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from typing import Optional
+from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from templates_config import templates
 from database import (
     get_db,
@@ -12,6 +13,8 @@ from database import (
 )
 from crud import get_statistics, get_all_users, get_all_stories, get_all_discussions
 from models import get_current_user
+from enhanced_local_cache import enhanced_local_cache
+from tree_transfer import TreeImporter, export_lines
 from sqlalchemy.orm import Session
 router = APIRouter()
 # 管理员权限检查
@@ -192,3 +195,67 @@ async def remove_admin(
     return RedirectResponse(url="/admin/users", status_code=303)
 
 
+@router.post("/admin/rerender")
+
+
+async def rerender_content(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=303)
+    
+    # 渲染器版本变更后批量重新渲染预渲染HTML
+    from crud import rerender_all_content
+    from routers.tree import rerender_tree_nodes
+    rerender_all_content(db)
+    rerender_tree_nodes()
+    
+    return RedirectResponse(url="/admin", status_code=303)
+
+
+@router.get("/admin/tree/export")
+
+
+async def export_tree(
+    root_id: int,
+    current_user: dict = Depends(require_admin)
+):
+    if not current_user:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    if enhanced_local_cache.get_tree_snapshot().get(root_id) is None:
+        raise HTTPException(status_code=404, detail="节点不存在")
+    
+    # 逐行流式输出，不在内存中拼出整个文件
+    return StreamingResponse(
+        export_lines(root_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="story-tree-{root_id}.ndjson"'}
+    )
+
+
+@router.post("/admin/tree/import")
+
+
+async def import_tree(
+    request: Request,
+    parent_id: Optional[int] = None,
+    author_id: Optional[int] = None,
+    current_user: dict = Depends(require_admin)
+):
+    if not current_user:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    try:
+        # 作者在本环境不存在的节点归到执行导入的管理员名下
+        importer = TreeImporter(parent_id, author_id, fallback_author_id=current_user["id"])
+        # 请求体按块读取，凑齐一行就交给导入器，已写入的批次不会回滚
+        pending = b""
+        async for chunk in request.stream():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                importer.feed(line)
+        importer.feed(pending)
+        return importer.finish()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
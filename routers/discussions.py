@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
 from models import get_current_user
-from templates_config import templates
+from templates_config import templates, stream_template
 from database import get_db, DiscussionDB, DiscussionCommentDB
 from crud import (
     create_discussion,
@@ -9,33 +9,37 @@ from crud import (
     get_discussion_by_id,
     create_discussion_comment,
     get_comments_by_discussion,
-    update_user_active_count
+    group_comments_by_discussion,
+    update_user_active_count,
+    get_content_html
 )
 from sqlalchemy.orm import Session
-import markdown
 router = APIRouter()
 @router.get("/discussions", response_class=HTMLResponse)
 
 
 async def list_discussions(request: Request, db: Session = Depends(get_db)):
     discussions = get_all_discussions(db)
-    # 获取所有讨论的评论
-    discussion_comments = {}
-    for discussion in discussions:
-        # 渲染讨论内容为HTML
-        discussion["content_html"] = markdown.markdown(discussion["content"])
-        comments = get_comments_by_discussion(db, discussion["id"])
-        # 渲染评论内容为HTML
-        for comment in comments:
-            comment["content_html"] = markdown.markdown(comment["content"])
-        discussion_comments[discussion["id"]] = comments
+    # 一次扫描获取所有讨论的评论
+    comments_by_discussion = group_comments_by_discussion(db, [discussion["id"] for discussion in discussions])
+    
+    # 讨论和评论由生成器逐条提供，模板边渲染边发送
+    def iter_discussions():
+        for discussion in discussions:
+            # 使用写入时预渲染的HTML
+            get_content_html("discussions", discussion)
+            comments = comments_by_discussion.get(discussion["id"], [])
+            for comment in comments:
+                get_content_html("discussion_comments", comment)
+            yield discussion, comments
+    
     current_user = await get_current_user(request, db)
-    return templates.TemplateResponse(
+    return stream_template(
         "discussions.html",
         {
             "request": request,
-            "discussions": discussions,
-            "discussion_comments": discussion_comments,
+            "discussions": iter_discussions(),
+            "discussion_count": len(discussions),
             "current_user": current_user
         }
     )
@@ -46,12 +50,11 @@ async def read_discussion(request: Request, discussion_id: int, db: Session = De
     discussion = get_discussion_by_id(db, discussion_id)
     if not discussion:
         return RedirectResponse(url="/discussions", status_code=303)
-    # 渲染讨论内容为HTML
-    discussion["content_html"] = markdown.markdown(discussion["content"])
+    # 使用写入时预渲染的HTML
+    get_content_html("discussions", discussion)
     comments = get_comments_by_discussion(db, discussion_id)
-    # 渲染评论内容为HTML
     for comment in comments:
-        comment["content_html"] = markdown.markdown(comment["content"])
+        get_content_html("discussion_comments", comment)
     current_user = await get_current_user(request, db)
     return templates.TemplateResponse(
         "discussion_detail.html",
@@ -4,6 +4,14 @@ from datetime import datetime
 from database_connection import db_manager
 from enhanced_local_cache import enhanced_local_cache
 from temp_storage import temp_storage
+from query_stats import query_stats
+from markdown_renderer import markdown_renderer
+from page_cache import page_cache
+from fragment_cache import fragment_cache
+from tree_cache import tree_cache
+from tree_layout import tree_layouts
+from tree_search import tree_search
+from sync_service import sync_all_caches
 import logging
 
 logger = logging.getLogger(__name__)
@@ -93,6 +101,8 @@ async def database_health():
             return {
                 "status": "healthy",
                 "database_connected": True,
+                "sync_watermark": db_manager.last_sync_watermark,
+                "replicas": db_manager.replica_status(),
                 "timestamp": datetime.now()
             }
         else:
@@ -139,6 +149,79 @@ async def cache_health():
             "error": str(e)
         }
 
+@router.get("/queries")
+async def query_health():
+    """SQL语句统计：按操作汇总的语句次数、延迟直方图和行数"""
+    try:
+        return {
+            "status": "healthy",
+            "query_stats": query_stats.snapshot(),
+            "timestamp": datetime.now()
+        }
+        
+    except Exception as e:
+        logger.error(f"SQL语句统计获取失败: {str(e)}")
+        return {
+            "status": "error",
+            "timestamp": datetime.now(),
+            "error": str(e)
+        }
+
+@router.post("/queries/reset")
+async def reset_query_stats():
+    """清空SQL语句统计"""
+    query_stats.reset()
+    return {
+        "status": "success",
+        "message": "SQL语句统计已清空",
+        "timestamp": datetime.now()
+    }
+
+@router.get("/markdown-cache")
+async def markdown_cache_health():
+    """Markdown渲染缓存的命中率和容量"""
+    return {
+        "status": "healthy",
+        "markdown_cache": markdown_renderer.stats(),
+        "timestamp": datetime.now()
+    }
+
+@router.post("/markdown-cache/clear")
+async def clear_markdown_cache():
+    """清空Markdown渲染缓存"""
+    markdown_renderer.clear()
+    return {
+        "status": "success",
+        "message": "Markdown渲染缓存已清空",
+        "timestamp": datetime.now()
+    }
+
+@router.get("/page-cache")
+async def page_cache_health():
+    """整页缓存、模板片段缓存和故事树缓存的命中率和容量"""
+    return {
+        "status": "healthy",
+        "page_cache": page_cache.stats(),
+        "fragment_cache": fragment_cache.stats(),
+        "tree_cache": tree_cache.stats(),
+        "tree_layouts": tree_layouts.stats(),
+        "tree_search": tree_search.stats(),
+        "timestamp": datetime.now()
+    }
+
+@router.post("/page-cache/clear")
+async def clear_page_cache():
+    """清空整页缓存、模板片段缓存和故事树缓存"""
+    page_cache.clear()
+    fragment_cache.clear()
+    tree_cache.clear()
+    tree_layouts.clear()
+    return {
+        "status": "success",
+        "message": "整页缓存、模板片段缓存和故事树缓存已清空",
+        "timestamp": datetime.now()
+    }
+
 @router.post("/sync")
 async def force_sync():
     """强制同步数据到数据库"""
@@ -146,7 +229,7 @@ async def force_sync():
         logger.info("收到强制同步请求")
         
         # 尝试同步数据
-        sync_success = enhanced_local_cache.sync_to_db_with_fallback()
+        sync_success = sync_all_caches()
         
         if sync_success:
             return {
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Request, Form, Depends
+import os
+from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from models import get_current_user
-from templates_config import templates
+from templates_config import templates, stream_template
 from database import get_db, StoryDB, StoryChapterDB, ChapterCommentDB
 from crud import (
     create_story,
@@ -9,13 +10,45 @@ from crud import (
     get_chapters_by_story,
     create_chapter,
     create_chapter_comment,
+    get_chapter_by_id,
     get_comments_by_chapter,
+    group_comments_by_chapter,
     update_user_active_count,
-    get_all_stories
+    get_all_stories,
+    get_content_html
 )
+from pagination import page_start, paginate
 from sqlalchemy.orm import Session
-import markdown
 router = APIRouter()
+
+# 故事页首屏渲染的章节数，其余章节滚动到底部时通过接口分页加载
+STORY_INITIAL_CHAPTERS = int(os.getenv("STORY_INITIAL_CHAPTERS", "20"))
+# 章节分页接口每页最多返回的章节数
+CHAPTER_PAGE_SIZE = int(os.getenv("CHAPTER_PAGE_SIZE", "20"))
+# 每个章节首屏展示的评论数，评论分页接口每页也按此返回
+COMMENT_PAGE_SIZE = int(os.getenv("COMMENT_PAGE_SIZE", "10"))
+# 故事页侧栏展示的讨论数
+SIDEBAR_DISCUSSION_COUNT = 5
+
+
+def iter_chapter_entries(db: Session, chapters, first_position: int):
+    """逐章生成章节模板所需的数据，每章只带第一页评论"""
+    comments_by_chapter = group_comments_by_chapter(db, [chapter["id"] for chapter in chapters])
+    for offset, chapter in enumerate(chapters):
+        # 使用写入时预渲染的HTML
+        get_content_html("story_chapters", chapter)
+        comments = comments_by_chapter.get(chapter["id"], [])
+        first_page, comments_cursor = paginate(comments, None, COMMENT_PAGE_SIZE)
+        for comment in first_page:
+            get_content_html("chapter_comments", comment)
+        yield {
+            "chapter": chapter,
+            # 故事正文算第1章
+            "number": first_position + offset + 2,
+            "comments": first_page,
+            "comment_count": len(comments),
+            "comments_cursor": comments_cursor
+        }
 @router.get("/stories/{story_id}", response_class=HTMLResponse)
 
 
@@ -29,44 +62,104 @@ async def read_story(request: Request, story_id: int, db: Session = Depends(get_
     story_author = get_user_by_id(db, story["author_id"])
     story_author_name = story_author["username"] if story_author else "未知作者"
     
-    # 渲染故事内容为HTML
-    story["content_html"] = markdown.markdown(story["content"])
+    # 使用写入时预渲染的HTML
+    get_content_html("stories", story)
     
-    # 处理标签
+    # 处理标签，使用副本避免把列表写回缓存中的行
+    story = dict(story)
     if isinstance(story["tags"], str):
         story["tags"] = [tag.strip() for tag in story["tags"].split(',') if tag.strip()]
     elif not story["tags"]:
         story["tags"] = []
     
+    # 首屏只渲染前几章，章节和评论由生成器逐章提供，模板边渲染边发送
     chapters = get_chapters_by_story(db, story_id)
-    chapter_comments = {}
-    for chapter in chapters:
-        # 渲染章节内容为HTML
-        chapter["content_html"] = markdown.markdown(chapter["content"])
-        # 获取章节评论
-        comments = get_comments_by_chapter(db, chapter["id"])
-        # 渲染评论内容为HTML
-        for comment in comments:
-            comment["content_html"] = markdown.markdown(comment["content"])
-        chapter_comments[chapter["id"]] = comments
+    first_page, next_chapter_cursor = paginate(chapters, None, STORY_INITIAL_CHAPTERS)
     
-    # 获取讨论数据
+    # 侧栏只展示最新的几个讨论
     from crud import get_all_discussions
-    discussions = get_all_discussions(db)
+    discussions = get_all_discussions(db)[:SIDEBAR_DISCUSSION_COUNT]
     
     current_user = await get_current_user(request, db)
-    return templates.TemplateResponse(
+    return stream_template(
         "story_detail.html",
         {
             "request": request,
             "story": story,
             "story_author_name": story_author_name,
-            "chapters": chapters,
-            "chapter_comments": chapter_comments,
+            "chapters": iter_chapter_entries(db, first_page, 0),
+            "chapter_count": len(chapters),
+            "next_chapter_cursor": next_chapter_cursor,
             "discussions": discussions,
             "current_user": current_user
         }
     )
+@router.get("/api/stories/{story_id}/chapters")
+
+
+async def list_story_chapters(
+    request: Request,
+    story_id: int,
+    after: str = None,
+    limit: int = CHAPTER_PAGE_SIZE,
+    db: Session = Depends(get_db)
+):
+    """按游标分页返回章节，每章带渲染好的HTML和第一页评论"""
+    if not get_story_by_id(db, story_id):
+        raise HTTPException(status_code=404, detail="故事不存在")
+    chapters = get_chapters_by_story(db, story_id)
+    limit = max(1, min(limit, CHAPTER_PAGE_SIZE))
+    try:
+        start = page_start(chapters, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page, next_cursor = paginate(chapters[start:], None, limit)
+    
+    current_user = await get_current_user(request, db)
+    template = templates.get_template("chapter_item.html")
+    items = []
+    for entry in iter_chapter_entries(db, page, start):
+        chapter = entry["chapter"]
+        items.append({
+            "id": chapter["id"],
+            "number": entry["number"],
+            "author_name": chapter["author_name"],
+            "created_at": chapter["created_at"],
+            "content_html": chapter["content_html"],
+            "comment_count": entry["comment_count"],
+            "html": template.render(entry=entry, current_user=current_user)
+        })
+    return {"chapters": items, "next_cursor": next_cursor, "total": len(chapters)}
+@router.get("/api/chapters/{chapter_id}/comments")
+
+
+async def list_chapter_comments(
+    chapter_id: int,
+    after: str = None,
+    limit: int = COMMENT_PAGE_SIZE,
+    db: Session = Depends(get_db)
+):
+    """按游标分页返回章节评论，每条带渲染好的HTML"""
+    if not get_chapter_by_id(db, chapter_id):
+        raise HTTPException(status_code=404, detail="章节不存在")
+    comments = get_comments_by_chapter(db, chapter_id)
+    limit = max(1, min(limit, COMMENT_PAGE_SIZE))
+    try:
+        page, next_cursor = paginate(comments, after, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    template = templates.get_template("comment_item.html")
+    items = []
+    for comment in page:
+        items.append({
+            "id": comment["id"],
+            "author_name": comment["author_name"],
+            "created_at": comment["created_at"],
+            "content_html": get_content_html("chapter_comments", comment),
+            "html": template.render(comment=comment)
+        })
+    return {"comments": items, "next_cursor": next_cursor, "total": len(comments)}
 @router.post("/stories/{story_id}/chapters")
 
 
@@ -1,84 +1,145 @@
+import os
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 from database import get_db
 from models import get_current_user, StoryTreeNode, counters, data_store
 from enhanced_local_cache import enhanced_local_cache
-import markdown
+from tree_cache import tree_cache
+from tree_layout import tree_layouts, NODE_WIDTH, CONNECTOR_OFFSET
+from tree_search import tree_search, SEARCH_MAX_RESULTS
+from markdown_renderer import render_content_html, ensure_content_html, is_rendered, rerender_stale
 from datetime import datetime
 from templates_config import templates
 
 router = APIRouter()
 
+# 故事树页面首屏展开的层数，更深的分支点击后通过展开接口加载
+TREE_INITIAL_DEPTH = int(os.getenv("TREE_INITIAL_DEPTH", "3"))
+# 点击展开时默认加载的层数
+TREE_EXPAND_DEPTH = int(os.getenv("TREE_EXPAND_DEPTH", "2"))
+# 展开接口一次最多返回的层数
+TREE_MAX_DEPTH = int(os.getenv("TREE_MAX_DEPTH", "5"))
+
+# 起始节点列表的排序方式：参数值 -> 子树统计字段，都按从大到小排列
+ROOT_SORT_KEYS = {
+    "size": "descendant_count",
+    "depth": "max_depth",
+    "endings": "leaf_count",
+    "active": "latest_at",
+}
+
 # 获取起始节点列表（parent_id为None的节点）
 def get_root_nodes():
-    nodes = []
-    for node_id, node_data in enhanced_local_cache.data.get("story_tree_nodes", {}).items():
-        if node_data.get("parent_id") is None:
-            nodes.append(node_data)
-    return nodes
-
-# 获取以指定节点为根的故事树
-def get_story_tree(node_id):
-    # 先检查缓存中是否存在完整的树结构
-    cached_tree = enhanced_local_cache.data.get("cached_trees", {}).get(node_id)
+    return [record.item for record in enhanced_local_cache.get_tree_snapshot().children(None)]
+
+# 获取带子树统计的起始节点列表，统计随写入增量维护，排序和筛选只需遍历起始节点
+def get_root_listing(sort=None, min_size=0):
+    roots = []
+    for record in enhanced_local_cache.get_tree_snapshot().children(None):
+        if record.stats["descendant_count"] < min_size:
+            continue
+        roots.append(dict(record.item, stats=dict(record.stats)))
+    sort_key = ROOT_SORT_KEYS.get(sort)
+    if sort_key:
+        # 旧数据可能没有创建时间，排在最后
+        roots.sort(key=lambda node: (node["stats"][sort_key] is not None, node["stats"][sort_key]), reverse=True)
+    return roots
+
+# 获取节点的预渲染HTML，旧节点在首次读取时补渲染并写回缓存
+def get_node_html(node_data):
+    # 快照中的节点不可修改，补渲染时使用副本
+    if not is_rendered(node_data):
+        node_data = dict(node_data)
+    return ensure_content_html(
+        node_data,
+        lambda rendered: enhanced_local_cache.update_item("story_tree_nodes", rendered["id"], {
+            "content_html": rendered["content_html"],
+            "content_html_version": rendered["content_html_version"]
+        })
+    )
+
+# 渲染器版本变更后批量重新渲染故事树节点
+def rerender_tree_nodes():
+    nodes = list(enhanced_local_cache.data.get("story_tree_nodes", {}).values())
+    count = rerender_stale(
+        nodes,
+        lambda rendered: enhanced_local_cache.update_item("story_tree_nodes", rendered["id"], {})
+    )
+    # 清除缓存的树结构，避免继续使用旧HTML
+    tree_cache.clear()
+    return count
+
+# 复制快照节点的展示字段，子节点列表和是否还有未展开的子节点由调用方填充
+def build_tree_node(record):
+    node_data = record.item
+    return {
+        "id": node_data["id"],
+        "title": node_data["title"],
+        "option_title": node_data["option_title"],
+        "content": node_data["content"],
+        "content_html": get_node_html(node_data),
+        "parent_id": node_data["parent_id"],
+        "author_id": node_data["author_id"],
+        "created_at": node_data["created_at"],
+        "child_count": len(record.children),
+        "stats": dict(record.stats),
+        "has_more": False,
+        "children": []
+    }
+
+# 获取以指定节点为根的故事树，max_depth限制展开的层数，None表示完整的树
+def get_story_tree(node_id, max_depth=None):
+    # 先检查缓存中是否存在该树结构
+    cached_tree = tree_cache.get(node_id, max_depth)
     if cached_tree:
         return cached_tree
+    token = tree_cache.token()
+    # 整棵树都从同一个不可变快照读取，不加锁，构建期间的写入不会产生半新半旧的树
+    snapshot = enhanced_local_cache.get_tree_snapshot()
     
     tree = {}
     
     # 首先获取根节点
-    root_node = enhanced_local_cache.data.get("story_tree_nodes", {}).get(node_id)
-    if not root_node:
+    root_record = snapshot.get(node_id)
+    if not root_record:
         return None
     
     # 构建树结构
-    tree[node_id] = {
-        "id": root_node["id"],
-        "title": root_node["title"],
-        "option_title": root_node["option_title"],
-        "content": root_node["content"],
-        "parent_id": root_node["parent_id"],
-        "author_id": root_node["author_id"],
-        "created_at": root_node["created_at"],
-        "children": []
-    }
-    
-    # 递归获取子节点
-    def get_children(parent_id, parent_node):
-        for child_id, child_data in enhanced_local_cache.data.get("story_tree_nodes", {}).items():
-            if child_data.get("parent_id") == parent_id:
-                child_node = {
-                    "id": child_data["id"],
-                    "title": child_data["title"],
-                    "option_title": child_data["option_title"],
-                    "content": child_data["content"],
-                    "parent_id": child_data["parent_id"],
-                    "author_id": child_data["author_id"],
-                    "created_at": child_data["created_at"],
-                    "children": []
-                }
-                parent_node["children"].append(child_node)
-                get_children(child_id, child_node)
-    
-    get_children(node_id, tree[node_id])
-    
-    # 缓存树结构，避免重复计算
-    if "cached_trees" not in enhanced_local_cache.data:
-        enhanced_local_cache.data["cached_trees"] = {}
-    enhanced_local_cache.data["cached_trees"][node_id] = tree
+    tree[node_id] = build_tree_node(root_record)
+    
+    # 通过子节点索引逐层获取子节点，每个节点只访问一次
+    pending = [(tree[node_id], 0)]
+    size = 1
+    while pending:
+        parent_node, depth = pending.pop()
+        if max_depth is not None and depth >= max_depth:
+            parent_node["has_more"] = parent_node["child_count"] > 0
+            continue
+        for child_record in snapshot.children(parent_node["id"]):
+            child_node = build_tree_node(child_record)
+            parent_node["children"].append(child_node)
+            pending.append((child_node, depth + 1))
+            size += 1
+    
+    # 缓存树结构，避免重复计算；节点修改时由监听器移除受影响的树
+    tree_cache.store(node_id, tree, size, token, max_depth)
     
     return tree
 
 # 显示起始节点列表
 @router.get("/tree", response_class=HTMLResponse)
-async def get_tree_root(request: Request, db: Session = Depends(get_db)):
+async def get_tree_root(request: Request, sort: str = None, min_size: int = 0, db: Session = Depends(get_db)):
     current_user = await get_current_user(request, db)
-    root_nodes = get_root_nodes()
+    if sort not in ROOT_SORT_KEYS:
+        sort = None
+    root_nodes = get_root_listing(sort, min_size)
     
     return templates.TemplateResponse("tree.html", {
         "request": request,
         "root_nodes": root_nodes,
+        "sort": sort,
+        "min_size": min_size,
         "current_user": current_user
     })
 
@@ -86,26 +147,94 @@ async def get_tree_root(request: Request, db: Session = Depends(get_db)):
 @router.get("/tree/node/{node_id}", response_class=HTMLResponse)
 async def get_tree_node(request: Request, node_id: int, db: Session = Depends(get_db)):
     current_user = await get_current_user(request, db)
-    tree = get_story_tree(node_id)
+    # 首屏只展开固定层数，渲染开销与子树大小无关
+    tree = get_story_tree(node_id, TREE_INITIAL_DEPTH)
     
     if not tree:
         raise HTTPException(status_code=404, detail="节点不存在")
     
-    # 渲染Markdown内容
-    def render_content(node):
-        node["content_html"] = markdown.markdown(node["content"])
-        for child in node["children"]:
-            render_content(child)
-    
     root_node = tree[node_id]
-    render_content(root_node)
+    # 布局按树的版本缓存，模板只按坐标绘制
+    layout = tree_layouts.get(node_id)
+    cards, connections = place_tree_nodes(root_node, layout)
     
     return templates.TemplateResponse("tree_node.html", {
         "request": request,
         "root_node": root_node,
+        "layout": layout,
+        "cards": cards,
+        "connections": connections,
+        "expand_depth": TREE_EXPAND_DEPTH,
+        "node_width": NODE_WIDTH,
+        "connector_offset": CONNECTOR_OFFSET,
         "current_user": current_user
     })
 
+# 按布局给已展开的节点定位，返回节点卡片和连接线端点；布局中还没有的新节点留到下次布局
+def place_tree_nodes(root_node, layout):
+    cards = []
+    connections = []
+    pending = [root_node]
+    while pending:
+        node = pending.pop()
+        position = layout.position(node["id"])
+        if position is None:
+            continue
+        x, y = position
+        cards.append({"node": node, "x": x, "y": y, "is_root": node is root_node})
+        for child in node["children"]:
+            child_position = layout.position(child["id"])
+            if child_position is not None:
+                connections.append({
+                    "x1": x + NODE_WIDTH, "y1": y + CONNECTOR_OFFSET,
+                    "x2": child_position[0], "y2": child_position[1] + CONNECTOR_OFFSET
+                })
+            pending.append(child)
+    return cards, connections
+
+# 序列化展开接口中的节点，每个节点带渲染好的卡片HTML和布局坐标
+def serialize_tree_node(node, template, layout):
+    x, y = layout.position(node["id"])
+    return {
+        "id": node["id"],
+        "title": node["title"],
+        "option_title": node["option_title"],
+        "parent_id": node["parent_id"],
+        "created_at": node["created_at"],
+        "child_count": node["child_count"],
+        "has_more": node["has_more"],
+        "x": x,
+        "y": y,
+        "html": template.render(node=node),
+        "children": [
+            serialize_tree_node(child, template, layout)
+            for child in node["children"]
+            if layout.position(child["id"]) is not None
+        ]
+    }
+
+# 按标题或选项标题搜索节点，root_id限定在该节点的子树中，prefix为真时只匹配开头
+@router.get("/api/tree/search")
+async def search_tree_nodes(q: str = "", root_id: int = None, prefix: bool = False, limit: int = SEARCH_MAX_RESULTS):
+    if root_id is not None and enhanced_local_cache.get_tree_snapshot().get(root_id) is None:
+        raise HTTPException(status_code=404, detail="节点不存在")
+    return {"results": tree_search.search(q, root_id, prefix, limit)}
+
+# 按需展开分支：返回节点及其下depth层子节点，坐标来自以root_id为根的树的布局
+@router.get("/api/tree/{root_id}/nodes/{node_id}")
+async def expand_tree_node(root_id: int, node_id: int, depth: int = TREE_EXPAND_DEPTH):
+    depth = max(0, min(depth, TREE_MAX_DEPTH))
+    tree = get_story_tree(node_id, depth)
+    layout = tree_layouts.get(root_id)
+    
+    if not tree or not layout:
+        raise HTTPException(status_code=404, detail="节点不存在")
+    if layout.position(node_id) is None:
+        raise HTTPException(status_code=404, detail="节点不在该故事树中")
+    
+    template = templates.get_template("tree_node_card.html")
+    return {"node": serialize_tree_node(tree[node_id], template, layout)}
+
 # 创建新节点
 @router.post("/tree/node")
 async def create_tree_node(request: Request, db: Session = Depends(get_db)):
@@ -137,13 +266,12 @@ async def create_tree_node(request: Request, db: Session = Depends(get_db)):
         "created_at": datetime.now().isoformat()
     }
     
+    # 写入时预渲染HTML
+    render_content_html(new_node)
+    
     # 添加到缓存
     enhanced_local_cache.add_item("story_tree_nodes", node_id, new_node)
     
-    # 清除缓存的树结构，确保下次获取时重新构建
-    if "cached_trees" in enhanced_local_cache.data:
-        enhanced_local_cache.data["cached_trees"] = {}
-    
     # 如果是内存存储模式，也添加到内存存储
     if "story_tree_nodes" in data_store:
         data_store["story_tree_nodes"].append(new_node)
@@ -175,14 +303,12 @@ async def update_tree_node(request: Request, node_id: int, db: Session = Depends
         updates["option_title"] = form_data["option_title"]
     if "content" in form_data:
         updates["content"] = form_data["content"]
+        # 内容修改时重新预渲染HTML
+        render_content_html(updates)
     
     # 更新节点
     enhanced_local_cache.update_item("story_tree_nodes", node_id, updates)
     
-    # 清除缓存的树结构，确保下次获取时重新构建
-    if "cached_trees" in enhanced_local_cache.data:
-        enhanced_local_cache.data["cached_trees"] = {}
-    
     return {"id": node_id, "message": "节点更新成功"}
 
 # 删除节点
@@ -201,54 +327,41 @@ async def delete_tree_node(request: Request, node_id: int, db: Session = Depends
     if node["author_id"] != current_user["id"]:
         raise HTTPException(status_code=403, detail="无权限删除此节点")
     
-    # 递归删除子节点
-    def delete_children(parent_id):
-        for child_id, child_data in list(enhanced_local_cache.data.get("story_tree_nodes", {}).items()):
-            if child_data.get("parent_id") == parent_id:
-                delete_children(child_id)
-                enhanced_local_cache.delete_item("story_tree_nodes", child_id)
-    
-    delete_children(node_id)
-    enhanced_local_cache.delete_item("story_tree_nodes", node_id)
+    # 在一次加锁内删除节点及其所有子孙
+    removed = enhanced_local_cache.delete_subtree(node_id)
     
-    # 清除缓存的树结构，确保下次获取时重新构建
-    if "cached_trees" in enhanced_local_cache.data:
-        enhanced_local_cache.data["cached_trees"] = {}
-    
-    return {"id": node_id, "message": "节点删除成功"}
+    return {"id": node_id, "deleted": len(removed), "message": "节点删除成功"}
 
 # 故事树探索模式
 @router.get("/tree/explore/{node_id}", response_class=HTMLResponse)
-async def get_tree_explore(request: Request, node_id: int, former_text: str = "", db: Session = Depends(get_db)):
+async def get_tree_explore(request: Request, node_id: int, db: Session = Depends(get_db)):
     current_user = await get_current_user(request, db)
     
+    # 当前节点、子节点和路径都从同一个快照读取
+    snapshot = enhanced_local_cache.get_tree_snapshot()
+    
     # 获取当前节点
-    current_node = enhanced_local_cache.data.get("story_tree_nodes", {}).get(node_id)
+    current_node = snapshot.item(node_id)
     if not current_node:
         raise HTTPException(status_code=404, detail="节点不存在")
     
-    # 渲染当前节点的内容
-    current_node["content_html"] = markdown.markdown(current_node["content"])
+    # 使用写入时预渲染的HTML
+    current_node = dict(current_node, content_html=get_node_html(current_node))
     
     # 获取子节点
-    children = []
-    for child_id, child_data in enhanced_local_cache.data.get("story_tree_nodes", {}).items():
-        if child_data.get("parent_id") == node_id:
-            children.append(child_data)
-    
-    # 构建完整的前文本
-    full_former_text = former_text
-    if full_former_text and not full_former_text.endswith("\n\n"):
-        full_former_text += "\n\n"
+    children = [record.item for record in snapshot.children(node_id)]
     
-    # 渲染前文本
-    former_text_html = markdown.markdown(full_former_text) if full_former_text else ""
+    # 按物化路径重建前文：从起始节点到父节点的每一段，以及之后选择的选项，使用各节点预渲染的HTML
+    path_nodes = snapshot.path_items(node_id)
+    former_steps = [
+        {"node": node, "content_html": get_node_html(node), "choice": next_node["option_title"]}
+        for node, next_node in zip(path_nodes, path_nodes[1:])
+    ]
     
     return templates.TemplateResponse("tree_explore.html", {
         "request": request,
         "current_node": current_node,
         "children": children,
-        "former_text": full_former_text,
-        "former_text_html": former_text_html,
+        "former_steps": former_steps,
         "current_user": current_user
     })
@@ -76,4 +76,105 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         }
     });
+    
+    // 故事页其余章节：滚动到底部时按游标分页加载
+    const chaptersList = document.querySelector('.chapters-list');
+    const loadMoreChapters = document.querySelector('.load-more-chapters');
+    if (chaptersList && loadMoreChapters) {
+        let loading = false;
+        let observer = null;
+        
+        function nearBottom() {
+            return loadMoreChapters.getBoundingClientRect().top < window.innerHeight + 600;
+        }
+        
+        function loadChapters() {
+            const cursor = loadMoreChapters.dataset.cursor;
+            if (loading || !cursor) {
+                return Promise.resolve();
+            }
+            loading = true;
+            const storyId = loadMoreChapters.dataset.storyId;
+            return fetch(`/api/stories/${storyId}/chapters?after=${encodeURIComponent(cursor)}`)
+                .then(response => response.json())
+                .then(data => {
+                    data.chapters.forEach(chapter => {
+                        chaptersList.insertAdjacentHTML('beforeend', chapter.html);
+                    });
+                    if (data.next_cursor) {
+                        loadMoreChapters.dataset.cursor = data.next_cursor;
+                    } else {
+                        loadMoreChapters.remove();
+                        if (observer) {
+                            observer.disconnect();
+                        }
+                    }
+                })
+                .catch(error => {
+                    console.error('加载章节失败:', error);
+                })
+                .finally(() => {
+                    loading = false;
+                });
+        }
+        
+        // 加载后仍在视口附近时继续加载下一页
+        function loadWhileVisible() {
+            loadChapters().then(() => {
+                if (loadMoreChapters.isConnected && nearBottom()) {
+                    loadWhileVisible();
+                }
+            });
+        }
+        
+        // 评论后重定向带有章节锚点，锚点章节不在首屏时一直加载到出现为止
+        function loadUntilAnchor() {
+            const anchor = decodeURIComponent(window.location.hash.slice(1));
+            if (!anchor || document.getElementById(anchor) || !loadMoreChapters.isConnected) {
+                const target = anchor && document.getElementById(anchor);
+                if (target) {
+                    target.scrollIntoView({ block: 'start' });
+                }
+                return;
+            }
+            loadChapters().then(loadUntilAnchor);
+        }
+        
+        loadMoreChapters.querySelector('button').addEventListener('click', loadWhileVisible);
+        if ('IntersectionObserver' in window) {
+            observer = new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) {
+                    loadWhileVisible();
+                }
+            }, { rootMargin: '600px' });
+            observer.observe(loadMoreChapters);
+        }
+        loadUntilAnchor();
+    }
+    
+    // 章节评论：点击后按游标分页加载，动态加载的章节同样适用
+    document.addEventListener('click', function(e) {
+        const button = e.target.closest('.load-more-comments');
+        if (!button || button.disabled) {
+            return;
+        }
+        button.disabled = true;
+        const chapterId = button.dataset.chapterId;
+        fetch(`/api/chapters/${chapterId}/comments?after=${encodeURIComponent(button.dataset.cursor)}`)
+            .then(response => response.json())
+            .then(data => {
+                const list = button.parentElement.querySelector('ul');
+                list.insertAdjacentHTML('beforeend', data.comments.map(comment => comment.html).join(''));
+                if (data.next_cursor) {
+                    button.dataset.cursor = data.next_cursor;
+                    button.disabled = false;
+                } else {
+                    button.remove();
+                }
+            })
+            .catch(error => {
+                console.error('加载评论失败:', error);
+                button.disabled = false;
+            });
+    });
 });
\ No newline at end of file
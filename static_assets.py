@@ -0,0 +1,286 @@
+import os
+import re
+import stat
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import mimetypes
+from typing import Dict, Optional
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 静态文件目录和构建输出目录（相对静态目录）
+STATIC_DIRECTORY = "static"
+DIST_PREFIX = "dist"
+MANIFEST_NAME = "manifest.json"
+
+# 只压缩文本类资源，图片本身已经压缩
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+
+# 带指纹的文件内容永不变化，允许客户端缓存一年且不再验证
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def fingerprint_name(path: str, content: bytes) -> str:
+    """css/styles.css -> css/styles.<哈希>.css"""
+    digest = hashlib.blake2b(content, digest_size=4).hexdigest()
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+# CSS词法单元：字符串、注释、空白、标点和其余文本
+_CSS_TOKEN = re.compile(r"""("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|(/\*.*?\*/)|(\s+)|([{}:;,>])|([^\s{}:;,>"'/]+|/)""", re.S)
+# 块内仍是规则（选择器）而不是声明的@规则
+_CSS_GROUP_RULES = ("@media", "@supports", "@document", "@layer", "@container")
+# 两侧空白总可以去掉的标点；冒号只在声明块内去掉，选择器中的 "a :hover" 与 "a:hover" 含义不同
+_CSS_TIGHT = set("{};,>")
+
+
+def minify_css(text: str) -> str:
+    """去掉注释和多余空白，字符串原样保留"""
+    out = []
+    # 外层块的类型：True为声明块，False为@media等仍包含规则的块
+    blocks = []
+    prelude = []
+    pending_space = False
+
+    def tight(token: str) -> bool:
+        return token in _CSS_TIGHT or (token == ":" and bool(blocks) and blocks[-1])
+
+    for match in _CSS_TOKEN.finditer(text):
+        string, comment, space, punct, other = match.groups()
+        if comment is not None:
+            continue
+        if space is not None:
+            pending_space = bool(out)
+            continue
+        token = string or punct or other
+        if pending_space and not tight(token) and not tight(out[-1]):
+            out.append(" ")
+            prelude.append(" ")
+        pending_space = False
+        if token == "{":
+            blocks.append(not "".join(prelude).strip().lower().startswith(_CSS_GROUP_RULES))
+            prelude = []
+        elif token == "}":
+            if blocks:
+                blocks.pop()
+            prelude = []
+        elif token == ";":
+            prelude = []
+        else:
+            prelude.append(token)
+        out.append(token)
+    return "".join(out).replace(";}", "}").strip()
+
+
+def _js_line_starts(text: str) -> list:
+    """每一行开头是否处于代码中（而不在多行字符串、模板字符串或块注释中）
+
+    模板字符串中的 ${...} 嵌套代码用栈记录。无法确定时（如正则字面量中的引号导致状态不平衡）返回None。
+    """
+    starts = [True]
+    # 栈中为 "`" 表示模板字符串，为整数表示 ${ 内代码的括号深度
+    stack = []
+    quote = None
+    block_comment = False
+    index = 0
+    length = len(text)
+    while index < length:
+        char = text[index]
+        following = text[index + 1] if index + 1 < length else ""
+        if char == "\n":
+            starts.append(quote is None and not block_comment and (not stack or stack[-1] != "`"))
+            if quote in ("'", '"'):
+                quote = None
+            index += 1
+            continue
+        if block_comment:
+            if char == "*" and following == "/":
+                block_comment = False
+                index += 1
+        elif quote is not None:
+            if char == "\\":
+                index += 1
+            elif char == quote:
+                quote = None
+        elif stack and stack[-1] == "`":
+            if char == "\\":
+                index += 1
+            elif char == "`":
+                stack.pop()
+            elif char == "$" and following == "{":
+                stack.append(0)
+                index += 1
+        elif char == "/" and following == "/":
+            while index < length and text[index] != "\n":
+                index += 1
+            continue
+        elif char == "/" and following == "*":
+            block_comment = True
+            index += 1
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "`":
+            stack.append("`")
+        elif char == "{" and stack:
+            stack[-1] += 1
+        elif char == "}" and stack:
+            if stack[-1] == 0:
+                stack.pop()
+            else:
+                stack[-1] -= 1
+        index += 1
+    if stack or quote is not None or block_comment:
+        return None
+    return starts
+
+
+def minify_js(text: str) -> str:
+    """保守的压缩：只去掉代码行的缩进和空行，多行字符串和模板字符串内的行原样保留"""
+    starts = _js_line_starts(text)
+    if starts is None:
+        return text
+    lines = []
+    for in_code, line in zip(starts, text.split("\n")):
+        if not in_code:
+            lines.append(line)
+        elif line.strip():
+            lines.append(line.strip())
+    return "\n".join(lines).rstrip("\n") + "\n"
+
+
+def _rewrite_references(text: str, manifest: Dict[str, str]) -> str:
+    """把CSS中对其他静态文件的引用替换为带指纹的URL"""
+    for logical, fingerprinted in manifest.items():
+        text = text.replace(f"/static/{logical}", f"/static/{DIST_PREFIX}/{fingerprinted}")
+    return text
+
+
+def build_assets(static_dir: str = STATIC_DIRECTORY, minify: bool = False) -> Dict[str, str]:
+    """生成带指纹的静态文件及其gzip/Brotli预压缩版本，返回逻辑路径到指纹路径的清单"""
+    dist_dir = os.path.join(static_dir, DIST_PREFIX)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+
+    sources = []
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            full_path = os.path.join(root, name)
+            sources.append(os.path.relpath(full_path, static_dir).replace(os.sep, "/"))
+    # 先处理被引用的文件，CSS最后处理以便替换其中的引用
+    sources.sort(key=lambda path: (path.endswith(".css"), path))
+
+    manifest: Dict[str, str] = {}
+    for logical in sources:
+        with open(os.path.join(static_dir, logical), "rb") as f:
+            content = f.read()
+        ext = os.path.splitext(logical)[1]
+        if ext == ".css":
+            text = _rewrite_references(content.decode("utf-8"), manifest)
+            content = (minify_css(text) if minify else text).encode("utf-8")
+        elif ext == ".js" and minify:
+            content = minify_js(content.decode("utf-8")).encode("utf-8")
+
+        fingerprinted = fingerprint_name(logical, content)
+        target = os.path.join(dist_dir, fingerprinted)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(content)
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            with open(target + ".gz", "wb") as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(target + ".br", "wb") as f:
+                    f.write(brotli.compress(content, quality=11))
+        manifest[logical] = fingerprinted
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    if brotli is None:
+        logger.warning("未安装brotli，只生成gzip预压缩文件")
+    logger.info(f"已生成 {len(manifest)} 个带指纹的静态文件")
+    return manifest
+
+
+def load_manifest(static_dir: str = STATIC_DIRECTORY) -> Dict[str, str]:
+    """读取构建清单，未构建时返回空清单"""
+    try:
+        with open(os.path.join(static_dir, DIST_PREFIX, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class StaticAssets:
+    """模板中生成静态文件URL：已构建时使用带指纹的文件，否则使用原文件"""
+
+    def __init__(self, static_dir: str = STATIC_DIRECTORY):
+        self.static_dir = static_dir
+        self.manifest = load_manifest(static_dir)
+        if self.manifest:
+            logger.info(f"已加载静态文件清单，共 {len(self.manifest)} 个文件")
+
+    def url(self, path: str) -> str:
+        path = path.lstrip("/")
+        fingerprinted = self.manifest.get(path)
+        if fingerprinted:
+            return f"/static/{DIST_PREFIX}/{fingerprinted}"
+        return f"/static/{path}"
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    """解析Accept-Encoding，忽略q=0的编码"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """静态文件处理：带指纹的文件优先返回预压缩版本，并允许永久缓存"""
+
+    async def get_response(self, path: str, scope):
+        fingerprinted = path.replace(os.sep, "/").startswith(DIST_PREFIX + "/")
+        if fingerprinted:
+            response = self._precompressed_response(path, scope)
+            if response is not None:
+                return response
+        response = await super().get_response(path, scope)
+        if fingerprinted and response.status_code == 200:
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    def _precompressed_response(self, path: str, scope) -> Optional[FileResponse]:
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = self.lookup_path(path + suffix)
+            if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                continue
+            media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            return FileResponse(full_path, stat_result=stat_result, media_type=media_type, headers={
+                "Content-Encoding": encoding,
+                "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+                "Vary": "Accept-Encoding"
+            })
+        return None
+
+
+# 创建全局静态文件URL生成器
+static_assets = StaticAssets()
@@ -0,0 +1,65 @@
+import os
+import time
+import logging
+import threading
+from enhanced_local_cache import enhanced_local_cache
+from local_cache import local_cache
+
+logger = logging.getLogger(__name__)
+
+# 定期同步的间隔（秒）
+SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", "60"))
+# 连续失败多少次后暂停同步
+SYNC_MAX_RETRIES = 3
+# 达到最大重试次数后暂停的时间（秒）
+SYNC_PAUSE_SECONDS = 300
+
+# 设置后定期同步线程在本轮结束后退出
+sync_stop = threading.Event()
+
+
+def sync_all_caches() -> bool:
+    """同步两个本地缓存：增强缓存失败时写入临时存储，crud使用的本地缓存写入计数增量和批量修改，失败时保留到下次同步"""
+    enhanced_synced = enhanced_local_cache.sync_to_db_with_fallback()
+    local_synced = local_cache.sync_to_db()
+    return enhanced_synced and local_synced
+
+
+def sync_to_db_periodically(interval: float = SYNC_INTERVAL, stop: threading.Event = sync_stop):
+    """定期同步数据到数据库，支持重连和回退"""
+    retry_count = 0
+
+    while not stop.is_set():
+        try:
+            logger.info("开始定期数据同步...")
+
+            if sync_all_caches():
+                logger.info("定期数据同步成功")
+                retry_count = 0  # 重置重试计数
+            else:
+                logger.warning("定期数据同步失败，使用临时存储")
+
+        except Exception as e:
+            logger.error(f"定期数据同步异常: {str(e)}")
+            retry_count += 1
+
+            if retry_count >= SYNC_MAX_RETRIES:
+                logger.error("达到最大重试次数，暂停同步一段时间")
+                stop.wait(SYNC_PAUSE_SECONDS)
+                retry_count = 0
+
+        stop.wait(interval)
+
+
+def sync_on_shutdown():
+    """服务器关闭时同步数据到数据库，支持重连和回退"""
+    logger.info("正在同步数据到数据库...")
+    sync_stop.set()
+    try:
+        if sync_all_caches():
+            logger.info("数据同步完成")
+        else:
+            logger.warning("数据同步失败，数据已保存到临时存储")
+    except Exception as e:
+        logger.error(f"关闭时数据同步异常: {str(e)}")
+        logger.warning("数据可能未完全同步，请检查临时存储")
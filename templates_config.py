@@ -1,3 +1,87 @@
+import os
+import time
+import logging
 from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from starlette.responses import StreamingResponse
+from fragment_cache import FragmentCacheExtension
+from cache_versions import entity_versions
+from static_assets import static_assets
+
+logger = logging.getLogger(__name__)
+
+# 模板目录
+TEMPLATE_DIRECTORY = "templates"
+
+# 模板运行模式：production 关闭模板文件修改检查，使用字节码缓存并在启动时预编译全部模板
+TEMPLATE_MODE = os.getenv("TEMPLATE_MODE", "development")
+
+# 模板字节码缓存目录，多个工作进程和重启之间共享，模板源码变化时按校验和自动重新编译
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR", "template_cache")
+
+
+def create_template_environment(directory=TEMPLATE_DIRECTORY, production=None, bytecode_cache_dir=None) -> Environment:
+    """创建模板环境，生产模式下修改模板需要重启进程"""
+    if production is None:
+        production = TEMPLATE_MODE == "production"
+    options = {
+        "loader": FileSystemLoader(directory),
+        "autoescape": True,
+        "extensions": [FragmentCacheExtension]
+    }
+    if production:
+        cache_dir = bytecode_cache_dir or TEMPLATE_BYTECODE_CACHE_DIR
+        os.makedirs(cache_dir, exist_ok=True)
+        options["auto_reload"] = False
+        options["bytecode_cache"] = FileSystemBytecodeCache(cache_dir)
+    return Environment(**options)
+
+
+def precompile_templates(env: Environment) -> int:
+    """启动时编译全部模板，已有字节码的模板直接加载，返回模板数"""
+    start = time.perf_counter()
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    logger.info(f"已预编译 {len(names)} 个模板，耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    return len(names)
+
+
 # 配置模板引擎
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=create_template_environment())
+# 模板片段缓存：{% cache "名称", entity_version("story:" ~ story.id) %}...{% endcache %}
+templates.env.globals["entity_version"] = entity_versions.version
+# 静态文件URL：{{ static_url('css/styles.css') }}，构建后指向带指纹的文件
+templates.env.globals["static_url"] = static_assets.url
+if TEMPLATE_MODE == "production":
+    precompile_templates(templates.env)
+
+# 流式模板响应每次发送的最小字符数，页面头部之后的内容攒够再发送
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(16 * 1024)))
+
+
+def _buffered(chunks, chunk_size):
+    """合并Jinja逐段输出的小字符串，页面头部渲染完立即发送"""
+    buffer = []
+    size = 0
+    head_sent = False
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size or (not head_sent and "</head>" in chunk):
+            head_sent = head_sent or "</head>" in chunk
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_template(name, context, status_code=200):
+    """流式渲染模板：边渲染边发送，上下文中的章节、评论可以是生成器"""
+    template = templates.get_template(name)
+    return StreamingResponse(
+        _buffered(template.generate(context), STREAM_CHUNK_SIZE),
+        status_code=status_code,
+        media_type="text/html"
+    )
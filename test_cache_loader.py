@@ -0,0 +1,56 @@
+"""
+测试按列投影的缓存预热加载
+"""
+
+from datetime import datetime
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from database import Base, StoryDB
+from cache_loader import load_tables, merge_into_cache
+
+
+def _session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'load.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_load_tables_builds_records_from_model_columns(tmp_path):
+    session = _session(tmp_path)
+    session.add(StoryDB(id=1, title="标题", content="内容", author_id=1, created_at=datetime(2026, 1, 1)))
+    session.commit()
+
+    records = load_tables(session, {"stories": StoryDB})["stories"]
+    assert set(records[1]) == {column.name for column in StoryDB.__table__.columns}
+    assert records[1]["created_at"] == datetime(2026, 1, 1)
+
+    iso_records = load_tables(session, {"stories": StoryDB}, iso_datetimes=True)["stories"]
+    assert iso_records[1]["created_at"] == "2026-01-01T00:00:00"
+
+
+def test_missing_column_is_filled_with_default(tmp_path):
+    session = _session(tmp_path)
+    session.execute(text("ALTER TABLE stories DROP COLUMN version"))
+    session.execute(text("INSERT INTO stories (id, title, content, author_id) VALUES (1, '旧', '内容', 1)"))
+    session.commit()
+
+    records = load_tables(session, {"stories": StoryDB})["stories"]
+    assert records[1]["version"] == 1
+
+
+def test_merge_keeps_unsynced_local_changes():
+    data = {"stories": {1: {"id": 1, "title": "本地修改"}, 2: {"id": 2, "title": "待删除"}}}
+    loaded = {"stories": {1: {"id": 1, "title": "库中旧值"}, 2: {"id": 2, "title": "库中"}, 3: {"id": 3, "title": "新"}}}
+
+    merge_into_cache(data, loaded, {"stories": {1}}, {"stories": {2}})
+    assert data["stories"] == {1: {"id": 1, "title": "本地修改"}, 3: {"id": 3, "title": "新"}}
+
+
+def test_merge_reapplies_pending_counter_deltas():
+    data = {"users": {1: {"id": 1, "active_count": 8}, 2: {"id": 2, "active_count": 4}}}
+    loaded = {"users": {1: {"id": 1, "active_count": 5}, 2: {"id": 2, "active_count": 1}}}
+    # 用户2整行已修改，缓存中的值已包含增量
+    merge_into_cache(data, loaded, {"users": {2}}, {"users": set()},
+                     {"users": {1: {"active_count": 3}, 2: {"active_count": 3}}})
+    assert data["users"][1]["active_count"] == 8
+    assert data["users"][2]["active_count"] == 4
@@ -0,0 +1,123 @@
+"""
+测试缓存同步：按版本保护的批量盲写与计数增量
+"""
+
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base, StoryDB, UserDB
+from cache_sync import upsert_rows, delete_rows, flush_counter_deltas
+from query_stats import query_stats
+
+
+def _session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sync.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def _story(story_id, title, version):
+    return {
+        "id": story_id,
+        "title": title,
+        "content": "内容",
+        "author_id": 1,
+        "tags": "",
+        "created_at": datetime(2026, 1, 1),
+        "updated_at": datetime(2026, 1, 1),
+        "version": version
+    }
+
+
+def test_upsert_inserts_and_updates_newer_versions(tmp_path):
+    session = _session(tmp_path)
+    upsert_rows(session, StoryDB, [_story(1, "第一版", 1), _story(2, "另一篇", 1)])
+    session.commit()
+
+    upsert_rows(session, StoryDB, [_story(1, "第二版", 2)])
+    session.commit()
+
+    assert session.get(StoryDB, 1).title == "第二版"
+    assert session.get(StoryDB, 1).version == 2
+    assert session.get(StoryDB, 2).title == "另一篇"
+
+
+def test_stale_version_never_overwrites_newer_row(tmp_path):
+    session = _session(tmp_path)
+    upsert_rows(session, StoryDB, [_story(1, "新数据", 3)])
+    session.commit()
+
+    # 另一个工作进程持有旧版本，写入应被忽略
+    upsert_rows(session, StoryDB, [_story(1, "旧数据", 2), _story(1, "同版本", 3)])
+    session.commit()
+    session.expire_all()
+
+    assert session.get(StoryDB, 1).title == "新数据"
+
+
+def test_upsert_is_one_statement_per_table(tmp_path):
+    session = _session(tmp_path)
+    session.connection()
+    rows = [_story(story_id, f"故事{story_id}", 1) for story_id in range(1, 51)]
+
+    query_stats.reset()
+    with query_stats.track_operation("test_sync"):
+        upsert_rows(session, StoryDB, rows)
+        delete_rows(session, StoryDB, [1, 2, 3])
+    session.commit()
+
+    operation = query_stats.snapshot()["operations"]["test_sync"]
+    statements = [stats["statement"] for stats in operation["statements"]]
+    assert not any(statement.upper().startswith("SELECT") for statement in statements)
+    assert session.query(StoryDB).count() == 47
+
+
+def _user(user_id, active_count, version):
+    return {
+        "id": user_id,
+        "username": f"user{user_id}",
+        "email": f"user{user_id}@example.com",
+        "password_hash": "hash",
+        "role": "user",
+        "registered_at": datetime(2026, 1, 1),
+        "active_count": active_count,
+        "points": 0,
+        "credit": 100.0,
+        "version": version
+    }
+
+
+def test_counter_deltas_from_two_workers_add_up(tmp_path):
+    session = _session(tmp_path)
+    # 新用户在同步前已累计3次活跃：插入基数0，再累加增量
+    deltas = {1: {"active_count": 3}}
+    upsert_rows(session, UserDB, [_user(1, 3, 1)], deltas)
+    flush_counter_deltas(session, UserDB, deltas)
+    session.commit()
+    assert session.get(UserDB, 1).active_count == 3
+
+    # 两个工作进程各自累计的增量都应保留
+    flush_counter_deltas(session, UserDB, {1: {"active_count": 2}})
+    flush_counter_deltas(session, UserDB, {1: {"active_count": 5, "points": 10}})
+    session.commit()
+    session.expire_all()
+    user = session.get(UserDB, 1)
+    assert user.active_count == 10
+    assert user.points == 10
+
+
+def test_full_row_write_does_not_overwrite_counters(tmp_path):
+    session = _session(tmp_path)
+    upsert_rows(session, UserDB, [_user(1, 0, 1)])
+    flush_counter_deltas(session, UserDB, {1: {"active_count": 7}})
+    session.commit()
+
+    # 修改角色时缓存中的计数是旧值，整行写入不应覆盖计数列
+    row = _user(1, 1, 2)
+    row["role"] = "admin"
+    upsert_rows(session, UserDB, [row], {})
+    session.commit()
+    session.expire_all()
+    user = session.get(UserDB, 1)
+    assert user.role == "admin"
+    assert user.active_count == 7
@@ -0,0 +1,43 @@
+"""
+测试模板片段缓存扩展
+"""
+
+from jinja2 import Environment, DictLoader
+from fragment_cache import FragmentCache, FragmentCacheExtension
+from cache_versions import EntityVersions
+
+
+def _env(template):
+    versions = EntityVersions()
+    env = Environment(loader=DictLoader({"page.html": template}), autoescape=True,
+                      extensions=[FragmentCacheExtension])
+    env.fragment_cache = FragmentCache()
+    env.globals["entity_version"] = versions.version
+    return env, versions
+
+
+def test_fragment_is_reused_until_entity_version_changes():
+    env, versions = _env(
+        '{% cache "body", entity_version("story:1") %}{{ render() }}{% endcache %}|{{ user }}'
+    )
+    calls = []
+
+    def render():
+        calls.append(1)
+        return f"第{len(calls)}次"
+
+    template = env.get_template("page.html")
+    assert template.render(render=render, user="甲") == "第1次|甲"
+    # 片段外的用户相关部分每次都重新渲染
+    assert template.render(render=render, user="乙") == "第1次|乙"
+
+    versions.bump("story:1")
+    assert template.render(render=render, user="乙") == "第2次|乙"
+    assert env.fragment_cache.stats()["hits"] == 1
+
+
+def test_cached_fragment_is_not_escaped_twice():
+    env, _ = _env('{% cache "c", 1 %}<b>{{ text }}</b>{% endcache %}')
+    template = env.get_template("page.html")
+    assert template.render(text="<i>") == "<b>&lt;i&gt;</b>"
+    assert template.render(text="<i>") == "<b>&lt;i&gt;</b>"
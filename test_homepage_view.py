@@ -0,0 +1,71 @@
+"""
+测试物化的首页视图随缓存增量更新
+"""
+
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base, StoryDB, UserDB
+from local_cache import LocalCache
+from homepage_view import HomepageView
+
+
+def _story(story_id, day, tags="奇幻, 冒险"):
+    return {
+        "id": story_id,
+        "title": f"故事{story_id}",
+        "content": f"第一段{story_id}\n\n第二段",
+        "author_id": 1,
+        "tags": tags,
+        "created_at": datetime(2026, 1, day),
+        "updated_at": datetime(2026, 1, day)
+    }
+
+
+def _view(limit=2):
+    cache = LocalCache()
+    cache.add("users", {"id": 1, "username": "作者甲"})
+    cache.add("stories", _story(1, 1))
+    return cache, HomepageView(cache=cache, limit=limit)
+
+
+def test_cards_are_precomputed_without_touching_cached_rows():
+    cache, view = _view()
+    card = view.page()[0]
+
+    assert card["author_name"] == "作者甲"
+    assert card["tags"] == ["奇幻", "冒险"]
+    assert card["content_html"] == "<p>第一段1...</p>"
+    assert "excerpt" not in cache.get("stories", 1)
+    assert cache.get("stories", 1)["tags"] == "奇幻, 冒险"
+
+
+def test_view_follows_create_edit_and_delete():
+    cache, view = _view()
+    cache.add("stories", _story(2, 3))
+    cache.add("stories", _story(3, 2))
+    assert [card["id"] for card in view.page()] == [2, 3]
+
+    edited = dict(cache.get("stories", 3), title="新标题")
+    cache.update("stories", edited)
+    assert view.page()[1]["title"] == "新标题"
+
+    cache.delete("stories", 2)
+    assert [card["id"] for card in view.page()] == [3, 1]
+
+    cache.update("users", {"id": 1, "username": "作者乙"})
+    assert view.page()[0]["author_name"] == "作者乙"
+
+
+def test_warmup_reload_rebuilds_view(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'home.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(UserDB(id=1, username="作者甲", email="a@example.com", password_hash="hash"))
+    session.add(StoryDB(id=5, title="已保存的故事", content="内容", author_id=1, created_at=datetime(2026, 2, 1)))
+    session.commit()
+
+    cache = LocalCache()
+    view = HomepageView(cache=cache)
+    cache.load_from_db(session)
+    assert [card["title"] for card in view.page()] == ["已保存的故事"]
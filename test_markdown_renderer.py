@@ -0,0 +1,70 @@
+"""
+测试按内容哈希缓存的Markdown渲染服务
+"""
+
+from markdown_renderer import MarkdownRenderer, RENDERER_VERSION, ensure_content_html, rerender_stale
+
+
+def test_repeated_content_is_rendered_once():
+    renderer = MarkdownRenderer()
+    assert renderer.render("**粗体**") == "<p><strong>粗体</strong></p>"
+    assert renderer.render("**粗体**") == "<p><strong>粗体</strong></p>"
+
+    stats = renderer.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert renderer.render("") == ""
+
+
+def test_byte_limit_evicts_least_recently_used():
+    renderer = MarkdownRenderer(max_bytes=60)
+    renderer.render("第一段内容")
+    renderer.render("第二段内容")
+    renderer.render("第一段内容")
+    renderer.render("第三段内容")
+
+    stats = renderer.stats()
+    assert stats["bytes"] <= 60
+    assert stats["evictions"] == 1
+    # 最近用过的第一段仍在缓存中
+    renderer.render("第一段内容")
+    assert renderer.stats()["hits"] == 2
+
+
+def test_invalidate_removes_entry():
+    renderer = MarkdownRenderer()
+    renderer.render("内容")
+    assert renderer.invalidate("内容")
+    assert not renderer.invalidate("内容")
+    assert renderer.stats()["bytes"] == 0
+
+
+def test_old_rows_are_backfilled_once():
+    backfilled = []
+    item = {"id": 1, "content": "*旧内容*"}
+
+    assert ensure_content_html(item, backfilled.append) == "<p><em>旧内容</em></p>"
+    assert item["content_html_version"] == RENDERER_VERSION
+    ensure_content_html(item, backfilled.append)
+    assert backfilled == [item]
+
+
+def test_stale_renderer_version_is_rerendered():
+    items = [
+        {"id": 1, "content": "新", "content_html": "<p>新</p>", "content_html_version": RENDERER_VERSION},
+        {"id": 2, "content": "旧", "content_html": "<p>旧</p>", "content_html_version": RENDERER_VERSION - 1}
+    ]
+    assert rerender_stale(items) == 1
+    assert items[1]["content_html_version"] == RENDERER_VERSION
+
+
+def test_renderer_version_change_does_not_reuse_cached_html(monkeypatch):
+    import markdown_renderer as module
+    item = {"id": 1, "content": "第一行\n第二行"}
+    module.render_content_html(item)
+    assert "<br" not in item["content_html"]
+
+    monkeypatch.setattr(module, "MARKDOWN_EXTENSIONS", ["nl2br"])
+    monkeypatch.setattr(module, "RENDERER_VERSION", RENDERER_VERSION + 1)
+    assert rerender_stale([item]) == 1
+    assert "<br" in item["content_html"]
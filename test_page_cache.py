@@ -0,0 +1,154 @@
+"""
+测试匿名用户整页缓存：标签精确失效、登录用户绕过、过期后后台刷新、并发未命中合并和条件请求
+"""
+
+import asyncio
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse
+from cache_versions import EntityVersions
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from page_cache import PageCache, PageCacheMiddleware, is_not_modified
+
+
+def _app(ttl=60.0, stale_ttl=0.0, delay=0.0):
+    versions = EntityVersions()
+    cache = PageCache(ttl=ttl, stale_ttl=stale_ttl, versions=versions)
+    renders = {"count": 0}
+    app = FastAPI()
+    app.add_middleware(PageCacheMiddleware, cache=cache)
+
+    @app.get("/stories/{story_id}", response_class=HTMLResponse)
+    async def read_story(story_id: int):
+        renders["count"] += 1
+        await asyncio.sleep(delay)
+        return f"故事{story_id} 第{renders['count']}次渲染"
+
+    @app.get("/discussions", response_class=HTMLResponse)
+    async def list_discussions():
+        renders["count"] += 1
+        return "讨论列表"
+
+    return app, cache, versions, renders
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_anonymous_pages_are_cached_and_logged_in_users_bypass():
+    app, cache, _, renders = _app()
+
+    async def run():
+        async with _client(app) as client:
+            first = await client.get("/stories/1")
+            second = await client.get("/stories/1")
+            assert second.text == first.text
+            assert second.headers["x-page-cache"] == "hit"
+            client.cookies.set("user_id", "7")
+            assert "x-page-cache" not in (await client.get("/stories/1")).headers
+
+    asyncio.run(run())
+    assert renders["count"] == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_tags_invalidate_only_dependent_pages():
+    app, cache, versions, renders = _app()
+
+    async def run():
+        async with _client(app) as client:
+            await client.get("/stories/1")
+            await client.get("/stories/2")
+            await client.get("/discussions")
+            versions.bump("story:1")
+            assert "第4次渲染" in (await client.get("/stories/1")).text
+            assert (await client.get("/stories/2")).headers["x-page-cache"] == "hit"
+            assert (await client.get("/discussions")).headers["x-page-cache"] == "hit"
+
+    asyncio.run(run())
+    assert renders["count"] == 4
+
+
+def test_concurrent_misses_render_once():
+    app, cache, _, renders = _app(delay=0.05)
+
+    async def run():
+        async with _client(app) as client:
+            responses = await asyncio.gather(*(client.get("/stories/1") for _ in range(5)))
+            assert len({response.text for response in responses}) == 1
+
+    asyncio.run(run())
+    assert renders["count"] == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_stale_page_is_served_while_revalidating():
+    app, cache, _, renders = _app(ttl=0.0, stale_ttl=60.0)
+
+    async def run():
+        async with _client(app) as client:
+            await client.get("/stories/1")
+            stale = await client.get("/stories/1")
+            assert stale.headers["x-page-cache"] == "stale"
+            assert "第1次渲染" in stale.text
+            await asyncio.gather(*cache.background)
+            assert "第2次渲染" in (await client.get("/stories/1")).text
+
+    asyncio.run(run())
+    # TTL为0，第三次请求返回刷新后的页面时又触发一次后台刷新
+    assert cache.stats()["revalidations"] == 2
+
+
+def test_if_none_match_returns_304_without_rendering():
+    app, cache, versions, renders = _app()
+
+    async def run():
+        async with _client(app) as client:
+            first = await client.get("/stories/1")
+            assert first.headers["cache-control"].startswith("public")
+            etag = first.headers["etag"]
+            not_modified = await client.get("/stories/1", headers={"If-None-Match": etag})
+            assert not_modified.status_code == 304
+            assert not_modified.headers["etag"] == etag
+            assert not_modified.content == b""
+
+            versions.bump("story:1")
+            changed = await client.get("/stories/1", headers={"If-None-Match": etag})
+            assert changed.status_code == 200
+            assert changed.headers["etag"] != etag
+
+    asyncio.run(run())
+    assert renders["count"] == 2
+    assert cache.stats()["not_modified"] == 1
+
+
+def test_authenticated_responses_are_private_and_per_user():
+    app, cache, versions, renders = _app()
+
+    async def run():
+        async with _client(app) as client:
+            anonymous = await client.get("/stories/1")
+            client.cookies.set("user_id", "7")
+            private = await client.get("/stories/1")
+            assert private.headers["cache-control"] == "private, no-cache"
+            assert private.headers["etag"] != anonymous.headers["etag"]
+            assert (await client.get("/stories/1", headers={"If-None-Match": private.headers["etag"]})).status_code == 304
+
+            # 用户资料变更后，用户自己的页面头部需要重新渲染
+            versions.bump("user:7")
+            assert (await client.get("/stories/1", headers={"If-None-Match": private.headers["etag"]})).status_code == 200
+
+    asyncio.run(run())
+
+
+def test_if_modified_since_needs_a_strictly_older_version():
+    fetched_at = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    header = {"if-modified-since": format_datetime(fetched_at, usegmt=True)}
+    # 客户端在12:00:00.2取得页面，之后同一秒内又有修改
+    assert not is_not_modified(header, 'W/"a"', fetched_at.replace(microsecond=700000))
+    assert is_not_modified(header, 'W/"a"', datetime(2026, 1, 1, 11, 59, 59, 900000, tzinfo=timezone.utc))
+    # 带ETag验证时只比较ETag
+    assert not is_not_modified(dict(header, **{"if-none-match": 'W/"b"'}), 'W/"a"',
+                               datetime(2026, 1, 1, 11, 0, tzinfo=timezone.utc))
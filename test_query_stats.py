@@ -0,0 +1,101 @@
+"""
+测试SQL语句统计：语句规范化、延迟直方图、路由归属和预算告警
+"""
+
+import logging
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from query_stats import StatementStats, UNTRACKED_OPERATION, normalize_statement, query_stats, track_request_queries
+
+
+def test_normalize_statement_strips_literals_and_list_lengths():
+    assert normalize_statement("SELECT * FROM users WHERE id = 42 AND name = 'a''b'") == \
+        "SELECT * FROM users WHERE id = ? AND name = ?"
+    assert normalize_statement("DELETE FROM stories WHERE id IN (?, ?, ?)") == \
+        normalize_statement("DELETE FROM stories WHERE id IN (?)")
+    assert normalize_statement("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)\n  ") == \
+        "INSERT INTO t (a, b) VALUES (?, ?), ..."
+
+
+def test_histogram_buckets_by_latency():
+    stats = StatementStats()
+    stats.record(0.0005, 0)
+    stats.record(0.003, 0)
+    stats.record(5.0, 0)
+
+    histogram = stats.to_dict("SELECT ?")["histogram"]
+    assert histogram["<=1ms"] == 1
+    assert histogram["<=5ms"] == 1
+    assert histogram[">1000ms"] == 1
+    assert stats.count == 3
+
+
+def test_select_rows_are_counted_when_fetched():
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        connection.execute(text("CREATE TABLE t (x INTEGER)"))
+        connection.execute(text("INSERT INTO t VALUES (1), (2), (3)"))
+        query_stats.reset()
+        with query_stats.track_operation("test_rows"):
+            connection.execute(text("SELECT x FROM t")).fetchall()
+
+    statements = query_stats.snapshot()["operations"]["test_rows"]["statements"]
+    assert statements[0]["rows"] == 3
+
+
+def test_requests_are_attributed_to_route_template():
+    engine = create_engine("sqlite://")
+    app = FastAPI()
+    app.middleware("http")(track_request_queries)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        with engine.connect() as connection:
+            return {"value": connection.execute(text("SELECT :v"), {"v": item_id}).scalar()}
+
+    query_stats.reset()
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+
+    operation = query_stats.snapshot()["operations"]["GET /items/{item_id}"]
+    assert operation["runs"] == 2
+    assert operation["total_statements"] == 2
+
+
+def test_streamed_body_queries_are_attributed_to_route():
+    engine = create_engine("sqlite://")
+    app = FastAPI()
+    app.middleware("http")(track_request_queries)
+
+    @app.get("/pages/{page_id}")
+    def read_page(page_id: int):
+        # 模板边渲染边发送时才执行的语句
+        def body():
+            yield "<html>"
+            with engine.connect() as connection:
+                yield str(connection.execute(text("SELECT :v"), {"v": page_id}).scalar())
+            yield "</html>"
+        return StreamingResponse(body(), media_type="text/html")
+
+    query_stats.reset()
+    client = TestClient(app)
+    assert client.get("/pages/7").text == "<html>7</html>"
+
+    operations = query_stats.snapshot()["operations"]
+    assert operations["GET /pages/{page_id}"]["total_statements"] == 1
+    assert UNTRACKED_OPERATION not in operations
+
+
+def test_budget_warning_is_logged(caplog):
+    engine = create_engine("sqlite://")
+    query_stats.reset()
+    with caplog.at_level(logging.WARNING, logger="query_stats"):
+        with query_stats.track_operation("over_budget", budget=1), engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+
+    assert query_stats.snapshot()["operations"]["over_budget"]["budget_exceeded_runs"] == 1
+    assert any("超出预算" in record.getMessage() for record in caplog.records)
@@ -0,0 +1,85 @@
+"""
+测试读写分离：用两个SQLite文件分别模拟主库和只读副本
+"""
+
+import shutil
+from database import Base, StoryDB
+from database_connection import DatabaseConnectionManager
+
+
+def _create_manager(tmp_path):
+    primary_path = tmp_path / "primary.db"
+    replica_path = tmp_path / "replica.db"
+    manager = DatabaseConnectionManager(
+        database_url=f"sqlite:///{primary_path}",
+        replica_urls=[f"sqlite:///{replica_path}"]
+    )
+    Base.metadata.create_all(bind=manager.engine)
+    Base.metadata.create_all(bind=manager.replica_engines[0])
+    return manager, primary_path, replica_path
+
+
+def _replicate(manager, primary_path, replica_path):
+    """复制主库文件到副本，模拟副本追上主库"""
+    manager.engine.dispose()
+    manager.replica_engines[0].dispose()
+    shutil.copyfile(primary_path, replica_path)
+
+
+def _bound_path(session):
+    return session.get_bind().url.database
+
+
+def test_reads_use_replica_when_no_sync_happened(tmp_path):
+    manager, _, replica_path = _create_manager(tmp_path)
+
+    session = manager.get_read_session()
+    try:
+        assert _bound_path(session) == str(replica_path)
+    finally:
+        session.close()
+
+
+def test_lagging_replica_falls_back_to_primary(tmp_path):
+    manager, primary_path, replica_path = _create_manager(tmp_path)
+
+    session = manager.get_session()
+    session.add(StoryDB(id=1, title="标题", content="内容", author_id=1))
+    watermark = manager.commit_sync(session)
+    session.close()
+    assert manager.last_sync_watermark == watermark
+
+    # 副本尚未复制到最新水位，读取必须回到主库
+    session = manager.get_read_session()
+    try:
+        assert _bound_path(session) == str(primary_path)
+        assert session.get(StoryDB, 1) is not None
+    finally:
+        session.close()
+
+    _replicate(manager, primary_path, replica_path)
+    manager.replica_last_check[0] = 0.0
+
+    session = manager.get_read_session()
+    try:
+        assert _bound_path(session) == str(replica_path)
+        assert session.get(StoryDB, 1).title == "标题"
+    finally:
+        session.close()
+
+
+def test_new_manager_starts_from_primary_watermark(tmp_path):
+    manager, primary_path, replica_path = _create_manager(tmp_path)
+    session = manager.get_session()
+    watermark = manager.commit_sync(session)
+    session.close()
+
+    # 新进程启动时从主库读取水位，落后的副本不会被用于预热
+    restarted = DatabaseConnectionManager(
+        database_url=f"sqlite:///{primary_path}",
+        replica_urls=[f"sqlite:///{replica_path}"]
+    )
+    assert restarted.last_sync_watermark == watermark
+
+    result = restarted.execute_read_with_retry(lambda s: _bound_path(s))
+    assert result == str(primary_path)
@@ -0,0 +1,72 @@
+"""
+测试静态文件构建：带指纹的文件名、CSS引用替换、预压缩文件的返回和永久缓存头
+"""
+
+import gzip
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from static_assets import StaticAssets, PrecompressedStaticFiles, IMMUTABLE_CACHE_CONTROL, build_assets, minify_css, minify_js
+
+
+def make_static_dir(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "js").mkdir()
+    (tmp_path / "bg.png").write_bytes(b"\x89PNG")
+    (tmp_path / "css" / "styles.css").write_text("/* 注释 */\nbody {\n  background: url('/static/bg.png');\n}\n")
+    (tmp_path / "js" / "scripts.js").write_text("// 注释\nfunction f() {\n    return 1;\n}\n" * 20)
+    return tmp_path
+
+
+def test_build_fingerprints_assets_and_rewrites_css_references(tmp_path):
+    static_dir = make_static_dir(tmp_path)
+    manifest = build_assets(str(static_dir), minify=True)
+
+    assert set(manifest) == {"bg.png", "css/styles.css", "js/scripts.js"}
+    css = (static_dir / "dist" / manifest["css/styles.css"]).read_text()
+    assert f"/static/dist/{manifest['bg.png']}" in css
+    assert "注释" not in css
+    assert (static_dir / "dist" / (manifest["js/scripts.js"] + ".gz")).exists()
+    assert not (static_dir / "dist" / (manifest["bg.png"] + ".gz")).exists()
+
+    # 内容不变时指纹不变
+    assert build_assets(str(static_dir), minify=True) == manifest
+    assets = StaticAssets(str(static_dir))
+    assert assets.url("css/styles.css") == f"/static/dist/{manifest['css/styles.css']}"
+    assert assets.url("missing.js") == "/static/missing.js"
+
+
+def test_serves_precompressed_variant_with_immutable_cache(tmp_path):
+    static_dir = make_static_dir(tmp_path)
+    manifest = build_assets(str(static_dir))
+    app = FastAPI()
+    app.mount("/static", PrecompressedStaticFiles(directory=str(static_dir)), name="static")
+    client = TestClient(app)
+    url = f"/static/dist/{manifest['js/scripts.js']}"
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert "javascript" in response.headers["content-type"]
+    assert response.text == (static_dir / "js" / "scripts.js").read_text()
+    assert int(response.headers["content-length"]) == len(gzip.compress(response.content, compresslevel=9, mtime=0))
+
+    # 不接受压缩的客户端拿到原文件，未构建的路径不加永久缓存
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert "immutable" not in client.get("/static/js/scripts.js").headers.get("cache-control", "")
+
+
+def test_css_minifier_keeps_descendant_pseudo_selectors_and_strings():
+    css = "a :hover , .x :not(.y) > b {\n  color : red ;\n  content: \"a  ;  b\";\n}\n" \
+          "@media (max-width: 600px) {\n  .a :hover { margin : 0 auto ; }\n}\n"
+    assert minify_css(css) == 'a :hover,.x :not(.y)>b{color:red;content:"a  ;  b"}' \
+                              "@media (max-width: 600px){.a :hover{margin:0 auto}}"
+
+
+def test_js_minifier_leaves_template_literals_and_strings_alone():
+    js = "function f() {\n    // 注释\n    const s = `\n  // 不是注释\n\n  ${ {a: 1}.a }\n  `;\n\n    return 'x//y';\n}\n"
+    assert minify_js(js) == "function f() {\n// 注释\nconst s = `\n  // 不是注释\n\n  ${ {a: 1}.a }\n  `;\nreturn 'x//y';\n}\n"
+    # 无法确定字符串边界时原样返回
+    assert minify_js("var r = /'/;\n  x();\n") == "var r = /'/;\n  x();\n"
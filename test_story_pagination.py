@@ -0,0 +1,80 @@
+"""
+测试故事页章节和评论的游标分页
+"""
+
+import json
+import base64
+import pytest
+from datetime import datetime
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from database import get_db
+from local_cache import local_cache
+from pagination import decode_cursor, encode_cursor, paginate
+from routers import stories
+
+STORY_ID = 880001
+
+
+def test_cursor_round_trip_and_ties_are_ordered_by_id():
+    now = datetime(2026, 1, 1)
+    items = [{"id": item_id, "created_at": now} for item_id in (1, 2, 3)]
+    assert decode_cursor(encode_cursor(items[0])) == (now, 1)
+
+    first, cursor = paginate(items, None, 2)
+    second, last_cursor = paginate(items, cursor, 2)
+    assert [item["id"] for item in first + second] == [1, 2, 3]
+    assert last_cursor is None
+
+
+@pytest.mark.parametrize("payload", [
+    ["2024-01-01T00:00:00+00:00", 1],
+    ["2024-01-01T00:00:00", "x"],
+    ["2024-01-01T00:00:00", None],
+    ["2024-01-01T00:00:00", True],
+    [20240101, 1],
+])
+def test_cursor_with_wrong_types_is_rejected(payload):
+    cursor = base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def _populate(chapters, comments):
+    now = datetime(2026, 1, 1)
+    local_cache.add("stories", {"id": STORY_ID, "title": "分页", "content": "正文", "author_id": 1,
+                                "tags": "", "created_at": now, "updated_at": now})
+    for index in range(1, chapters + 1):
+        local_cache.add("story_chapters", {"id": STORY_ID * 10 + index, "story_id": STORY_ID,
+                                           "content": f"第{index}章", "author_id": 1, "author_name": "甲",
+                                           "created_at": datetime(2026, 1, 1, 0, index)})
+    for index in range(1, comments + 1):
+        local_cache.add("chapter_comments", {"id": STORY_ID * 100 + index, "chapter_id": STORY_ID * 10 + 1,
+                                             "content": f"评论{index}", "author_id": 1, "author_name": "乙",
+                                             "created_at": datetime(2026, 1, 2, 0, index)})
+
+
+def test_chapter_and_comment_pages_follow_cursor():
+    _populate(chapters=stories.CHAPTER_PAGE_SIZE + 3, comments=stories.COMMENT_PAGE_SIZE + 2)
+    app = FastAPI()
+    app.include_router(stories.router)
+    app.dependency_overrides[get_db] = lambda: None
+    client = TestClient(app)
+
+    first = client.get(f"/api/stories/{STORY_ID}/chapters").json()
+    assert len(first["chapters"]) == stories.CHAPTER_PAGE_SIZE
+    assert first["chapters"][0]["number"] == 2
+    assert "加载更多评论" in first["chapters"][0]["html"]
+    second = client.get(f"/api/stories/{STORY_ID}/chapters", params={"after": first["next_cursor"]}).json()
+    assert [chapter["number"] for chapter in second["chapters"]] == [stories.CHAPTER_PAGE_SIZE + offset for offset in (2, 3, 4)]
+    assert second["next_cursor"] is None
+
+    comments = client.get(f"/api/chapters/{STORY_ID * 10 + 1}/comments", params={"after": "无效"})
+    assert comments.status_code == 400
+    aware = base64.urlsafe_b64encode(json.dumps(["2024-01-01T00:00:00+00:00", 1]).encode("utf-8")).decode("ascii")
+    assert client.get(f"/api/chapters/{STORY_ID * 10 + 1}/comments", params={"after": aware}).status_code == 400
+    assert client.get(f"/api/stories/{STORY_ID}/chapters", params={"after": aware}).status_code == 400
+    page = client.get(f"/api/chapters/{STORY_ID * 10 + 1}/comments").json()
+    rest = client.get(f"/api/chapters/{STORY_ID * 10 + 1}/comments", params={"after": page["next_cursor"]}).json()
+    assert len(page["comments"]) + len(rest["comments"]) == stories.COMMENT_PAGE_SIZE + 2
+    assert "<li>" in rest["comments"][0]["html"]
@@ -0,0 +1,47 @@
+"""
+测试流式模板响应
+"""
+
+from datetime import datetime
+from cache_versions import entity_versions, story_tag
+from crud import get_content_html
+from local_cache import local_cache
+from templates_config import _buffered
+
+
+def test_head_is_flushed_before_body_is_rendered():
+    rendered = []
+
+    def chunks():
+        yield "<html><head><title>t</title>"
+        yield "</head><body>"
+        for index in range(3):
+            rendered.append(index)
+            yield f"<p>{index}</p>"
+        yield "</body></html>"
+
+    stream = _buffered(chunks(), chunk_size=1024)
+    assert next(stream).endswith("</head><body>")
+    # 头部发送时正文还没有渲染
+    assert rendered == []
+    assert "".join(stream) == "<p>0</p><p>1</p><p>2</p></body></html>"
+
+
+def test_small_chunks_are_merged_up_to_chunk_size():
+    parts = list(_buffered(("x" * 10 for _ in range(10)), chunk_size=30))
+    assert [len(part) for part in parts] == [30, 30, 30, 10]
+
+
+def test_backfill_during_render_does_not_invalidate_the_page():
+    story_id = 870001
+    local_cache.add("stories", {"id": story_id, "title": "补渲染", "content": "正文", "author_id": 1,
+                                "tags": "", "created_at": datetime(2026, 1, 1), "updated_at": datetime(2026, 1, 1)})
+    chapter = local_cache.add("story_chapters", {"id": story_id * 10, "story_id": story_id, "content": "**旧章节**",
+                                                 "author_id": 1, "author_name": "甲", "created_at": datetime(2026, 1, 1)})
+    local_cache.modified["story_chapters"].discard(chapter["id"])
+    before = entity_versions.snapshot([story_tag(story_id)])
+
+    # 流式渲染中途补渲染旧行：写回缓存等待同步，但整页缓存依赖的版本不变
+    assert get_content_html("story_chapters", chapter) == "<p><strong>旧章节</strong></p>"
+    assert entity_versions.snapshot([story_tag(story_id)]) == before
+    assert chapter["id"] in local_cache.modified["story_chapters"]
@@ -0,0 +1,63 @@
+"""
+测试定期同步：同步线程同时同步两个本地缓存，计数增量和crud表的修改写入数据库
+"""
+
+import threading
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base, UserDB
+from local_cache import LocalCache
+import local_cache as local_cache_module
+import sync_service
+
+
+class FakeEnhancedCache:
+    def __init__(self):
+        self.calls = 0
+
+    def sync_to_db_with_fallback(self):
+        self.calls += 1
+        return True
+
+
+def test_periodic_sync_flushes_local_cache_counters(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sync.db'}")
+    Base.metadata.create_all(bind=engine)
+    make_session = sessionmaker(bind=engine)
+    monkeypatch.setattr(local_cache_module.db_manager, "get_session", make_session)
+
+    cache = LocalCache()
+    enhanced = FakeEnhancedCache()
+    monkeypatch.setattr(sync_service, "local_cache", cache)
+    monkeypatch.setattr(sync_service, "enhanced_local_cache", enhanced)
+
+    cache.add("users", {"id": 1, "username": "user1", "email": "user1@example.com", "password_hash": "hash",
+                        "role": "user", "registered_at": datetime(2026, 1, 1), "active_count": 0,
+                        "points": 0, "credit": 100.0})
+    cache.increment("users", 1, "active_count", 3)
+    cache.increment("users", 1, "points", 5)
+
+    # 第一轮同步后停止线程
+    stop = threading.Event()
+    original = sync_service.sync_all_caches
+
+    def sync_once():
+        try:
+            return original()
+        finally:
+            stop.set()
+
+    monkeypatch.setattr(sync_service, "sync_all_caches", sync_once)
+    sync_service.sync_to_db_periodically(interval=0, stop=stop)
+
+    assert enhanced.calls == 1
+    user = make_session().get(UserDB, 1)
+    assert (user.active_count, user.points) == (3, 5)
+    assert not cache.modified["users"]
+    assert not cache.counter_deltas["users"]
+
+    # 下一次同步只累加新的增量
+    cache.increment("users", 1, "points", 2)
+    assert sync_service.sync_all_caches()
+    assert make_session().get(UserDB, 1).points == 7
@@ -0,0 +1,23 @@
+"""
+测试生产模式模板环境：关闭修改检查、字节码缓存和启动预编译
+"""
+
+import os
+from datetime import datetime
+from templates_config import create_template_environment, precompile_templates
+
+
+def test_production_environment_precompiles_into_shared_bytecode_cache(tmp_path):
+    env = create_template_environment(production=True, bytecode_cache_dir=str(tmp_path))
+    assert env.auto_reload is False
+
+    count = precompile_templates(env)
+    assert count == len(env.list_templates(extensions=["html"]))
+    assert len(os.listdir(tmp_path)) == count
+
+    # 另一个工作进程从同一目录加载字节码，渲染结果与开发模式一致
+    other = create_template_environment(production=True, bytecode_cache_dir=str(tmp_path))
+    development = create_template_environment(production=False)
+    context = {"comment": {"author_name": "甲", "content_html": "<p>x</p>", "created_at": datetime(2026, 1, 1)}}
+    assert other.get_template("comment_item.html").render(context) == \
+        development.get_template("comment_item.html").render(context)
@@ -0,0 +1,55 @@
+"""
+测试故事树缓存：只移除包含变更节点的树，按节点总数限制容量，构建期间的写入不会留下旧树
+"""
+
+from enhanced_local_cache import enhanced_local_cache, TREE_TABLE
+from markdown_renderer import render_content_html
+from routers.tree import get_story_tree
+from tree_cache import TreeCache, tree_cache
+from test_tree_index import make_node
+
+# 使用不会与其他数据冲突的节点ID
+BASE = 900000
+
+
+def test_edit_invalidates_only_trees_containing_the_node():
+    shape = [(1, None), (2, 1), (3, 2), (4, 1), (5, None), (6, 5)]
+    for node_id, parent_id in shape:
+        node = render_content_html(make_node(BASE + node_id, parent_id and BASE + parent_id))
+        enhanced_local_cache.add_item(TREE_TABLE, BASE + node_id, node)
+    try:
+        for root in (1, 2, 4, 5):
+            get_story_tree(BASE + root)
+        assert all(tree_cache.get(BASE + root) for root in (1, 2, 4, 5))
+
+        enhanced_local_cache.update_item(TREE_TABLE, BASE + 3, {"title": "新标题"})
+        assert tree_cache.get(BASE + 1) is None
+        assert tree_cache.get(BASE + 2) is None
+        assert tree_cache.get(BASE + 4) is not None
+        assert tree_cache.get(BASE + 5) is not None
+
+        # 移动节点时原位置和新位置的树都失效
+        get_story_tree(BASE + 1)
+        enhanced_local_cache.update_item(TREE_TABLE, BASE + 4, {"parent_id": BASE + 5})
+        assert tree_cache.get(BASE + 1) is None
+        assert tree_cache.get(BASE + 5) is None
+        assert [child["id"] for child in get_story_tree(BASE + 5)[BASE + 5]["children"]] == [BASE + 4, BASE + 6]
+
+        enhanced_local_cache.delete_item(TREE_TABLE, BASE + 6)
+        assert tree_cache.get(BASE + 5) is None
+        assert TREE_TABLE in enhanced_local_cache.data and "cached_trees" not in enhanced_local_cache.data
+    finally:
+        for node_id, _ in shape:
+            enhanced_local_cache.delete_item(TREE_TABLE, BASE + node_id)
+
+
+def test_capacity_and_concurrent_write_during_build():
+    cache = TreeCache(max_nodes=10)
+    cache.store(1, {"a": 1}, 6, cache.token())
+    cache.store(2, {"b": 2}, 6, cache.token())
+    assert cache.get(1) is None and cache.get(2) == {"b": 2}
+    assert cache.stats()["evictions"] == 1
+
+    token = cache.token()
+    cache.invalidate([99])
+    assert not cache.store(3, {"c": 3}, 1, token)
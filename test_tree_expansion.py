@@ -0,0 +1,46 @@
+"""
+测试故事树按层展开：首屏只构建固定层数，展开接口返回子节点数、是否还有更多和卡片HTML
+"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from enhanced_local_cache import enhanced_local_cache, TREE_TABLE
+from markdown_renderer import render_content_html
+from routers import tree
+from test_tree_index import make_node
+
+# 使用不会与其他数据冲突的节点ID
+BASE = 910000
+
+
+def test_expansion_api_is_bounded_by_depth():
+    # 二叉树：节点i的父节点为i // 2，共5层
+    ids = range(1, 32)
+    for i in ids:
+        node = render_content_html(make_node(BASE + i, BASE + i // 2 if i > 1 else None))
+        enhanced_local_cache.add_item(TREE_TABLE, BASE + i, node)
+    try:
+        root = tree.get_story_tree(BASE + 1, 1)[BASE + 1]
+        assert [child["id"] for child in root["children"]] == [BASE + 2, BASE + 3]
+        assert all(child["has_more"] and not child["children"] for child in root["children"])
+        assert not root["has_more"]
+
+        app = FastAPI()
+        app.include_router(tree.router)
+        client = TestClient(app)
+        node = client.get(f"/api/tree/{BASE + 1}/nodes/{BASE + 2}", params={"depth": 2}).json()["node"]
+        assert node["child_count"] == 2
+        grandchildren = [grandchild for child in node["children"] for grandchild in child["children"]]
+        assert [grandchild["id"] for grandchild in grandchildren] == [BASE + 8, BASE + 9, BASE + 10, BASE + 11]
+        assert all(grandchild["has_more"] and not grandchild["children"] for grandchild in grandchildren)
+        assert 'class="expand-branch"' in grandchildren[0]["html"]
+        assert f'href="/tree/node/{BASE + 8}"' in grandchildren[0]["html"]
+
+        # 叶子节点没有展开按钮，不存在的节点返回404
+        leaf = client.get(f"/api/tree/{BASE + 1}/nodes/{BASE + 31}").json()["node"]
+        assert leaf["child_count"] == 0 and not leaf["has_more"]
+        assert "expand-branch" not in leaf["html"]
+        assert client.get(f"/api/tree/{BASE + 1}/nodes/{BASE + 99}").status_code == 404
+    finally:
+        for i in ids:
+            enhanced_local_cache.delete_item(TREE_TABLE, BASE + i)
@@ -0,0 +1,35 @@
+"""
+测试故事树探索页：前文按物化路径在服务端重建，链接只带节点ID
+"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from enhanced_local_cache import enhanced_local_cache, TREE_TABLE
+from markdown_renderer import render_content_html
+from routers import tree
+from test_tree_index import make_node
+
+# 使用不会与其他数据冲突的节点ID
+BASE = 920000
+
+
+def test_explore_rebuilds_story_so_far_from_path():
+    chain = [(1, None), (2, 1), (3, 2), (4, 3)]
+    for node_id, parent_id in chain:
+        node = make_node(BASE + node_id, parent_id and BASE + parent_id)
+        node["content"] = f"第{node_id}段**内容**"
+        node["option_title"] = f"选项{node_id}"
+        enhanced_local_cache.add_item(TREE_TABLE, BASE + node_id, render_content_html(node))
+    try:
+        app = FastAPI()
+        app.include_router(tree.router)
+        html = TestClient(app).get(f"/tree/explore/{BASE + 3}").text
+
+        # 前文包含起始节点到父节点的内容和之后选择的选项，不包含当前节点之后的内容
+        assert html.index("第1段<strong>内容</strong>") < html.index("选项2") < html.index("第2段<strong>内容</strong>")
+        assert "选项3" in html and "第4段" not in html
+        assert f'href="/tree/explore/{BASE + 4}"' in html
+        assert "former_text" not in html
+    finally:
+        for node_id, _ in chain:
+            enhanced_local_cache.delete_item(TREE_TABLE, BASE + node_id)
@@ -0,0 +1,109 @@
+"""
+测试故事树子节点索引：创建、移动、删除和全量加载后保持正确，构建大树时间为线性
+"""
+
+import time
+from enhanced_local_cache import EnhancedLocalCache, TREE_TABLE
+
+
+def make_node(node_id, parent_id):
+    return {"id": node_id, "parent_id": parent_id, "title": f"节点{node_id}", "option_title": "选项",
+            "content": "内容", "author_id": 1, "created_at": "2026-01-01T00:00:00"}
+
+
+def test_child_index_follows_create_reparent_and_delete():
+    cache = EnhancedLocalCache()
+    for node_id, parent_id in [(1, None), (2, 1), (4, 1), (3, 1), (5, None), (6, 3)]:
+        cache.add_item(TREE_TABLE, node_id, make_node(node_id, parent_id))
+
+    assert cache.get_child_ids(None) == [1, 5]
+    assert cache.get_child_ids(1) == [2, 3, 4]
+
+    cache.update_item(TREE_TABLE, 3, {"parent_id": 5})
+    assert cache.get_child_ids(1) == [2, 4]
+    assert [node["id"] for node in cache.get_children(5)] == [3]
+    assert cache.get_child_ids(3) == [6]
+
+    cache.delete_item(TREE_TABLE, 2)
+    cache.delete_item(TREE_TABLE, 4)
+    assert cache.get_child_ids(1) == []
+    assert 1 not in cache.tree_children
+
+    # 全量加载后重建的索引与增量维护的一致
+    incremental = {parent: list(children) for parent, children in cache.tree_children.items()}
+    with cache.lock:
+        cache._rebuild_tree_index()
+    assert cache.tree_children == incremental
+
+
+def test_building_large_tree_is_linear():
+    from routers import tree
+
+    def build(size):
+        cache = EnhancedLocalCache()
+        cache.add_item(TREE_TABLE, 1, make_node(1, None))
+        for node_id in range(2, size + 1):
+            cache.add_item(TREE_TABLE, node_id, make_node(node_id, node_id // 2))
+        tree.enhanced_local_cache = cache
+        start = time.perf_counter()
+        result = tree.get_story_tree(1)
+        return result, time.perf_counter() - start
+
+    original = tree.enhanced_local_cache
+    try:
+        small_tree, small = build(1000)
+        large_tree, large = build(10000)
+    finally:
+        tree.enhanced_local_cache = original
+
+    # 平方复杂度时10倍节点需要约100倍时间
+    assert large < small * 40
+    children = large_tree[1]["children"]
+    assert [child["id"] for child in children] == [2, 3]
+    assert [child["id"] for child in children[0]["children"]] == [4, 5]
+
+
+def test_materialized_paths_follow_create_reparent_and_load():
+    cache = EnhancedLocalCache()
+    for node_id, parent_id in [(1, None), (2, 1), (3, 2), (4, 3), (5, None)]:
+        cache.add_item(TREE_TABLE, node_id, make_node(node_id, parent_id))
+    assert cache.get_item(TREE_TABLE, 4)["path"] == "1/2/3/4"
+    assert [node["id"] for node in cache.get_path_nodes(cache.get_item(TREE_TABLE, 4))] == [1, 2, 3, 4]
+
+    # 移动子树时所有子孙的路径一起更新
+    cache.update_item(TREE_TABLE, 3, {"parent_id": 5})
+    assert cache.get_item(TREE_TABLE, 3)["path"] == "5/3"
+    assert cache.get_item(TREE_TABLE, 4)["path"] == "5/3/4"
+
+    # 旧数据没有路径列，全量加载后补齐并标记为待同步
+    for node in cache.data[TREE_TABLE].values():
+        node.pop("path")
+    cache.modified[TREE_TABLE].clear()
+    with cache.lock:
+        cache._rebuild_tree_index()
+    assert cache.get_item(TREE_TABLE, 4)["path"] == "5/3/4"
+    assert cache.modified[TREE_TABLE] == {1, 2, 3, 4, 5}
+
+
+def test_delete_subtree_is_iterative_and_records_tombstones():
+    cache = EnhancedLocalCache()
+    deleted = []
+    cache.add_listener(lambda data_type, action, item: action == "delete" and deleted.append(item["id"]))
+    cache.add_item(TREE_TABLE, 1, make_node(1, None))
+    cache.add_item(TREE_TABLE, 2, make_node(2, 1))
+    # 远超递归深度限制的单链
+    depth = 5000
+    for node_id in range(3, depth + 3):
+        cache.add_item(TREE_TABLE, node_id, make_node(node_id, node_id - 1))
+
+    start = time.perf_counter()
+    removed = cache.delete_subtree(3)
+    assert time.perf_counter() - start < 1.0
+
+    assert len(removed) == depth
+    assert set(cache.data[TREE_TABLE]) == {1, 2}
+    assert cache.deleted[TREE_TABLE] == set(range(3, depth + 3))
+    assert cache.modified[TREE_TABLE] == {1, 2}
+    assert cache.tree_children == {None: [1], 1: [2]}
+    assert sorted(deleted) == list(range(3, depth + 3))
+    assert cache.delete_subtree(3) == []
@@ -0,0 +1,63 @@
+"""
+测试故事树布局：同层节点不重叠、父节点位于子节点中间、深链不受递归限制，布局按树的版本缓存
+"""
+
+import random
+from enhanced_local_cache import enhanced_local_cache, TREE_TABLE
+from tree_layout import LEVEL_SPACING, SIBLING_SPACING, TreeLayoutCache, compute_layout
+from test_tree_index import make_node
+
+# 使用不会与其他数据冲突的节点ID
+BASE = 930000
+
+
+def assert_tidy(children, positions):
+    levels = {}
+    for x, y in positions.values():
+        levels.setdefault(x, []).append(y)
+    for ys in levels.values():
+        ys.sort()
+        assert all(lower - upper >= SIBLING_SPACING for upper, lower in zip(ys, ys[1:]))
+    for parent_id, child_ids in children.items():
+        if child_ids:
+            ys = [positions[child_id][1] for child_id in child_ids]
+            assert ys == sorted(ys)
+            assert abs(positions[parent_id][1] - (ys[0] + ys[-1]) / 2) <= 1
+            assert all(positions[child_id][0] == positions[parent_id][0] + LEVEL_SPACING for child_id in child_ids)
+
+
+def test_layout_is_tidy_for_random_trees_and_deep_chains():
+    for seed in range(50):
+        rng = random.Random(seed)
+        children = {1: []}
+        for node_id in range(2, rng.randint(2, 300)):
+            parent_id = rng.randint(max(1, node_id - rng.choice([2, 10, node_id])), node_id - 1)
+            children[parent_id].append(node_id)
+            children[node_id] = []
+        positions = compute_layout(1, children)
+        assert set(positions) == set(children)
+        assert_tidy(children, positions)
+
+    chain = {node_id: [node_id + 1] for node_id in range(1, 5000)}
+    positions = compute_layout(1, chain)
+    assert positions[5000] == (4999 * LEVEL_SPACING, 0)
+
+
+def test_layout_is_cached_per_tree_version():
+    shape = [(1, None), (2, 1), (3, 1)]
+    for node_id, parent_id in shape:
+        enhanced_local_cache.add_item(TREE_TABLE, BASE + node_id, make_node(BASE + node_id, parent_id and BASE + parent_id))
+    try:
+        layouts = TreeLayoutCache()
+        layout = layouts.get(BASE + 1)
+        assert layouts.get(BASE + 1) is layout
+        assert layout.position(BASE + 1) == (0, SIBLING_SPACING // 2)
+
+        enhanced_local_cache.add_item(TREE_TABLE, BASE + 4, make_node(BASE + 4, BASE + 1))
+        updated = layouts.get(BASE + 1)
+        assert updated is not layout
+        assert updated.position(BASE + 1) == (0, SIBLING_SPACING)
+        assert layouts.stats()["hits"] == 1
+        assert layouts.get(BASE + 99) is None
+    finally:
+        enhanced_local_cache.delete_subtree(BASE + 1)
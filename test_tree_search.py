@@ -0,0 +1,122 @@
+"""
+测试故事树搜索索引：子串和前缀匹配、限定子树（包括移动后）、随写入和批量导入增量维护，大树上每次查询遍历的候选数
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from enhanced_local_cache import EnhancedLocalCache, TREE_TABLE
+from routers import tree as tree_router
+from test_tree_index import make_node
+from transfer_tree import generate_lines
+import tree_search
+import tree_transfer
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = EnhancedLocalCache()
+    index = tree_search.TreeSearchIndex()
+    monkeypatch.setattr(tree_search, "enhanced_local_cache", cache)
+    monkeypatch.setattr(tree_search, "tree_search", index)
+    monkeypatch.setattr(tree_transfer, "enhanced_local_cache", cache)
+    cache.add_listener(tree_search._on_enhanced_cache_change)
+    cache.data["users"][1] = {"id": 1, "username": "admin", "role": "admin"}
+    return cache
+
+
+def titled(node_id, parent_id, title, option_title="选项"):
+    return dict(make_node(node_id, parent_id), title=title, option_title=option_title)
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def test_substring_prefix_and_subtree_scope(cache):
+    for node_id, parent_id, title in [(1, None, "森林入口"), (2, 1, "进入森林深处"), (3, 1, "返回村庄"),
+                                      (4, 2, "森林之王"), (5, None, "Dark Forest"), (6, 5, "另一片森林")]:
+        cache.add_item(TREE_TABLE, node_id, titled(node_id, parent_id, title))
+    index = tree_search.tree_search
+
+    assert ids(index.search("森林")) == [1, 2, 4, 6]
+    assert ids(index.search("森林", prefix=True)) == [1, 4]
+    assert ids(index.search("forest")) == [5]
+    assert ids(index.search("林")) == [1, 2, 4, 6]
+    # 二元组都命中但不连续出现的不算匹配
+    assert index.search("森林村庄") == []
+    assert ids(index.search("森林", root_id=2)) == [2, 4]
+    assert ids(index.search("森林", root_id=5)) == [6]
+    assert ids(index.search("森林", limit=2)) == [1, 2]
+    assert ids(index.search("选项", root_id=1)) == [1, 2, 3, 4]
+
+    # 移动子树后按新位置限定
+    cache.update_item(TREE_TABLE, 2, {"parent_id": 5})
+    assert ids(index.search("森林", root_id=1)) == [1]
+    assert ids(index.search("森林", root_id=5)) == [2, 4, 6]
+
+
+def test_index_follows_update_delete_and_batch_import(cache):
+    cache.add_item(TREE_TABLE, 1, titled(1, None, "起点"))
+    cache.add_item(TREE_TABLE, 2, titled(2, 1, "山洞"))
+    index = tree_search.tree_search
+
+    cache.update_item(TREE_TABLE, 2, {"title": "瀑布后的山洞", "option_title": "钻进瀑布"})
+    assert ids(index.search("瀑布")) == [2]
+    assert ids(index.search("选项")) == [1]
+
+    cache.delete_item(TREE_TABLE, 2)
+    assert index.search("瀑布") == []
+    assert index.stats()["documents"] == 1
+
+    # 批量导入只通知批内子树的根，整棵子树都要进入索引
+    result = tree_transfer.import_lines(generate_lines(100, 3), parent_id=1, batch_size=30)
+    assert len(index.search("节点", root_id=result["root_ids"][0], limit=100)) == tree_search.SEARCH_MAX_RESULTS
+    assert index.stats()["documents"] == 101
+
+    cache.delete_subtree(result["root_ids"][0])
+    assert index.search("节点") == []
+
+    # 全量加载后重建
+    cache.data[TREE_TABLE][3] = titled(3, 1, "重新加载的节点")
+    with cache.lock:
+        cache._rebuild_tree_index()
+    tree_search._on_enhanced_cache_change(TREE_TABLE, "reload", None)
+    assert ids(index.search("重新加载")) == [3]
+
+
+def test_search_endpoint(cache):
+    cache.add_item(TREE_TABLE, 1, titled(1, None, "森林入口"))
+    cache.add_item(TREE_TABLE, 2, titled(2, 1, "森林深处"))
+    app = FastAPI()
+    app.include_router(tree_router.router)
+    client = TestClient(app)
+    original = tree_router.enhanced_local_cache, tree_router.tree_search
+    tree_router.enhanced_local_cache, tree_router.tree_search = cache, tree_search.tree_search
+    try:
+        assert ids(client.get("/api/tree/search", params={"q": "深处"}).json()["results"]) == [2]
+        assert ids(client.get("/api/tree/search", params={"q": "森林", "root_id": 2}).json()["results"]) == [2]
+        assert client.get("/api/tree/search", params={"q": "森林", "root_id": 404}).status_code == 404
+    finally:
+        tree_router.enhanced_local_cache, tree_router.tree_search = original
+
+
+def test_queries_on_large_tree_examine_few_candidates(cache):
+    # 延迟与机器有关，见 benchmark_tree_search.py；这里检查每次查询遍历的候选数与树的大小无关
+    tree_transfer.import_lines(generate_lines(30000, 3), batch_size=5000)
+    index = tree_search.tree_search
+    snapshot = cache.get_tree_snapshot()
+    root_id = next(iter(snapshot.roots))
+    middle = snapshot.child_ids(snapshot.child_ids(root_id)[1])[0]
+    queries = [("节点4242", None, False), ("选项", None, False), ("节点9", None, True),
+               ("节点", middle, False), ("99", middle, False), ("不存在", None, False)]
+
+    for query, scope, prefix in queries:
+        examined = index.examined
+        index.search(query, scope, prefix)
+        assert index.examined - examined <= 200, query
+    assert len(index.postings["节点"]) == 30000
+
+    assert len(index.search("选项", middle)) == tree_search.SEARCH_MAX_RESULTS
+    assert all(result["path"].startswith(snapshot.item(middle)["path"] + "/") or result["id"] == middle
+               for result in index.search("节点", middle))
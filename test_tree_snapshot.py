@@ -0,0 +1,133 @@
+"""
+测试故事树快照：旧快照在写入后保持不变，新快照只复制变化的路径，并发写入时读取方构建的树始终一致
+"""
+
+import random
+import threading
+from enhanced_local_cache import EnhancedLocalCache, TREE_TABLE
+from markdown_renderer import render_content_html
+from tree_cache import TreeCache
+from tree_snapshot import PersistentMap
+from test_tree_index import make_node
+
+
+def test_persistent_map_versions_are_independent():
+    rng = random.Random(7)
+    expected = {}
+    current = PersistentMap()
+    versions = []
+    # 包含哈希值相同的不同键（-1和-2）和高位才不同的键
+    keys = list(range(200)) + [-1, -2, 2 ** 64 + 3, 3, None, "根"]
+    for step in range(5000):
+        key = rng.choice(keys)
+        if rng.random() < 0.6:
+            expected[key] = step
+            current = current.set(key, step)
+        else:
+            expected.pop(key, None)
+            current = current.remove(key)
+        assert len(current) == len(expected)
+        if step % 500 == 0:
+            versions.append((dict(expected), current))
+
+    for snapshot, version in versions:
+        assert dict(version.items()) == snapshot
+        assert all(version.get(key) == value for key, value in snapshot.items())
+    assert PersistentMap.from_items(expected.items()).get(3) == expected.get(3)
+
+
+def test_snapshot_is_unchanged_by_later_writes_and_shares_untouched_nodes():
+    cache = EnhancedLocalCache()
+    for node_id, parent_id in [(1, None), (2, 1), (3, 1), (4, None), (5, 4)]:
+        cache.add_item(TREE_TABLE, node_id, make_node(node_id, parent_id))
+    before = cache.get_tree_snapshot()
+
+    cache.add_item(TREE_TABLE, 6, make_node(6, 2))
+    cache.update_item(TREE_TABLE, 3, {"title": "新标题"})
+    after = cache.get_tree_snapshot()
+
+    assert before.children(2) == [] and before.get(6) is None
+    assert before.item(3)["title"] == "节点3"
+    assert before.get(1).stats["descendant_count"] == 2
+    assert [record.item["id"] for record in after.children(2)] == [6]
+    assert after.item(3)["title"] == "新标题"
+    assert after.get(1).stats["descendant_count"] == 3
+    # 另一棵树没有变化，记录直接与旧快照共享
+    assert after.get(4) is before.get(4)
+    assert after.get(5) is before.get(5)
+    assert after.roots == (1, 4)
+
+    cache.delete_subtree(2)
+    assert cache.get_tree_snapshot().get(6) is None
+    assert after.get(6) is not None
+
+
+def test_deferred_publication_matches_rebuild():
+    cache = EnhancedLocalCache()
+    cache.add_item(TREE_TABLE, 1, make_node(1, None))
+    # 深链上每次写入都会改变所有祖先的统计，超过立即发布的上限后合并到下次读取
+    for node_id in range(2, 2002):
+        cache.add_item(TREE_TABLE, node_id, make_node(node_id, node_id - 1))
+    cache.update_item(TREE_TABLE, 1000, {"parent_id": 1})
+    snapshot = cache.get_tree_snapshot()
+    assert not cache.tree_dirty
+
+    with cache.lock:
+        cache.tree_snapshot_stale = True
+    rebuilt = cache.get_tree_snapshot()
+    for node_id in range(1, 2002):
+        assert snapshot.get(node_id).children == rebuilt.get(node_id).children
+        assert dict(snapshot.get(node_id).stats) == dict(rebuilt.get(node_id).stats)
+        assert snapshot.item(node_id)["path"] == rebuilt.item(node_id)["path"]
+
+
+def test_readers_see_consistent_trees_during_concurrent_writes():
+    from routers import tree
+
+    cache = EnhancedLocalCache()
+    cache.add_item(TREE_TABLE, 1, render_content_html(make_node(1, None)))
+    errors = []
+    done = threading.Event()
+
+    def write():
+        rng = random.Random(3)
+        try:
+            for node_id in range(2, 1500):
+                cache.add_item(TREE_TABLE, node_id, render_content_html(make_node(node_id, rng.randrange(1, node_id))))
+                if node_id % 50 == 0:
+                    cache.delete_subtree(rng.randrange(2, node_id))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def read():
+        try:
+            while not done.is_set():
+                built = tree.get_story_tree(1)
+                pending = [built[1]]
+                nodes = []
+                while pending:
+                    node = pending.pop()
+                    nodes.append(node)
+                    pending.extend(node["children"])
+                # 撕裂的读取会让统计和实际构建出的子树对不上
+                assert built[1]["stats"]["descendant_count"] == len(nodes) - 1
+                assert all(node["child_count"] == len(node["children"]) for node in nodes)
+        except Exception as e:
+            errors.append(e)
+
+    original_cache, original_tree_cache = tree.enhanced_local_cache, tree.tree_cache
+    tree.enhanced_local_cache = cache
+    # 不缓存构建结果，每次读取都重新遍历快照
+    tree.tree_cache = TreeCache(max_nodes=0)
+    try:
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        tree.enhanced_local_cache, tree.tree_cache = original_cache, original_tree_cache
+
+    assert errors == []
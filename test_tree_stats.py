@@ -0,0 +1,87 @@
+"""
+测试故事树子树统计：创建、移动和删除时沿祖先路径增量维护，与全量重算一致，起始节点列表按统计排序和筛选
+"""
+
+import copy
+from enhanced_local_cache import EnhancedLocalCache, TREE_TABLE
+from test_tree_index import make_node
+
+
+def add(cache, node_id, parent_id, created_at="2026-01-01T00:00:00"):
+    node = make_node(node_id, parent_id)
+    node["created_at"] = created_at
+    cache.add_item(TREE_TABLE, node_id, node)
+
+
+def assert_matches_rebuild(cache):
+    incremental = copy.deepcopy(cache.tree_stats)
+    with cache.lock:
+        cache._rebuild_tree_stats()
+    assert cache.tree_stats == incremental
+
+
+def test_stats_follow_create_reparent_and_delete():
+    cache = EnhancedLocalCache()
+    add(cache, 1, None)
+    add(cache, 2, 1)
+    add(cache, 3, 1)
+    add(cache, 4, 2, "2026-03-01T00:00:00")
+    add(cache, 5, None)
+
+    assert cache.get_tree_stats(1) == {"descendant_count": 3, "max_depth": 2, "leaf_count": 2,
+                                       "latest_at": "2026-03-01T00:00:00", "min_id": 1, "max_id": 4}
+    assert cache.get_tree_stats(4)["leaf_count"] == 1
+    assert_matches_rebuild(cache)
+
+    # 移动子树：原祖先减去，新祖先加上，原父节点变回结局
+    cache.update_item(TREE_TABLE, 2, {"parent_id": 5})
+    assert cache.get_tree_stats(1) == {"descendant_count": 1, "max_depth": 1, "leaf_count": 1,
+                                       "latest_at": "2026-01-01T00:00:00", "min_id": 1, "max_id": 3}
+    assert cache.get_tree_stats(5)["descendant_count"] == 2
+    assert (cache.get_tree_stats(5)["min_id"], cache.get_tree_stats(5)["max_id"]) == (2, 5)
+    assert cache.get_tree_stats(5)["latest_at"] == "2026-03-01T00:00:00"
+    assert_matches_rebuild(cache)
+
+    cache.delete_item(TREE_TABLE, 3)
+    assert cache.get_tree_stats(1)["leaf_count"] == 1
+    assert cache.get_tree_stats(1)["descendant_count"] == 0
+
+    cache.delete_subtree(2)
+    assert cache.get_tree_stats(5) == {"descendant_count": 0, "max_depth": 0, "leaf_count": 1,
+                                       "latest_at": "2026-01-01T00:00:00", "min_id": 5, "max_id": 5}
+    assert cache.get_tree_stats(4) is None
+    assert_matches_rebuild(cache)
+
+
+def test_stats_on_deep_chain():
+    cache = EnhancedLocalCache()
+    add(cache, 1, None)
+    for node_id in range(2, 3002):
+        add(cache, node_id, node_id - 1)
+    assert cache.get_tree_stats(1)["max_depth"] == 3000
+    assert cache.get_tree_stats(1)["leaf_count"] == 1
+    cache.delete_subtree(1500)
+    assert cache.get_tree_stats(1)["max_depth"] == 1498
+    assert_matches_rebuild(cache)
+
+
+def test_root_listing_sorts_and_filters_by_stats():
+    from routers import tree
+
+    cache = EnhancedLocalCache()
+    add(cache, 1, None)
+    add(cache, 2, None)
+    add(cache, 3, 2)
+    add(cache, 4, 2, "2026-02-01T00:00:00")
+    add(cache, 5, None)
+    add(cache, 6, 5, "2026-05-01T00:00:00")
+
+    original = tree.enhanced_local_cache
+    tree.enhanced_local_cache = cache
+    try:
+        assert [node["id"] for node in tree.get_root_listing()] == [1, 2, 5]
+        assert [node["id"] for node in tree.get_root_listing("size")] == [2, 5, 1]
+        assert [node["id"] for node in tree.get_root_listing("active")] == [5, 2, 1]
+        assert [node["id"] for node in tree.get_root_listing("size", min_size=1)] == [2, 5]
+    finally:
+        tree.enhanced_local_cache = original
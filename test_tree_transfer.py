@@ -0,0 +1,134 @@
+"""
+测试故事树NDJSON导入导出：先序流式导出，导入时重新分配ID并保持结构，批量写入的统计与全量重算一致
+"""
+
+import copy
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from enhanced_local_cache import EnhancedLocalCache, TREE_TABLE
+from routers import admin
+from test_tree_index import make_node
+from transfer_tree import generate_lines
+import tree_transfer
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = EnhancedLocalCache()
+    monkeypatch.setattr(tree_transfer, "enhanced_local_cache", cache)
+    monkeypatch.setattr(admin, "enhanced_local_cache", cache)
+    cache.data["users"][1] = {"id": 1, "username": "admin", "role": "admin"}
+    return cache
+
+
+def shape(snapshot, root_id):
+    """以标题表示的树结构，与节点ID无关"""
+    record = snapshot.get(root_id)
+    return (record.item["title"], [shape(snapshot, child_id) for child_id in record.children])
+
+
+def test_export_then_import_keeps_structure_with_new_ids(cache):
+    for node_id, parent_id in [(1, None), (2, 1), (3, 2), (4, 2), (5, 1), (6, 5), (7, None)]:
+        cache.add_item(TREE_TABLE, node_id, make_node(node_id, parent_id))
+
+    lines = list(tree_transfer.export_lines(1))
+    rows = [json.loads(line) for line in lines]
+    assert rows[0]["format"] == tree_transfer.EXPORT_FORMAT
+    assert [row["id"] for row in rows[1:]] == [1, 2, 3, 4, 5, 6]
+    assert rows[1]["parent_id"] is None
+
+    result = tree_transfer.import_lines(lines, parent_id=7, batch_size=2)
+    assert result["rows"] == 6
+    new_root = result["root_ids"][0]
+    assert new_root > 7
+
+    snapshot = cache.get_tree_snapshot()
+    assert snapshot.child_ids(7) == (new_root,)
+    assert shape(snapshot, new_root) == shape(snapshot, 1)
+    assert snapshot.get(7).stats["descendant_count"] == 6
+    assert snapshot.get(7).stats["leaf_count"] == 3
+    leaf = snapshot.get(snapshot.get(new_root).children[0]).children[0]
+    assert snapshot.item(leaf)["path"] == f"7/{new_root}/{snapshot.item(leaf)['parent_id']}/{leaf}"
+    assert cache.modified[TREE_TABLE] >= {new_root, leaf}
+
+    stats = copy.deepcopy(cache.tree_stats)
+    with cache.lock:
+        cache._rebuild_tree_stats()
+    assert cache.tree_stats == stats
+
+
+def test_import_rejects_out_of_order_and_foreign_files(cache):
+    cache.add_item(TREE_TABLE, 1, make_node(1, None))
+    out_of_order = [json.dumps(make_node(10, None)), json.dumps(make_node(11, 10)),
+                    json.dumps(make_node(12, 99))]
+    with pytest.raises(ValueError, match="第 3 行"):
+        tree_transfer.import_lines(out_of_order)
+    with pytest.raises(ValueError, match="格式"):
+        tree_transfer.import_lines([json.dumps({"format": "other", "version": 1})])
+    with pytest.raises(ValueError, match="父节点"):
+        tree_transfer.import_lines([], parent_id=404)
+
+
+def test_import_replaces_unknown_authors_and_rerenders_html(cache):
+    cache.data["users"][2] = {"id": 2, "username": "importer", "role": "admin"}
+    header = json.dumps({"format": tree_transfer.EXPORT_FORMAT, "version": tree_transfer.EXPORT_VERSION})
+    root = dict(make_node(10, None), content="**加粗**", content_html="<script>alert(1)</script>",
+                content_html_version=tree_transfer.render_content_html({"content": ""})["content_html_version"])
+    child = dict(make_node(11, 10), author_id=404)
+    lines = [header, json.dumps(root), json.dumps(child)]
+
+    result = tree_transfer.import_lines(lines, fallback_author_id=2)
+    snapshot = cache.get_tree_snapshot()
+    new_root = snapshot.item(result["root_ids"][0])
+    assert new_root["author_id"] == 1
+    assert new_root["content_html"] == "<p><strong>加粗</strong></p>"
+    assert snapshot.item(snapshot.child_ids(new_root["id"])[0])["author_id"] == 2
+
+    # 没有回退作者时拒绝导入不存在的作者
+    with pytest.raises(ValueError, match="作者 404"):
+        tree_transfer.import_lines(lines)
+
+
+def test_batched_import_notifies_only_batch_roots_and_keeps_memory_bounded(cache):
+    notified = []
+    cache.add_listener(lambda data_type, action, item: notified.append(item["id"]))
+    importer = tree_transfer.TreeImporter(batch_size=500)
+    longest_path = 0
+    for line in generate_lines(20000, 3):
+        importer.feed(line)
+        longest_path = max(longest_path, len(importer.path))
+    result = importer.finish()
+
+    assert result["rows"] == 20000
+    assert result["rows_per_second"] > 0
+    # 只记住当前路径上的ID映射：三叉树2万个节点只有10层
+    assert longest_path <= 10
+    # 每批只通知批内子树的根，数量与路径深度有关
+    assert len(notified) < 20000 // 20
+    root = cache.get_tree_snapshot().get(result["root_ids"][0])
+    assert root.stats["descendant_count"] == 19999
+    assert root.stats["max_depth"] == 9
+
+
+def test_admin_endpoints_stream_export_and_import(cache):
+    for node_id, parent_id in [(1, None), (2, 1), (3, 1)]:
+        cache.add_item(TREE_TABLE, node_id, make_node(node_id, parent_id))
+    app = FastAPI()
+    app.include_router(admin.router)
+    app.dependency_overrides[admin.require_admin] = lambda: {"id": 1, "role": "admin"}
+    client = TestClient(app)
+
+    response = client.get("/admin/tree/export", params={"root_id": 1})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(response.text.splitlines()) == 4
+    assert client.get("/admin/tree/export", params={"root_id": 404}).status_code == 404
+
+    imported = client.post("/admin/tree/import", params={"parent_id": 3}, content=response.content).json()
+    assert imported["rows"] == 3
+    assert cache.get_tree_snapshot().get(1).stats["descendant_count"] == 5
+    assert client.post("/admin/tree/import", content=b"{broken").status_code == 400
+
+    app.dependency_overrides[admin.require_admin] = lambda: None
+    assert client.get("/admin/tree/export", params={"root_id": 1}).status_code == 403
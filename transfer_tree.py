@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+故事树NDJSON导入导出：导出子树、导入到指定父节点下，或生成用于基准测试的大树
+"""
+
+import sys
+import json
+import logging
+import argparse
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def generate_lines(nodes: int, branching: int):
+    """按先序生成一棵完全branching叉树，节点i的子节点为branching*(i-1)+2起的连续ID"""
+    from tree_transfer import EXPORT_FORMAT, EXPORT_VERSION
+
+    yield json.dumps({"format": EXPORT_FORMAT, "version": EXPORT_VERSION, "root_id": 1}) + "\n"
+    pending = [1]
+    while pending:
+        node_id = pending.pop()
+        parent_id = None if node_id == 1 else (node_id - 2) // branching + 1
+        yield json.dumps({
+            "id": node_id, "parent_id": parent_id, "title": f"节点{node_id}", "option_title": f"选项{node_id}",
+            "content": f"第{node_id}段内容", "author_id": 1, "created_at": "2026-01-01T00:00:00"
+        }, ensure_ascii=False) + "\n"
+        first = branching * (node_id - 1) + 2
+        pending.extend(reversed(range(first, min(first + branching, nodes + 1))))
+
+
+def open_output(path: str):
+    return sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="故事树NDJSON导入导出")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="导出以指定节点为根的子树")
+    export_parser.add_argument("root_id", type=int, help="子树根节点ID")
+    export_parser.add_argument("-o", "--output", default="-", help="输出文件，默认标准输出")
+
+    import_parser = commands.add_parser("import", help="导入NDJSON文件并同步到数据库")
+    import_parser.add_argument("path", help="NDJSON文件，-表示标准输入")
+    import_parser.add_argument("--parent-id", type=int, default=None, help="挂到该节点下，默认作为新的起始节点")
+    import_parser.add_argument("--author-id", type=int, default=None, help="覆盖所有节点的作者ID")
+    import_parser.add_argument("--fallback-author-id", type=int, default=None, help="作者在本环境不存在时改用的作者ID")
+    import_parser.add_argument("--batch-size", type=int, default=None, help="每批写入缓存的节点数")
+
+    generate_parser = commands.add_parser("generate", help="生成用于基准测试的NDJSON故事树")
+    generate_parser.add_argument("nodes", type=int, help="节点数")
+    generate_parser.add_argument("--branching", type=int, default=3, help="每个节点的子节点数")
+    generate_parser.add_argument("-o", "--output", default="-", help="输出文件，默认标准输出")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        output = open_output(args.output)
+        try:
+            output.writelines(generate_lines(args.nodes, args.branching))
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        return
+
+    from enhanced_local_cache import enhanced_local_cache
+    from tree_transfer import TREE_IMPORT_BATCH_SIZE, export_lines, import_lines
+
+    if not enhanced_local_cache.load_from_db_with_fallback():
+        logger.error("无法加载数据")
+        sys.exit(1)
+
+    if args.command == "export":
+        if enhanced_local_cache.get_tree_snapshot().get(args.root_id) is None:
+            logger.error(f"节点 {args.root_id} 不存在")
+            sys.exit(1)
+        output = open_output(args.output)
+        try:
+            output.writelines(export_lines(args.root_id))
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        return
+
+    source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+    try:
+        result = import_lines(source, args.parent_id, args.author_id, args.batch_size or TREE_IMPORT_BATCH_SIZE,
+                              args.fallback_author_id)
+    except ValueError as e:
+        logger.error(f"导入失败: {e}")
+        sys.exit(1)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    logger.info(f"已导入 {result['rows']} 个节点，用时 {result['seconds']} 秒，{result['rows_per_second']} 行/秒，"
+                f"新起始节点: {result['root_ids']}")
+    if not enhanced_local_cache.sync_to_db_with_fallback():
+        logger.error("同步到数据库失败，数据已保存到临时存储")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Optional
+from enhanced_local_cache import enhanced_local_cache, TREE_TABLE
+
+logger = logging.getLogger(__name__)
+
+# 故事树缓存的容量上限（节点数），按缓存中所有树的节点总数计算
+TREE_CACHE_MAX_NODES = int(os.getenv("TREE_CACHE_MAX_NODES", "50000"))
+
+
+class TreeCache:
+    """以根节点ID和展开层数为键的故事树LRU缓存，节点修改时只移除包含该节点的树"""
+
+    def __init__(self, max_nodes: int = TREE_CACHE_MAX_NODES):
+        self.max_nodes = max_nodes
+        # (根节点ID, 展开层数) -> (树, 节点数)
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # 根节点ID -> 该根节点下缓存的所有键
+        self.keys_by_root: Dict[Any, set] = {}
+        self.current_nodes = 0
+        # 每次失效时递增，构建期间发生写入的树不再存入
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, root_id, depth: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """命中时返回缓存的树，depth为None表示完整的树"""
+        key = (root_id, depth)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def token(self) -> int:
+        """构建树之前取得，存入时用于判断构建期间是否有写入"""
+        with self.lock:
+            return self.generation
+
+    def store(self, root_id, tree: Dict[str, Any], size: int, token: int, depth: Optional[int] = None) -> bool:
+        """存入构建好的树，构建期间有失效或超过容量时不存入"""
+        if size > self.max_nodes:
+            return False
+        key = (root_id, depth)
+        with self.lock:
+            if token != self.generation:
+                return False
+            self._remove_locked(key)
+            self.entries[key] = (tree, size)
+            self.keys_by_root.setdefault(root_id, set()).add(key)
+            self.current_nodes += size
+            while self.current_nodes > self.max_nodes:
+                evicted_key, _ = next(iter(self.entries.items()))
+                self._remove_locked(evicted_key)
+                self.evictions += 1
+            return True
+
+    def _remove_locked(self, key: tuple) -> bool:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        self.current_nodes -= entry[1]
+        keys = self.keys_by_root.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_root[key[0]]
+        return True
+
+    def invalidate(self, node_ids: Iterable):
+        """移除以这些节点为根的树，传入变更节点及其所有祖先"""
+        with self.lock:
+            self.generation += 1
+            for node_id in node_ids:
+                for key in list(self.keys_by_root.get(node_id, ())):
+                    if self._remove_locked(key):
+                        self.invalidations += 1
+
+    def clear(self):
+        """清空故事树缓存"""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.keys_by_root.clear()
+            self.current_nodes = 0
+        logger.info("故事树缓存已清空")
+
+    def stats(self) -> Dict[str, Any]:
+        """导出命中率和容量统计"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "nodes": self.current_nodes,
+                "max_nodes": self.max_nodes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def _on_enhanced_cache_change(data_type, action, item):
+    if action == "reload":
+        tree_cache.clear()
+    elif data_type == TREE_TABLE:
+        # 包含该节点的树就是以它自身或任一祖先为根的树
+        tree_cache.invalidate(enhanced_local_cache.get_ancestor_ids(item))
+
+
+# 创建全局故事树缓存实例，并监听故事树节点的写入
+tree_cache = TreeCache()
+enhanced_local_cache.add_listener(_on_enhanced_cache_change)
@@ -0,0 +1,227 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from enhanced_local_cache import enhanced_local_cache
+from cache_versions import entity_versions, tree_node_tag
+
+logger = logging.getLogger(__name__)
+
+# 相邻两层节点的水平间距和相邻节点的最小垂直间距（像素）
+LEVEL_SPACING = 400
+SIBLING_SPACING = 200
+# 节点卡片的宽度和估计高度，用于计算画布大小和连接线端点
+NODE_WIDTH = 300
+NODE_HEIGHT = 200
+# 连接线连到卡片顶部下方的位置
+CONNECTOR_OFFSET = 50
+
+# 布局缓存的容量上限（节点数），按缓存中所有布局的节点总数计算
+TREE_LAYOUT_CACHE_MAX_NODES = int(os.getenv("TREE_LAYOUT_CACHE_MAX_NODES", "200000"))
+
+
+class _LayoutNode:
+    """Walker算法的中间状态"""
+
+    __slots__ = ("id", "parent", "children", "number", "prelim", "mod", "shift", "change",
+                 "thread", "ancestor", "midpoint")
+
+    def __init__(self, node_id, parent: Optional["_LayoutNode"], number: int):
+        self.id = node_id
+        self.parent = parent
+        self.children: List["_LayoutNode"] = []
+        self.number = number
+        self.prelim = 0.0
+        self.mod = 0.0
+        self.shift = 0.0
+        self.change = 0.0
+        self.thread: Optional["_LayoutNode"] = None
+        self.ancestor = self
+        self.midpoint = 0.0
+
+    def next_left(self) -> Optional["_LayoutNode"]:
+        return self.children[0] if self.children else self.thread
+
+    def next_right(self) -> Optional["_LayoutNode"]:
+        return self.children[-1] if self.children else self.thread
+
+
+def _move_subtree(left: _LayoutNode, right: _LayoutNode, shift: float):
+    subtrees = right.number - left.number
+    right.change -= shift / subtrees
+    right.shift += shift
+    left.change += shift / subtrees
+    right.prelim += shift
+    right.mod += shift
+
+
+def _execute_shifts(node: _LayoutNode):
+    shift = change = 0.0
+    for child in reversed(node.children):
+        child.prelim += shift
+        child.mod += shift
+        change += child.change
+        shift += child.shift + change
+
+
+def _apportion(node: _LayoutNode, left_sibling: _LayoutNode, default_ancestor: _LayoutNode) -> _LayoutNode:
+    """把node的子树推离左侧兄弟子树，使两者的轮廓至少相距一个单位"""
+    inner_right = outer_right = node
+    inner_left = left_sibling
+    outer_left = node.parent.children[0]
+    sum_inner_right, sum_outer_right = inner_right.mod, outer_right.mod
+    sum_inner_left, sum_outer_left = inner_left.mod, outer_left.mod
+    while inner_left.next_right() and inner_right.next_left():
+        inner_left = inner_left.next_right()
+        inner_right = inner_right.next_left()
+        outer_left = outer_left.next_left()
+        outer_right = outer_right.next_right()
+        outer_right.ancestor = node
+        shift = (inner_left.prelim + sum_inner_left) - (inner_right.prelim + sum_inner_right) + 1
+        if shift > 0:
+            ancestor = inner_left.ancestor if inner_left.ancestor.parent is node.parent else default_ancestor
+            _move_subtree(ancestor, node, shift)
+            sum_inner_right += shift
+            sum_outer_right += shift
+        sum_inner_left += inner_left.mod
+        sum_inner_right += inner_right.mod
+        sum_outer_left += outer_left.mod
+        sum_outer_right += outer_right.mod
+    if inner_left.next_right() and not outer_right.next_right():
+        outer_right.thread = inner_left.next_right()
+        outer_right.mod += sum_inner_left - sum_outer_right
+    if inner_right.next_left() and not outer_left.next_left():
+        outer_left.thread = inner_right.next_left()
+        outer_left.mod += sum_inner_right - sum_outer_left
+        default_ancestor = node
+    return default_ancestor
+
+
+def compute_layout(root_id, children: Dict[Any, List[Any]]) -> Dict[Any, Tuple[int, int]]:
+    """Walker算法（Buchheim等人的线性时间版本）：树从左向右生长，返回每个节点卡片左上角的(x, y)
+
+    children为子树中每个节点按顺序排列的子节点ID，全部用显式栈遍历，深链不受递归深度限制。
+    """
+    root = _LayoutNode(root_id, None, 1)
+    breadth_first = [root]
+    for node in breadth_first:
+        for number, child_id in enumerate(children.get(node.id, ()), start=1):
+            child = _LayoutNode(child_id, node, number)
+            node.children.append(child)
+            breadth_first.append(child)
+
+    # 第一遍：子节点都放置好之后再放置父节点，按广度优先的逆序处理即可保证这一点
+    for node in reversed(breadth_first):
+        if not node.children:
+            continue
+        default_ancestor = node.children[0]
+        previous = None
+        for child in node.children:
+            if previous is None:
+                child.prelim = child.midpoint
+            else:
+                child.prelim = previous.prelim + 1
+                if child.children:
+                    child.mod = child.prelim - child.midpoint
+                default_ancestor = _apportion(child, previous, default_ancestor)
+            previous = child
+        _execute_shifts(node)
+        node.midpoint = (node.children[0].prelim + node.children[-1].prelim) / 2
+
+    # 第二遍：先序遍历，累加祖先的mod得到最终位置
+    root.prelim = root.midpoint
+    positions: Dict[Any, Tuple[int, int]] = {}
+    breadth = {}
+    stack = [(root, 0.0, 0)]
+    while stack:
+        node, modifier, depth = stack.pop()
+        breadth[node.id] = (node.prelim + modifier, depth)
+        for child in node.children:
+            stack.append((child, modifier + node.mod, depth + 1))
+
+    top = min(position for position, _ in breadth.values())
+    for node_id, (position, depth) in breadth.items():
+        positions[node_id] = (depth * LEVEL_SPACING, round((position - top) * SIBLING_SPACING))
+    return positions
+
+
+class TreeLayout:
+    """一棵树的布局结果"""
+
+    def __init__(self, positions: Dict[Any, Tuple[int, int]]):
+        self.positions = positions
+        self.width = max(x for x, _ in positions.values()) + NODE_WIDTH
+        self.height = max(y for _, y in positions.values()) + NODE_HEIGHT
+
+    def position(self, node_id) -> Optional[Tuple[int, int]]:
+        return self.positions.get(node_id)
+
+
+class TreeLayoutCache:
+    """按根节点缓存布局，根节点标签的版本变化（任一子孙增删改）后重新计算"""
+
+    def __init__(self, max_nodes: int = TREE_LAYOUT_CACHE_MAX_NODES):
+        self.max_nodes = max_nodes
+        # 根节点ID -> (版本快照, 布局)
+        self.entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.current_nodes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, root_id) -> Optional[TreeLayout]:
+        """返回根节点所在树的当前布局，节点不存在时返回None"""
+        version = entity_versions.version(tree_node_tag(root_id))
+        with self.lock:
+            entry = self.entries.get(root_id)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(root_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # 在锁外计算，计算期间有写入时版本已变化，下次读取会重新计算
+        children = enhanced_local_cache.get_tree_snapshot().subtree_children(root_id)
+        if not children:
+            return None
+        layout = TreeLayout(compute_layout(root_id, children))
+        self._store(root_id, version, layout)
+        return layout
+
+    def _store(self, root_id, version: tuple, layout: TreeLayout):
+        size = len(layout.positions)
+        if size > self.max_nodes:
+            return
+        with self.lock:
+            previous = self.entries.pop(root_id, None)
+            if previous is not None:
+                self.current_nodes -= len(previous[1].positions)
+            self.entries[root_id] = (version, layout)
+            self.current_nodes += size
+            while self.current_nodes > self.max_nodes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.current_nodes -= len(evicted.positions)
+
+    def clear(self):
+        """清空布局缓存"""
+        with self.lock:
+            self.entries.clear()
+            self.current_nodes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """导出命中率和容量统计"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "nodes": self.current_nodes,
+                "max_nodes": self.max_nodes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# 创建全局故事树布局缓存实例
+tree_layouts = TreeLayoutCache()
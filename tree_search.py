@@ -0,0 +1,238 @@
+import bisect
+import logging
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Set
+from enhanced_local_cache import enhanced_local_cache, TREE_TABLE
+
+logger = logging.getLogger(__name__)
+
+# 建立索引的节点字段
+SEARCH_FIELDS = ("title", "option_title")
+
+# 每次查询最多返回的结果数
+SEARCH_MAX_RESULTS = 50
+
+
+def normalize(text: Optional[str]) -> str:
+    """统一大小写并去掉首尾空白，中文不受影响"""
+    return (text or "").strip().casefold()
+
+
+def text_grams(text: str) -> Set[str]:
+    """单字和相邻两字：中文没有分词边界，二元组兼顾召回和候选集大小，单字用于一个字的查询"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def query_grams(query: str) -> Set[str]:
+    """查询词只需要二元组即可筛出候选，一个字的查询使用单字"""
+    if len(query) == 1:
+        return {query}
+    return {query[i:i + 2] for i in range(len(query) - 1)}
+
+
+class TreeSearchIndex:
+    """故事树节点标题和选项标题的字符二元组倒排索引，随节点创建、修改、移动和删除增量维护
+
+    每个单字或二元组同时保存按ID排序的列表和集合：多个二元组的交集由集合求出，
+    结果按ID顺序遍历并用原文校验，凑够结果数即停止，不需要排序全部候选。
+    限定子树时只遍历子树ID范围内的候选并按物化路径过滤，子树比候选少得多时改为遍历子树。
+    """
+
+    def __init__(self):
+        # 单字或二元组 -> 按ID排序的节点ID列表
+        self.postings: Dict[str, List[int]] = {}
+        # 单字或二元组 -> 节点ID集合，用于求交集
+        self.posting_sets: Dict[str, Set[int]] = {}
+        # 节点ID -> 各字段规范化后的文本
+        self.documents: Dict[int, tuple] = {}
+        # 节点ID -> 物化路径，用于限定子树
+        self.paths: Dict[int, str] = {}
+        # 查询次数和遍历过的候选总数，衡量查询开销而不依赖机器速度
+        self.queries = 0
+        self.examined = 0
+        self.lock = threading.Lock()
+
+    def _add_locked(self, item_id: int, texts: tuple):
+        self.documents[item_id] = texts
+        grams = set()
+        for text in texts:
+            grams |= text_grams(text)
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                self.postings[gram] = [item_id]
+                self.posting_sets[gram] = {item_id}
+                continue
+            # 新节点的ID通常最大，直接追加
+            if posting[-1] < item_id:
+                posting.append(item_id)
+            else:
+                bisect.insort(posting, item_id)
+            self.posting_sets[gram].add(item_id)
+
+    def _remove_locked(self, item_id: int) -> bool:
+        texts = self.documents.pop(item_id, None)
+        if texts is None:
+            return False
+        grams = set()
+        for text in texts:
+            grams |= text_grams(text)
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if not posting:
+                continue
+            position = bisect.bisect_left(posting, item_id)
+            if position < len(posting) and posting[position] == item_id:
+                del posting[position]
+            self.posting_sets[gram].discard(item_id)
+            if not posting:
+                del self.postings[gram]
+                del self.posting_sets[gram]
+        return True
+
+    def index(self, items: Iterable[Dict[str, Any]]):
+        """加入或更新节点，标题没有变化的节点只更新路径"""
+        with self.lock:
+            for item in items:
+                self.paths[item["id"]] = item.get("path") or str(item["id"])
+                texts = tuple(normalize(item.get(field)) for field in SEARCH_FIELDS)
+                if self.documents.get(item["id"]) == texts:
+                    continue
+                self._remove_locked(item["id"])
+                self._add_locked(item["id"], texts)
+
+    def remove(self, item_id: int):
+        with self.lock:
+            self._remove_locked(item_id)
+            self.paths.pop(item_id, None)
+
+    def moved(self, item: Dict[str, Any]) -> bool:
+        """节点的物化路径与索引中的不同，说明它连同子树被移动了"""
+        with self.lock:
+            return item["id"] in self.paths and self.paths[item["id"]] != (item.get("path") or str(item["id"]))
+
+    def rebuild(self, items: Iterable[Dict[str, Any]]):
+        """全量重建索引"""
+        with self.lock:
+            self.postings = {}
+            self.posting_sets = {}
+            self.documents = {}
+            self.paths = {}
+            for item in sorted(items, key=lambda item: item["id"]):
+                self.paths[item["id"]] = item.get("path") or str(item["id"])
+                self._add_locked(item["id"], tuple(normalize(item.get(field)) for field in SEARCH_FIELDS))
+        logger.info(f"故事树搜索索引已重建，共 {len(self.documents)} 个节点")
+
+    @staticmethod
+    def _matches(texts: tuple, query: str, prefix: bool) -> bool:
+        if prefix:
+            return any(text.startswith(query) for text in texts)
+        return any(query in text for text in texts)
+
+    def _candidates_locked(self, query: str):
+        """按ID排序的候选列表，以及需要额外满足的交集（只有一个二元组或交集不小时为None）"""
+        grams = sorted(query_grams(query), key=lambda gram: len(self.postings.get(gram, ())))
+        shortest = self.postings.get(grams[0])
+        if not shortest:
+            return [], None
+        if len(grams) == 1:
+            return shortest, None
+        common = self.posting_sets[grams[0]].intersection(*(self.posting_sets.get(gram, ()) for gram in grams[1:]))
+        # 交集明显更小时直接排序交集，否则按最短倒排表的顺序遍历并检查是否在交集中，避免排序大量ID
+        if len(common) * 8 < len(shortest):
+            return sorted(common), None
+        return shortest, common
+
+    def search(self, query: str, root_id: Optional[int] = None, prefix: bool = False,
+               limit: int = SEARCH_MAX_RESULTS) -> List[Dict[str, Any]]:
+        """按创建顺序返回标题或选项标题包含（prefix为True时以其开头）查询词的节点，root_id限定在该节点的子树中"""
+        query = normalize(query)
+        limit = max(0, min(limit, SEARCH_MAX_RESULTS))
+        if not query or not limit:
+            return []
+        snapshot = enhanced_local_cache.get_tree_snapshot()
+        root = None
+        if root_id is not None:
+            root = snapshot.get(root_id)
+            if root is None:
+                return []
+
+        matched = []
+        with self.lock:
+            candidates, common = self._candidates_locked(query)
+            start, stop = 0, len(candidates)
+            scope = None
+            if root is not None:
+                # 子孙的ID都在子树统计记录的范围内，只需遍历这一段候选
+                start = bisect.bisect_left(candidates, root.stats["min_id"])
+                stop = bisect.bisect_right(candidates, root.stats["max_id"])
+                scope = self.paths.get(root_id, str(root_id))
+                if (root.stats["descendant_count"] + 1) * 8 < stop - start:
+                    # 子树中的节点被移动过，ID范围远大于子树本身，改为遍历子树
+                    candidates, common = sorted(snapshot.subtree_children(root_id)), None
+                    start, stop, scope = 0, len(candidates), None
+
+            examined = 0
+            for position in range(start, stop):
+                examined += 1
+                item_id = candidates[position]
+                if common is not None and item_id not in common:
+                    continue
+                # 二元组都出现不代表查询词连续出现，用原文校验
+                texts = self.documents.get(item_id)
+                if texts is None or not self._matches(texts, query, prefix):
+                    continue
+                if scope is not None:
+                    path = self.paths.get(item_id)
+                    if path is None or not (path == scope or path.startswith(scope + "/")):
+                        continue
+                matched.append(item_id)
+                if len(matched) >= limit:
+                    break
+            self.queries += 1
+            self.examined += examined
+
+        results = []
+        for item_id in matched:
+            item = snapshot.item(item_id)
+            if item is not None:
+                results.append({
+                    "id": item_id,
+                    "title": item.get("title"),
+                    "option_title": item.get("option_title"),
+                    "parent_id": item.get("parent_id"),
+                    "path": item.get("path")
+                })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "documents": len(self.documents),
+                "grams": len(self.postings),
+                "postings": sum(len(posting) for posting in self.postings.values()),
+                "queries": self.queries,
+                "examined_per_query": round(self.examined / self.queries, 1) if self.queries else 0.0
+            }
+
+
+def _on_enhanced_cache_change(data_type, action, item):
+    if action == "reload":
+        if data_type == TREE_TABLE:
+            tree_search.rebuild(record.item for _, record in enhanced_local_cache.get_tree_snapshot().nodes.items())
+    elif data_type == TREE_TABLE:
+        if action == "delete":
+            tree_search.remove(item["id"])
+        elif action == "add" or tree_search.moved(item):
+            # 批量添加只通知批内子树的根，移动时子孙的路径也变了，整棵子树一并加入索引
+            tree_search.index(enhanced_local_cache.get_subtree_items(item["id"]))
+        else:
+            tree_search.index([item])
+
+
+# 创建全局故事树搜索索引，索引已在缓存中的节点，并监听故事树节点的写入
+tree_search = TreeSearchIndex()
+tree_search.rebuild(record.item for _, record in enhanced_local_cache.get_tree_snapshot().nodes.items())
+enhanced_local_cache.add_listener(_on_enhanced_cache_change)
@@ -0,0 +1,286 @@
+from types import MappingProxyType
+from typing import Dict, Any, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+# 哈希字典树每层使用的哈希位数，每个分支最多32个槽位
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+
+def _hash(key) -> int:
+    return hash(key) & _HASH_MASK
+
+
+def _slot_index(bitmap: int, bit: int) -> int:
+    """位图中bit之前已占用的槽位数，即该键在紧凑槽位元组中的下标"""
+    return bin(bitmap & (bit - 1)).count("1")
+
+
+class _Leaf:
+    __slots__ = ("key_hash", "key", "value")
+
+    def __init__(self, key_hash: int, key, value):
+        self.key_hash = key_hash
+        self.key = key
+        self.value = value
+
+
+class _Collision:
+    """哈希值完全相同的多个键"""
+
+    __slots__ = ("key_hash", "leaves")
+
+    def __init__(self, key_hash: int, leaves: Tuple[_Leaf, ...]):
+        self.key_hash = key_hash
+        self.leaves = leaves
+
+
+class _Branch:
+    __slots__ = ("bitmap", "slots")
+
+    def __init__(self, bitmap: int, slots: tuple):
+        self.bitmap = bitmap
+        self.slots = slots
+
+
+def _merge(first, second: _Leaf, shift: int):
+    """把哈希值不同的两个叶子（或冲突桶）放进新的分支，前缀相同时逐层下沉"""
+    if shift >= _HASH_BITS:
+        return _Collision(second.key_hash, (first, second))
+    first_bit = 1 << ((first.key_hash >> shift) & _MASK)
+    second_bit = 1 << ((second.key_hash >> shift) & _MASK)
+    if first_bit == second_bit:
+        return _Branch(first_bit, (_merge(first, second, shift + _BITS),))
+    slots = (first, second) if first_bit < second_bit else (second, first)
+    return _Branch(first_bit | second_bit, slots)
+
+
+def _assoc(node, shift: int, key_hash: int, key, value) -> Tuple[Any, bool]:
+    """返回写入后的新节点和是否新增了键，只复制从根到该键路径上的节点"""
+    if node is None:
+        return _Leaf(key_hash, key, value), True
+    if isinstance(node, _Branch):
+        bit = 1 << ((key_hash >> shift) & _MASK)
+        index = _slot_index(node.bitmap, bit)
+        if not node.bitmap & bit:
+            slots = node.slots[:index] + (_Leaf(key_hash, key, value),) + node.slots[index:]
+            return _Branch(node.bitmap | bit, slots), True
+        child, added = _assoc(node.slots[index], shift + _BITS, key_hash, key, value)
+        if child is node.slots[index]:
+            return node, False
+        return _Branch(node.bitmap, node.slots[:index] + (child,) + node.slots[index + 1:]), added
+    if isinstance(node, _Leaf):
+        if node.key_hash == key_hash and node.key == key:
+            if node.value is value:
+                return node, False
+            return _Leaf(key_hash, key, value), False
+        if node.key_hash == key_hash:
+            return _Collision(key_hash, (node, _Leaf(key_hash, key, value))), True
+        return _merge(node, _Leaf(key_hash, key, value), shift), True
+    # 冲突桶
+    if node.key_hash != key_hash:
+        return _merge(node, _Leaf(key_hash, key, value), shift), True
+    for index, leaf in enumerate(node.leaves):
+        if leaf.key == key:
+            if leaf.value is value:
+                return node, False
+            leaves = node.leaves[:index] + (_Leaf(key_hash, key, value),) + node.leaves[index + 1:]
+            return _Collision(key_hash, leaves), False
+    return _Collision(key_hash, node.leaves + (_Leaf(key_hash, key, value),)), True
+
+
+def _dissoc(node, shift: int, key_hash: int, key):
+    """返回删除后的新节点，键不存在时原样返回node，子树变空时返回None"""
+    if node is None:
+        return None
+    if isinstance(node, _Branch):
+        bit = 1 << ((key_hash >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return node
+        index = _slot_index(node.bitmap, bit)
+        child = _dissoc(node.slots[index], shift + _BITS, key_hash, key)
+        if child is node.slots[index]:
+            return node
+        if child is None:
+            slots = node.slots[:index] + node.slots[index + 1:]
+            if not slots:
+                return None
+            # 只剩一个叶子时上移一层，查找时叶子本身带有完整的键
+            if len(slots) == 1 and not isinstance(slots[0], _Branch):
+                return slots[0]
+            return _Branch(node.bitmap & ~bit, slots)
+        if len(node.slots) == 1 and not isinstance(child, _Branch):
+            return child
+        return _Branch(node.bitmap, node.slots[:index] + (child,) + node.slots[index + 1:])
+    if isinstance(node, _Leaf):
+        if node.key_hash == key_hash and node.key == key:
+            return None
+        return node
+    if node.key_hash != key_hash:
+        return node
+    leaves = tuple(leaf for leaf in node.leaves if leaf.key != key)
+    if len(leaves) == len(node.leaves):
+        return node
+    return leaves[0] if len(leaves) == 1 else _Collision(key_hash, leaves)
+
+
+def _build(leaves: List[_Leaf], shift: int):
+    """由一组叶子一次性构建子树，按当前层的哈希位分组"""
+    if len(leaves) == 1:
+        return leaves[0]
+    if shift >= _HASH_BITS:
+        return _Collision(leaves[0].key_hash, tuple(leaves))
+    groups: Dict[int, List[_Leaf]] = {}
+    for leaf in leaves:
+        groups.setdefault((leaf.key_hash >> shift) & _MASK, []).append(leaf)
+    bitmap = 0
+    slots = []
+    for position in sorted(groups):
+        bitmap |= 1 << position
+        slots.append(_build(groups[position], shift + _BITS))
+    return _Branch(bitmap, tuple(slots))
+
+
+class PersistentMap:
+    """不可变的哈希字典树（HAMT）：写入返回新版本，只复制从根到被修改键的路径，其余节点与旧版本共享"""
+
+    __slots__ = ("_root", "_count")
+
+    def __init__(self, root=None, count: int = 0):
+        self._root = root
+        self._count = count
+
+    @classmethod
+    def from_items(cls, items) -> "PersistentMap":
+        """批量构建，比逐个写入少复制中间节点，重复的键以最后一个为准"""
+        leaves = {}
+        for key, value in items:
+            leaves[key] = _Leaf(_hash(key), key, value)
+        if not leaves:
+            return cls()
+        return cls(_build(list(leaves.values()), 0), len(leaves))
+
+    def get(self, key, default=None):
+        key_hash = _hash(key)
+        node = self._root
+        shift = 0
+        while isinstance(node, _Branch):
+            bit = 1 << ((key_hash >> shift) & _MASK)
+            if not node.bitmap & bit:
+                return default
+            node = node.slots[_slot_index(node.bitmap, bit)]
+            shift += _BITS
+        if isinstance(node, _Leaf):
+            return node.value if node.key_hash == key_hash and node.key == key else default
+        if isinstance(node, _Collision) and node.key_hash == key_hash:
+            for leaf in node.leaves:
+                if leaf.key == key:
+                    return leaf.value
+        return default
+
+    def set(self, key, value) -> "PersistentMap":
+        root, added = _assoc(self._root, 0, _hash(key), key, value)
+        if root is self._root:
+            return self
+        return PersistentMap(root, self._count + 1 if added else self._count)
+
+    def remove(self, key) -> "PersistentMap":
+        root = _dissoc(self._root, 0, _hash(key), key)
+        if root is self._root:
+            return self
+        return PersistentMap(root, self._count - 1)
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        pending = [self._root] if self._root is not None else []
+        while pending:
+            node = pending.pop()
+            if isinstance(node, _Branch):
+                pending.extend(node.slots)
+            elif isinstance(node, _Leaf):
+                yield node.key, node.value
+            else:
+                for leaf in node.leaves:
+                    yield leaf.key, leaf.value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return self._count
+
+
+_MISSING = object()
+
+
+class TreeSnapshotNode(NamedTuple):
+    """快照中的一个节点：节点字段、有序子节点ID和子树统计，都不可修改"""
+    item: Mapping[str, Any]
+    children: Tuple[Any, ...]
+    stats: Mapping[str, Any]
+
+
+def freeze_node(item: Dict[str, Any], children, stats: Dict[str, Any]) -> TreeSnapshotNode:
+    return TreeSnapshotNode(MappingProxyType(dict(item)), tuple(children), MappingProxyType(dict(stats)))
+
+
+class TreeSnapshot:
+    """故事树的一个不可变版本，读取方取得当前快照后无需加锁即可读到一致的整棵树"""
+
+    __slots__ = ("nodes", "roots", "version")
+
+    def __init__(self, nodes: PersistentMap = PersistentMap(), roots: Tuple[Any, ...] = (), version: int = 0):
+        self.nodes = nodes
+        self.roots = roots
+        self.version = version
+
+    def get(self, node_id) -> Optional[TreeSnapshotNode]:
+        return self.nodes.get(node_id) if node_id is not None else None
+
+    def item(self, node_id) -> Optional[Mapping[str, Any]]:
+        record = self.get(node_id)
+        return record.item if record is not None else None
+
+    def child_ids(self, parent_id) -> Tuple[Any, ...]:
+        """按创建顺序返回子节点ID，parent_id为None时返回起始节点"""
+        if parent_id is None:
+            return self.roots
+        record = self.nodes.get(parent_id)
+        return record.children if record is not None else ()
+
+    def children(self, parent_id) -> List[TreeSnapshotNode]:
+        records = (self.nodes.get(child_id) for child_id in self.child_ids(parent_id))
+        return [record for record in records if record is not None]
+
+    def subtree_children(self, root_id) -> Dict[Any, List[Any]]:
+        """子树中每个节点的有序子节点ID，节点不存在时返回空字典"""
+        if self.get(root_id) is None:
+            return {}
+        result = {}
+        pending = [root_id]
+        while pending:
+            item_id = pending.pop()
+            if item_id in result:
+                continue
+            record = self.nodes.get(item_id)
+            result[item_id] = list(record.children) if record is not None else []
+            pending.extend(result[item_id])
+        return result
+
+    def path_items(self, node_id) -> List[Mapping[str, Any]]:
+        """从起始节点到该节点路径上的所有节点，按物化路径读取，缺少路径时沿父节点向上查找"""
+        item = self.item(node_id)
+        if item is None:
+            return []
+        if item.get("path"):
+            ids = [int(path_id) for path_id in item["path"].split("/")]
+        else:
+            ids = []
+            current = item
+            # 跳过环形数据
+            while current is not None and current["id"] not in ids:
+                ids.append(current["id"])
+                current = self.item(current.get("parent_id"))
+            ids.reverse()
+        items = (self.item(path_id) for path_id in ids)
+        return [path_item for path_item in items if path_item is not None]
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from enhanced_local_cache import enhanced_local_cache, MAX_ANCESTOR_DEPTH
+from markdown_renderer import render_content_html
+from models import counters
+
+logger = logging.getLogger(__name__)
+
+# NDJSON文件首行的格式标记和版本
+EXPORT_FORMAT = "story-tree-ndjson"
+EXPORT_VERSION = 1
+
+# 导出的节点字段；路径和行版本在导入时重新生成，content_html在导入时丢弃并由content重新渲染
+EXPORT_FIELDS = ("id", "parent_id", "title", "option_title", "content", "content_html",
+                 "content_html_version", "author_id", "created_at")
+
+# 导入时每批写入缓存的节点数
+TREE_IMPORT_BATCH_SIZE = int(os.getenv("TREE_IMPORT_BATCH_SIZE", "1000"))
+
+# 导入导出过程中每处理多少行记录一次进度
+PROGRESS_INTERVAL = 10000
+# 导入结果中最多列出的新起始节点ID数
+MAX_REPORTED_ROOTS = 100
+
+
+class RateCounter:
+    """统计处理行数和每秒行数"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def add(self, rows: int = 1):
+        self.rows += rows
+        if self.rows % PROGRESS_INTERVAL == 0:
+            logger.info(f"{self.label}: 已处理 {self.rows} 行，{self.rate():.0f} 行/秒")
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "rows_per_second": round(self.rate(), 1)
+        }
+
+
+def iter_subtree_items(root_id) -> Iterator[Dict[str, Any]]:
+    """按先序（父节点在前）逐个产出子树中的节点，全部读取自同一个快照
+
+    只保存当前路径上每层的子节点迭代器，内存与子树深度有关而与节点数无关。
+    """
+    snapshot = enhanced_local_cache.get_tree_snapshot()
+    root = snapshot.get(root_id)
+    if root is None:
+        return
+    yield root.item
+    pending = [iter(root.children)]
+    while pending:
+        child_id = next(pending[-1], None)
+        if child_id is None:
+            pending.pop()
+            continue
+        record = snapshot.get(child_id)
+        if record is None:
+            continue
+        if len(pending) >= MAX_ANCESTOR_DEPTH:
+            raise ValueError(f"节点 {child_id} 的深度超过 {MAX_ANCESTOR_DEPTH}，数据可能有环")
+        yield record.item
+        pending.append(iter(record.children))
+
+
+def export_lines(root_id) -> Iterator[str]:
+    """以NDJSON流式导出子树：首行为格式标记，之后每行一个节点，子树根节点的parent_id写为null"""
+    counter = RateCounter(f"导出故事树 {root_id}")
+    yield json.dumps({"format": EXPORT_FORMAT, "version": EXPORT_VERSION, "root_id": root_id,
+                      "exported_at": datetime.now().isoformat()}, ensure_ascii=False) + "\n"
+    for item in iter_subtree_items(root_id):
+        row = {field: item.get(field) for field in EXPORT_FIELDS}
+        if item["id"] == root_id:
+            row["parent_id"] = None
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+        counter.add()
+    logger.info(f"导出故事树 {root_id} 完成: {counter.summary()}")
+
+
+class TreeImporter:
+    """流式导入NDJSON节点：分配新ID并改写父节点引用，按批写入缓存
+
+    输入须为先序（导出的顺序），因此只需记住当前路径上的旧ID到新ID映射，内存与节点总数无关。
+    文件来自其他环境时作者可能不存在，这些节点改用fallback_author_id（通常是执行导入的管理员）。
+    """
+
+    def __init__(self, parent_id: Optional[int] = None, author_id: Optional[int] = None,
+                 batch_size: int = TREE_IMPORT_BATCH_SIZE, fallback_author_id: Optional[int] = None):
+        snapshot = enhanced_local_cache.get_tree_snapshot()
+        if parent_id is not None and snapshot.get(parent_id) is None:
+            raise ValueError(f"父节点 {parent_id} 不存在")
+        self.parent_id = parent_id
+        self.author_id = author_id
+        self.fallback_author_id = fallback_author_id
+        # 作者ID -> 是否存在，避免每行都查询用户表
+        self.known_authors: Dict[Any, bool] = {}
+        self.batch_size = batch_size
+        # 当前路径上的(旧ID, 新ID)，从子树根节点到最近导入的节点
+        self.path: List[Tuple[Any, int]] = []
+        self.batch: List[Dict[str, Any]] = []
+        self.root_ids: List[int] = []
+        self.line_number = 0
+        self.counter = RateCounter("导入故事树")
+        # 新ID从现有最大ID之后开始，与创建节点的接口共用计数器
+        largest = max((item_id for item_id, _ in snapshot.nodes.items()), default=0)
+        counters["story_tree_node"] = max(counters.get("story_tree_node", 1), largest + 1)
+
+    def feed(self, line) -> None:
+        """处理一行，空行忽略，格式错误时抛出ValueError"""
+        self.line_number += 1
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            return
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise ValueError(f"第 {self.line_number} 行不是有效的JSON")
+        if not isinstance(row, dict):
+            raise ValueError(f"第 {self.line_number} 行不是JSON对象")
+        if "format" in row:
+            if row.get("format") != EXPORT_FORMAT or row.get("version") != EXPORT_VERSION:
+                raise ValueError(f"不支持的导出格式: {row.get('format')} {row.get('version')}")
+            return
+        self.batch.append(self._remap(row))
+        self.counter.add()
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def _remap(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        for field in ("id", "title", "option_title", "content"):
+            if row.get(field) is None:
+                raise ValueError(f"第 {self.line_number} 行缺少 {field}")
+        old_parent_id = row.get("parent_id")
+        top_level = old_parent_id is None
+        if top_level:
+            self.path = []
+            parent_id = self.parent_id
+        else:
+            # 先序中父节点一定在当前路径上
+            while self.path and self.path[-1][0] != old_parent_id:
+                self.path.pop()
+            if not self.path:
+                raise ValueError(f"第 {self.line_number} 行的父节点 {old_parent_id} 不在当前路径上，文件须按先序排列")
+            parent_id = self.path[-1][1]
+
+        node_id = counters["story_tree_node"]
+        counters["story_tree_node"] += 1
+        self.path.append((row["id"], node_id))
+        if top_level and len(self.root_ids) < MAX_REPORTED_ROOTS:
+            self.root_ids.append(node_id)
+
+        node = {
+            "id": node_id,
+            "parent_id": parent_id,
+            "title": row["title"],
+            "option_title": row["option_title"],
+            "content": row["content"],
+            "author_id": self._author_id(row.get("author_id")),
+            "created_at": row.get("created_at") or datetime.now().isoformat()
+        }
+        # 模板直接输出预渲染的HTML，不信任文件中的content_html，由content重新渲染
+        return render_content_html(node)
+
+    def _author_id(self, exported_author_id):
+        """作者ID须存在于用户表中（外键），不存在时改用回退作者"""
+        author_id = self.author_id if self.author_id is not None else exported_author_id
+        if author_id is not None and self._author_exists(author_id):
+            return author_id
+        if self.fallback_author_id is not None and self._author_exists(self.fallback_author_id):
+            return self.fallback_author_id
+        raise ValueError(f"第 {self.line_number} 行的作者 {author_id} 不存在，且没有可用的回退作者")
+
+    def _author_exists(self, author_id) -> bool:
+        if author_id not in self.known_authors:
+            self.known_authors[author_id] = enhanced_local_cache.get_item("users", author_id) is not None
+        return self.known_authors[author_id]
+
+    def flush(self) -> None:
+        if self.batch:
+            enhanced_local_cache.add_tree_nodes(self.batch)
+            self.batch = []
+
+    def finish(self) -> Dict[str, Any]:
+        """写入最后一批并返回导入统计"""
+        self.flush()
+        result = dict(self.counter.summary(), root_ids=self.root_ids)
+        logger.info(f"导入故事树完成: {result['rows']} 行，{result['rows_per_second']} 行/秒")
+        return result
+
+
+def import_lines(lines: Iterable, parent_id: Optional[int] = None, author_id: Optional[int] = None,
+                 batch_size: int = TREE_IMPORT_BATCH_SIZE, fallback_author_id: Optional[int] = None) -> Dict[str, Any]:
+    """从逐行可迭代的NDJSON导入，返回导入统计"""
+    importer = TreeImporter(parent_id, author_id, batch_size, fallback_author_id)
+    for line in lines:
+        importer.feed(line)
+    return importer.finish()